@@ -0,0 +1,57 @@
+# bench_utils.py
+# helpers shared by the benchmark scripts
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def lab_path(lab, *parts):                                  # path inside a lab folder, e.g. lab_path('lab-03', 'server.py')
+    return os.path.join(ROOT, lab, *parts)
+
+def load_lab_module(lab, name):                             # import lab-XX/<name>.py without running main()
+    lab_dir = lab_path(lab)
+    if lab_dir not in sys.path:
+        sys.path.insert(0, lab_dir)
+    spec = importlib.util.spec_from_file_location(f"{lab.replace('-', '_')}_{name}", lab_path(lab, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def start_lab_server(lab, *args, name="server"):            # run a lab server as a subprocess in its own folder
+    return subprocess.Popen(
+        [sys.executable, f"{name}.py", *args],
+        cwd=lab_path(lab),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+def wait_for_port(addr, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(addr, timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+def rss_kb(pid=None):                                       # resident memory of a process in KB (linux)
+    pid = pid or os.getpid()
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+def raise_fd_limit():
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
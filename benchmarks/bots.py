@@ -0,0 +1,297 @@
+# bots.py
+# headless load generator for the lab-07 and lab-08 game servers: hundreds of scripted players on asyncio,
+# server tick times, states per second and input -> state round trip percentiles per bot
+# usage: python bots.py lab-07|lab-08 [--bots=200] [--rate=20] [--seconds=10] [--ramp=2] [--processes=1]
+#        [--spawn] [--server-flags="--map=2400x1600 --view=600x400"] [--pay=100] [--per-bot] [--json=bots.json]
+#
+# every bot is one connection on an event loop, nothing imports pygame or tk
+# and nothing opens a window. a lab-08 bot registers a MAC of its own, pays,
+# logs in and asks with QUEUE until a state arrives, as lab-08/client.py
+# does; a lab-07 bot plays as soon as it is connected. then it holds a random
+# arrow key for HOLD seconds at a time and sends --rate inputs a second,
+# numbered and acking the last snapshot like the real clients. the round
+# trip of an input is the time from sending it to the first snapshot whose
+# OWNER says the server applied it. with --spawn the server is started here
+# and its [Tick] lines (lab-07) give the server's own tick times, against a
+# server started elsewhere the gaps between states stand in for them.
+# --processes splits the bots over that many processes with an event loop
+# each, for when one core cannot drive them all. both labs frame every
+# message, a state that does not decode is counted as bad. a bot that acks
+# too late (its inputs are starved) gets deltas on snapshots it already
+# dropped, counted as missed.
+import asyncio
+import concurrent.futures
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import lab_path, load_lab_module, raise_fd_limit, wait_for_port
+from common import gamewire
+from common.framing import HEADER, MAX_FRAME, encode_frame
+from common.snapshot import SnapshotBuffer
+
+ARGS = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+LAB = ARGS[0] if ARGS else "lab-07"
+BOTS = int(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--bots=")), 200))
+RATE = float(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--rate=")), 20))   # inputs per second per bot
+SECONDS = float(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--seconds=")), 10))
+RAMP = float(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--ramp=")), 2))     # seconds over which the bots connect
+PROCESSES = int(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--processes=")), 1))
+PAY = int(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--pay=")), 100))       # lab-08 gives 0.6 seconds of play per unit, 60 seconds for 100
+SERVER_FLAGS = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--server-flags=")), "").split()
+JSON_PATH = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--json=")), None)
+SPAWN = "--spawn" in sys.argv
+PER_BOT = "--per-bot" in sys.argv
+
+HOLD = 0.5                                                  # seconds a key is held
+QUEUE_EVERY = 0.5                                           # lab-08 asks again while it waits, as the client does
+TIMEOUT = 10                                                # for a reply to REGISTER/PAY/LOGIN
+MOVES = [{**dict.fromkeys(gamewire.KEYS, False), key: True} for key in gamewire.KEYS]
+TICK_LINE = re.compile(r"\[Tick\] (\d+) Hz, (\d+) players: (\d+) ticks, avg ([\d.]+) ms, p99 ([\d.]+) ms, max ([\d.]+) ms, (\d+) late")
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else float("nan")
+
+def ms(samples, p):
+    return percentile(samples, p) * 1000
+
+class Bot:
+    '''One scripted player on an asyncio connection, with its numbers'''
+
+    def __init__(self, number, run):
+        self.number = number
+        self.mac = "02:%02x:%02x:%02x:%02x:%02x" % (run >> 8 & 255, run & 255, number >> 16 & 255, number >> 8 & 255, number & 255)
+        self.reader = self.writer = None
+        self.snapshots = SnapshotBuffer()
+        self.sent = deque()                                 # (seq, time sent) of the inputs not in a snapshot yet
+        self.rtts = []
+        self.gaps = []                                      # seconds between two states
+        self.lag = []                                       # seconds an input went out after it was due, the bots' own load
+        self.started = self.first_state = self.last_state = self.stopped = None
+        self.states = self.inputs = self.received = self.bad = self.missed = 0
+        self.queued = False
+        self.status = None                                  # why it stopped early, None while all is well
+
+    def send(self, data):
+        self.writer.write(encode_frame(data))
+
+    async def receive(self):                                # one message, b'' once the server closed
+        try:
+            (length,) = HEADER.unpack(await self.reader.readexactly(HEADER.size))
+            if length > MAX_FRAME:
+                raise ValueError(f"frame of {length} bytes is too large")
+            return await self.reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            return b""
+
+    async def log_in(self):                                 # lab-08: REGISTER, PAY and LOGIN, anything but OK ends the bot
+        for request in (f"REGISTER/{self.mac}", f"PAY/{self.mac}/{PAY}", f"LOGIN/{self.mac}"):
+            self.send(gamewire.encode_text(request))
+            kind, reply = gamewire.decode(await asyncio.wait_for(self.receive(), TIMEOUT))
+            if kind != gamewire.TEXT or reply != "OK":
+                raise ConnectionError(f"{request.split('/')[0]} answered {reply!r}")
+
+    async def read_states(self):
+        while True:
+            data = await self.receive()
+            if not data:
+                self.status = self.status or "closed by the server"
+                return
+            now = time.perf_counter()
+            self.received += len(data)
+            try:
+                kind, message = gamewire.decode(data)
+            except ValueError:
+                self.bad += 1
+                continue
+            if kind == gamewire.TEXT:
+                if message == "QUEUE":
+                    self.queued = True
+                elif message == "TIMEOUT":                  # lab-08, the time paid for is up
+                    self.status = "timed out"
+                continue
+            if kind != gamewire.SNAPSHOT:                   # a winner
+                continue
+            if self.snapshots.apply(message) is None:       # a delta against a snapshot it no longer has, acked too late
+                self.missed += 1
+                continue
+            self.states += 1
+            if self.last_state is not None:
+                self.gaps.append(now - self.last_state)
+            self.first_state = self.first_state or now
+            self.last_state = now
+            applied = message[4]
+            while self.sent and self.sent[0][0] <= applied: # the older ones were overtaken by the applied one
+                seq, sent_at = self.sent.popleft()
+                if seq == applied:
+                    self.rtts.append(now - sent_at)
+
+    async def send_inputs(self, stop, receiver):
+        moves = random.Random(self.number)
+        keys, change, seq, due = MOVES[0], 0, 0, None
+        while not receiver.done() and time.perf_counter() < stop:
+            now = time.perf_counter()
+            if LAB == "lab-08" and self.first_state is None:
+                self.send(gamewire.encode_text("QUEUE"))   # a player gets a state back, a queued client the QUEUE text
+                await self.writer.drain()
+                await asyncio.sleep(QUEUE_EVERY)
+                continue
+            if now >= change:
+                keys, change = moves.choice(MOVES), now + HOLD
+            if due is not None:
+                self.lag.append(max(0, now - due))
+            seq += 1
+            self.sent.append((seq, now))
+            self.send(gamewire.encode_input(keys, self.snapshots.latest, seq))
+            await self.writer.drain()
+            self.inputs += 1
+            due = now + 1 / RATE
+            await asyncio.sleep(max(0, due - time.perf_counter()))
+
+    async def run(self, addr, start, stop):
+        await asyncio.sleep(max(0, start - time.perf_counter()))
+        self.started = time.perf_counter()
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(*addr), TIMEOUT)
+            if LAB == "lab-08":
+                await self.log_in()
+            receiver = asyncio.create_task(self.read_states())
+            await self.send_inputs(stop, receiver)
+            receiver.cancel()
+            if LAB == "lab-08":
+                self.send(gamewire.encode_text("QUIT"))
+        except (OSError, ValueError, asyncio.TimeoutError) as e:
+            self.status = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        finally:
+            self.stopped = time.perf_counter()
+            if self.writer is not None:
+                self.writer.close()
+        return self.result()
+
+    def result(self):
+        playing = self.stopped - self.first_state if self.first_state else 0
+        if self.status is None:
+            self.status = "playing" if self.states else "queued" if self.queued else "no state"
+        return {
+            "bot": self.number,
+            "status": self.status,
+            "wait_ms": (self.first_state - self.started) * 1000 if self.first_state else None,
+            "states_per_sec": self.states / playing if playing else 0.0,
+            "kb_per_sec": self.received / 1024 / playing if playing else 0.0,
+            "inputs": self.inputs,
+            "bad": self.bad,
+            "missed": self.missed,
+            "lag_p99_ms": ms(self.lag, 0.99),
+            "rtt_p50_ms": ms(self.rtts, 0.5),
+            "rtt_p90_ms": ms(self.rtts, 0.9),
+            "rtt_p99_ms": ms(self.rtts, 0.99),
+            "gap_p99_ms": ms(self.gaps, 0.99),
+            "rtts": self.rtts,
+        }
+
+async def bots(numbers, addr, run, start_at, stop_at):
+    offset = time.perf_counter() - time.time()              # the schedule is in wall clock time, the same in every process
+    start = start_at + offset
+    tasks = [Bot(number, run).run(addr, start + RAMP * number / BOTS, stop_at + offset) for number in numbers]
+    return await asyncio.gather(*tasks)
+
+def swarm(numbers, addr, run, start_at, stop_at):           # one process: these bots on one event loop, their results
+    raise_fd_limit()
+    return asyncio.run(bots(numbers, addr, run, start_at, stop_at))
+
+def spawn_server(ticks):                                    # the lab server, its [Tick] lines read into ticks
+    server = subprocess.Popen([sys.executable, "-u", "server.py", *SERVER_FLAGS], cwd=lab_path(LAB),
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+    def read():
+        for line in server.stdout:
+            match = TICK_LINE.search(line)
+            if match:
+                ticks.append((time.time(), int(match[2]), float(match[4]), float(match[5]), float(match[6]), int(match[7])))
+
+    threading.Thread(target=read, daemon=True).start()
+    return server
+
+def report(results, ticks, steady):
+    by_status = {}
+    for result in results:
+        by_status[result["status"]] = by_status.get(result["status"], 0) + 1
+    print("> " + ", ".join(f"{count} {status}" for status, count in sorted(by_status.items(), key=lambda item: -item[1])))
+    playing = [result for result in results if result["states_per_sec"]]
+    if not playing:
+        return
+    rtts = [rtt for result in playing for rtt in result["rtts"]]
+    rates = [result["states_per_sec"] for result in playing]
+    p99s = [result["rtt_p99_ms"] for result in playing if result["rtts"]]
+    waits = [result["wait_ms"] for result in playing]
+    print(f"{'':>28} {'p50':>8} {'p90':>8} {'p99':>8} {'worst':>8}")
+    print(f"{'rtt ms, all inputs':>28} {ms(rtts, 0.5):>8.1f} {ms(rtts, 0.9):>8.1f} {ms(rtts, 0.99):>8.1f} {max(rtts, default=0) * 1000:>8.1f}")
+    print(f"{'rtt p99 ms, per bot':>28} {percentile(p99s, 0.5):>8.1f} {percentile(p99s, 0.9):>8.1f} {percentile(p99s, 0.99):>8.1f} {max(p99s, default=0):>8.1f}")
+    print(f"{'states/s per bot, at least':>28} {percentile(rates, 0.5):>8.1f} {percentile(rates, 0.1):>8.1f} {percentile(rates, 0.01):>8.1f} {min(rates):>8.1f}")
+    print(f"{'gap p99 ms, per bot':>28} " + " ".join(f"{percentile([r['gap_p99_ms'] for r in playing], p):>8.1f}" for p in (0.5, 0.9, 0.99))
+          + f" {max(result['gap_p99_ms'] for result in playing):>8.1f}")
+    print(f"{'first state ms':>28} {percentile(waits, 0.5):>8.1f} {percentile(waits, 0.9):>8.1f} {percentile(waits, 0.99):>8.1f} {max(waits):>8.1f}")
+    print(f"> {sum(result['inputs'] for result in results)} inputs sent, {sum(result['bad'] for result in results)} bad messages, "
+          f"{sum(result['missed'] for result in results)} deltas on a base already dropped, "
+          f"{sum(result['kb_per_sec'] for result in playing) / len(playing):.1f} KB/s received per bot")
+    lag = max((result["lag_p99_ms"] for result in results if result["inputs"] > 1), default=0)
+    if lag > 1000 / RATE:                                   # the numbers above are the bots' as much as the server's
+        print(f"> the bots could not keep up: inputs went out up to {lag:.0f} ms late (p99), use --processes or fewer --bots")
+    steady_ticks = [tick for tick in ticks if tick[0] >= steady]
+    if steady_ticks:                                        # (time, players, avg, p99, max, late) per report of the server
+        print(f"> server ticks with {max(tick[1] for tick in steady_ticks)} players: avg {max(tick[2] for tick in steady_ticks):.2f} ms, "
+              f"p99 {max(tick[3] for tick in steady_ticks):.2f} ms, max {max(tick[4] for tick in steady_ticks):.2f} ms, "
+              f"{sum(tick[5] for tick in steady_ticks)} late (worst of {len(steady_ticks)} reports)")
+    elif SPAWN and LAB == "lab-07":
+        print("> no [Tick] report from the server during the run, try more --seconds")
+
+def main():
+    if LAB not in ("lab-07", "lab-08"):
+        sys.exit("usage: python bots.py lab-07|lab-08 [--bots=N] [--rate=N] [--seconds=N] ...")
+    raise_fd_limit()
+    addr = load_lab_module(LAB, "server").ADDR
+    addr = (addr[0] or "127.0.0.1", addr[1])
+    ticks = []
+    server = spawn_server(ticks) if SPAWN else None
+    try:
+        if not wait_for_port(addr):
+            sys.exit(f"{LAB} server is not listening on {addr[0]}:{addr[1]}")
+        run = random.getrandbits(16)                        # lab-08 remembers MACs, every run registers new ones
+        start_at = time.time() + 0.5
+        stop_at = start_at + RAMP + SECONDS
+        print(f"> {LAB} on {addr[0]}:{addr[1]}: {BOTS} bots over {RAMP:g}s, {RATE:g} inputs/s each for {SECONDS:g}s, "
+              f"{PROCESSES} process{'es' if PROCESSES > 1 else ''}")
+        numbers = list(range(BOTS))
+        if PROCESSES > 1:
+            with concurrent.futures.ProcessPoolExecutor(PROCESSES) as pool:
+                parts = [pool.submit(swarm, numbers[i::PROCESSES], addr, run, start_at, stop_at) for i in range(PROCESSES)]
+                results = [result for part in parts for result in part.result()]
+        else:
+            results = swarm(numbers, addr, run, start_at, stop_at)
+    finally:
+        if server is not None:
+            server.kill()
+            server.wait()
+    results.sort(key=lambda result: result["bot"])
+    report(results, ticks, start_at + RAMP)
+    if PER_BOT:
+        print(f"{'bot':>5} {'status':>12} {'states/s':>9} {'rtt p50':>8} {'p90':>7} {'p99':>7} {'gap p99':>8} {'inputs':>7} {'bad':>4} {'missed':>7}")
+        for result in results:
+            print(f"{result['bot']:>5} {result['status'][:12]:>12} {result['states_per_sec']:>9.1f} {result['rtt_p50_ms']:>8.1f} "
+                  f"{result['rtt_p90_ms']:>7.1f} {result['rtt_p99_ms']:>7.1f} {result['gap_p99_ms']:>8.1f} {result['inputs']:>7} {result['bad']:>4} {result['missed']:>7}")
+    if JSON_PATH:
+        with open(JSON_PATH, "w") as f:
+            json.dump({"lab": LAB, "bots": BOTS, "rate": RATE, "seconds": SECONDS, "ticks": ticks,
+                       "results": [{key: value for key, value in result.items() if key != "rtts"} for result in results]}, f, indent=2)
+        print(f"> per bot results written to {JSON_PATH}")
+
+if __name__ == "__main__":
+    main()
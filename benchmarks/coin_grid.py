@@ -0,0 +1,60 @@
+# coin_grid.py
+# lab-07 coin collision cost per tick as the coin count grows, scanning every coin vs the CoinGrid cells
+# usage: python coin_grid.py [coin counts] [players]
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.coingrid import CoinGrid
+from common.entities import keys_of
+
+COUNTS = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [10, 100, 1000, 10000]
+PLAYERS = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+TICKS = 300
+PLAYER_SIZE, COIN_SIZE = 30, 15
+STEP = 3
+MOVES = [{"left": True}, {"right": True}, {"up": True}, {"down": True}]
+
+def scan_coins(coins, grid, x, y):                          # collect_coins as it was, every coin tested
+    return [i for i, (coin_x, coin_y) in enumerate(coins)
+            if x < coin_x + COIN_SIZE and x + PLAYER_SIZE > coin_x and y < coin_y + COIN_SIZE and y + PLAYER_SIZE > coin_y]
+
+def grid_coins(coins, grid, x, y):
+    return grid.touching(x, y, PLAYER_SIZE)
+
+def per_tick(coin_count, touching):                         # ms per tick to move every player and collect its coins, on a map with the default density
+    scale = math.sqrt(coin_count / 10)
+    width, height = int(600 * scale), int(400 * scale)
+    moves = random.Random(1)
+    coins = [(moves.randint(0, width - COIN_SIZE), moves.randint(0, height - COIN_SIZE)) for _ in range(coin_count)]
+    grid = CoinGrid(coins, COIN_SIZE)
+    players = [(moves.randint(0, width - PLAYER_SIZE), moves.randint(0, height - PLAYER_SIZE)) for _ in range(PLAYERS)]
+    keys = [keys_of({"left": False, "right": False, "up": False, "down": False, **moves.choice(MOVES)}) for _ in range(PLAYERS)]
+    collected = 0
+    start = time.perf_counter()
+    for tick in range(TICKS):
+        for i, (x, y) in enumerate(players):
+            if tick % 15 == 0:
+                keys[i] = keys_of({"left": False, "right": False, "up": False, "down": False, **moves.choice(MOVES)})
+            x = max(0, min(x + keys[i][0] * STEP, width - PLAYER_SIZE))
+            y = max(0, min(y + keys[i][1] * STEP, height - PLAYER_SIZE))
+            players[i] = (x, y)
+            for coin in touching(coins, grid, x, y):
+                grid.move(coin, moves.randint(0, width - COIN_SIZE), moves.randint(0, height - COIN_SIZE))
+                collected += 1
+    return (time.perf_counter() - start) / TICKS * 1000, collected, f"{width}x{height}"
+
+def main():
+    print(f"> {PLAYERS} players, {TICKS} ticks, map grows with the coins (10 coins per 600x400)")
+    print(f"{'coins':>7} {'map':>11} {'scan ms/tick':>13} {'grid ms/tick':>13} {'speedup':>8} {'collected':>10}")
+    for coins in COUNTS:
+        scan_ms, scanned, _ = per_tick(coins, scan_coins)
+        grid_ms, collected, size = per_tick(coins, grid_coins)
+        print(f"{coins:>7} {size:>11} {scan_ms:>13.3f} {grid_ms:>13.3f} {scan_ms / grid_ms:>7.1f}x {collected:>10}"
+              + ("" if scanned == collected else f"  (scan collected {scanned})"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# compression_codecs.py
+# wire bytes and wall time per codec (common/compress.py) for a mixed set of files sent over loopback
+# usage: python compression_codecs.py [MB per file]
+import glob
+import gzip
+import json
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import ROOT
+from common import compress, filestream
+from common.framing import FramedSocket
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+
+def make_corpus(directory):                                 # name -> path, roughly SIZE_MB each
+    size = SIZE_MB * 1024 * 1024
+    rng = random.Random(7)
+    source = b"".join(open(path, "rb").read() for path in sorted(glob.glob(os.path.join(ROOT, "lab-0*", "*.py"))))
+    files = {
+        "source.txt": (source * (size // len(source) + 1))[:size],
+        "data.csv": "".join(f"{i},{rng.random():.6f},{rng.randint(0, 9999)},{rng.choice('abcdef')}\n"
+                            for i in range(size // 28)).encode()[:size],
+        "log.json": "".join(json.dumps({"t": 1700000000 + i, "user": f"10.0.0.{i % 250}:{5000 + i % 97}",
+                                        "msg": rng.choice(["hi", "join #lab", "ack", "file sent"])}) + "\n"
+                            for i in range(size // 70)).encode()[:size],
+        "photo.jpg": os.urandom(size),                      # stands in for already compressed media
+        "random.bin": os.urandom(size),
+    }
+    files["archive.gz"] = gzip.compress(files["source.txt"])
+    paths = {}
+    for name, data in files.items():
+        paths[name] = os.path.join(directory, name)
+        with open(paths[name], "wb") as file:
+            file.write(data)
+    return paths
+
+def send(path, codec, out):                                 # returns (wire bytes, codec actually used)
+    a, b = socket.socketpair()
+    sender, receiver = FramedSocket(a), FramedSocket(b)
+    used = compress.choose(path, [codec]) if codec else None
+    result = {}
+
+    def receive():
+        if used:
+            result["size"], _ = compress.recv_stream(receiver, out, used)
+        else:
+            result["size"] = filestream.recv_file(receiver, out)
+
+    thread = threading.Thread(target=receive)
+    thread.start()
+    wire = compress.send_stream(sender, path, used) if used else filestream.send_file(sender, path)
+    thread.join()
+    a.close()
+    b.close()
+    return wire, used
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        corpus = make_corpus(directory)
+        raw_total = sum(os.path.getsize(path) for path in corpus.values())
+        print(f"> corpus: {', '.join(corpus)} ({raw_total >> 20} MB)")
+        for codec in [None] + compress.PREFERENCE:
+            start = time.perf_counter()
+            wire_total = 0
+            skipped = []
+            for name, path in corpus.items():
+                wire, used = send(path, codec, os.path.join(directory, "out.bin"))
+                wire_total += wire
+                if codec and not used:
+                    skipped.append(name)
+            elapsed = time.perf_counter() - start
+            print(f"> {codec or 'none':5s}: {wire_total / 1e6:8.1f} MB on the wire ({wire_total / raw_total:6.1%}) "
+                  f"in {elapsed:6.2f}s   sent as is: {', '.join(skipped) or '-'}")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
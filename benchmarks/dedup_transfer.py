@@ -0,0 +1,91 @@
+# dedup_transfer.py
+# bytes on the wire when a file is sent again after a 1% edit, with content-defined chunking (common/dedup.py)
+# usage: python dedup_transfer.py [size in MB]
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import dedup
+from common.framing import FramedSocket
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+
+def connected_pair():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    a = socket.create_connection(listener.getsockname())
+    b, _ = listener.accept()
+    listener.close()
+    return FramedSocket(a), FramedSocket(b)
+
+def transfer(src, dst, store):                              # the lab-05 m/n exchange, returns (wire bytes, seconds)
+    sender, receiver = connected_pair()
+    start = time.perf_counter()
+    chunks = dedup.chunk_file(src)
+    offer = dedup.encode_manifest(chunks).encode()
+    sender.send(offer)
+
+    def receive():
+        digests = dedup.decode_manifest(receiver.recv().decode())
+        wanted = store.missing(digests)
+        receiver.send(",".join(map(str, wanted)).encode())
+        dedup.recv_chunks(receiver, store, [digests[i] for i in wanted])
+        store.assemble(digests, dst)
+
+    thread = threading.Thread(target=receive)
+    thread.start()
+    reply = sender.recv()
+    wanted = [int(i) for i in reply.decode().split(",") if i]
+    sent = dedup.send_chunks(sender, src, [chunks[i] for i in wanted])
+    thread.join()
+    elapsed = time.perf_counter() - start
+    sender.close()
+    receiver.close()
+    return len(offer) + len(reply) + sent + 4 * (len(wanted) + 2), elapsed
+
+def edited(data, kind, rng):                                # 1% of the file changed in different ways
+    size = len(data) // 100
+    at = rng.randrange(len(data) - size)
+    if kind == "replace 1% in one place":
+        return data[:at] + os.urandom(size) + data[at + size:]
+    if kind == "insert 1% in one place":
+        return data[:at] + os.urandom(size) + data[at:]
+    if kind == "delete 1% in one place":
+        return data[:at] + data[at + size:]
+    for _ in range(10):                                     # ten edits of 0.1% each
+        at = rng.randrange(len(data) - size // 10)
+        data = data[:at] + os.urandom(size // 10) + data[at + size // 10:]
+    return data
+
+def main():
+    rng = random.Random(1)
+    directory = tempfile.mkdtemp()
+    src, dst = os.path.join(directory, "src.bin"), os.path.join(directory, "dst.bin")
+    original = os.urandom(SIZE_MB * 1024 * 1024)
+    try:
+        for kind in ("replace 1% in one place", "insert 1% in one place", "delete 1% in one place", "10 edits of 0.1%"):
+            store = dedup.ChunkStore(os.path.join(directory, "chunks"))
+            with open(src, "wb") as file:
+                file.write(original)
+            wire, first = transfer(src, dst, store)
+            data = edited(original, kind, rng)
+            with open(src, "wb") as file:
+                file.write(data)
+            again, elapsed = transfer(src, dst, store)
+            with open(dst, "rb") as file:
+                same = file.read() == data
+            print(f"> {kind:24s}: first send {wire / len(original):6.1%} in {first:5.2f}s, "
+                  f"again {again / len(data):6.2%} of the file in {elapsed:5.2f}s  (file ok: {same})")
+            shutil.rmtree(os.path.join(directory, "chunks"))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# entity_tick.py
+# lab-07 simulation ms per tick with hundreds of players: per-player dicts vs the array and numpy entity stores
+# usage: python entity_tick.py [player counts] [coin counts]
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import entities
+from common.coingrid import CoinGrid
+from common.gamewire import encode_snapshot
+from common.snapshot import SnapshotHistory
+
+PLAYERS = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [100, 250, 500, 1000]
+COINS = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1000, 5000]
+WIDTH, HEIGHT = 4000, 3000
+PLAYER_SIZE, COIN_SIZE = 30, 15
+STEP = 3                                                    # 90 px/s at 30 ticks per second
+TICKS = 60
+BUDGET_MS = 16
+MOVES = [{}, {"left": True}, {"right": True}, {"up": True}, {"down": True}, {"right": True, "down": True}]
+
+class DictWorld:
+    '''The game state as lab-07 kept it before the entity store, one player at a time'''
+
+    def __init__(self, coin_count):
+        self.state = {'players': {}, 'player_scores': {}, 'color': {},
+                      'coins': [(random.randint(0, WIDTH - COIN_SIZE), random.randint(0, HEIGHT - COIN_SIZE)) for _ in range(coin_count)]}
+        self.grid = CoinGrid(self.state['coins'], COIN_SIZE)
+        self.held = {}
+
+    def add_player(self, player_id, x, y, color):
+        self.state['players'][player_id] = (x, y)
+        self.state['player_scores'][player_id] = 0
+        self.state['color'][player_id] = color
+
+    def set_keys(self, player_id, input_data):
+        self.held[player_id] = input_data
+
+    def tick(self):
+        for player_id, input_data in self.held.items():
+            x, y = self.state['players'][player_id]
+            dx, dy = entities.keys_of(input_data)
+            x = max(0, min(x + dx * STEP, WIDTH - PLAYER_SIZE))
+            y = max(0, min(y + dy * STEP, HEIGHT - PLAYER_SIZE))
+            self.state['players'][player_id] = (x, y)
+            touched = self.grid.touching(x, y, PLAYER_SIZE)
+            self.state['player_scores'][player_id] += len(touched)
+            for coin in touched:
+                self.grid.move(coin, random.randint(0, WIDTH - COIN_SIZE), random.randint(0, HEIGHT - COIN_SIZE))
+
+    def game_state(self):
+        return self.state
+
+class StoreWorld:
+    '''lab-07 with an entity store: keys set per input, then one step() and collect() per tick'''
+
+    def __init__(self, store, coin_count):
+        self.store = store(WIDTH, HEIGHT, PLAYER_SIZE, COIN_SIZE, coin_count)
+        self.add_player = self.store.add_player
+        self.set_keys = self.store.set_keys
+
+    def tick(self):
+        self.store.step(STEP)
+        self.store.collect()
+
+    def game_state(self):
+        return self.store.game_state()
+
+def run(world, players):                                    # (simulation ms, whole tick ms) per tick, median of TICKS
+    moves = random.Random(players)
+    for player_id in range(players):
+        world.add_player(player_id, moves.randint(0, WIDTH - PLAYER_SIZE), moves.randint(0, HEIGHT - PLAYER_SIZE), (200, 100, 50))
+    history = SnapshotHistory(encode_snapshot, seconds=0)  # ticks back to back, keep what a 30 Hz server keeps
+    simulation, whole = [], []
+    for tick in range(TICKS):
+        for player_id in moves.sample(range(players), players // 10):   # a tenth of the players change keys every tick
+            world.set_keys(player_id, {"left": False, "right": False, "up": False, "down": False, **moves.choice(MOVES)})
+        start = time.perf_counter()
+        world.tick()
+        simulated = time.perf_counter()
+        history.record(world.game_state())                  # what the server does next: snapshot, then a delta per base
+        history.message(history.seq - 1)
+        simulation.append(simulated - start)
+        whole.append(time.perf_counter() - start)
+    return sorted(simulation)[TICKS // 2] * 1000, sorted(whole)[TICKS // 2] * 1000
+
+def main():
+    worlds = [("dicts", lambda coins: DictWorld(coins)), ("array", lambda coins: StoreWorld(entities.EntityStore, coins))]
+    if entities.np is not None:
+        worlds.append(("numpy", lambda coins: StoreWorld(entities.NumpyEntityStore, coins)))
+    else:
+        print("> numpy is not installed, only the array('f') store is measured")
+    print(f"> {WIDTH}x{HEIGHT} map, median of {TICKS} ticks, tick = move + collect + snapshot + one delta, budget {BUDGET_MS} ms")
+    print(f"{'players':>8} {'coins':>6} " + " ".join(f"{name + ' sim':>10} {name + ' tick':>11}" for name, _ in worlds))
+    for coins in COINS:
+        for players in PLAYERS:
+            cells = []
+            for name, make in worlds:
+                random.seed(coins)
+                simulation, whole = run(make(coins), players)
+                cells.append(f"{simulation:>10.2f} {whole:>10.2f}" + ("*" if whole > BUDGET_MS else " "))
+            print(f"{players:>8} {coins:>6} " + " ".join(cells))
+    print("> * over the tick budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# filestream_throughput.py
+# loopback file transfer: whole file read + send (lab-05 today) vs sendfile streaming
+# usage: python filestream_throughput.py [size in MB]
+import os
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import rss_kb
+from common import filestream
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+
+def connected_pair():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    sender = socket.create_connection(listener.getsockname())
+    receiver, _ = listener.accept()
+    listener.close()
+    return sender, receiver
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def whole_file(src, dst):                                   # read everything, send, receiver keeps it all in memory
+    sender, receiver = connected_pair()
+
+    def receive():
+        parts = []
+        while True:
+            data = receiver.recv(1024 * 1024)
+            if not data:
+                break
+            parts.append(data)
+        with open(dst, "wb") as file:
+            file.write(b"".join(parts))
+
+    reader = threading.Thread(target=receive)
+    reader.start()
+    with open(src, "rb") as file:
+        sender.sendall(file.read())
+    sender.close()
+    reader.join()
+    receiver.close()
+
+def streamed(src, dst):
+    sender, receiver = connected_pair()
+    reader = threading.Thread(target=filestream.recv_file, args=(receiver, dst))
+    reader.start()
+    filestream.send_file(sender, src)
+    reader.join()
+    sender.close()
+    receiver.close()
+
+def run(name, transfer, src, dst):
+    before = rss_kb()
+    start = time.perf_counter()
+    transfer(src, dst)
+    elapsed = time.perf_counter() - start
+    assert os.path.getsize(dst) == os.path.getsize(src)
+    print(f"{name:<22} {SIZE_MB / elapsed:>9.0f} MB/s   peak RSS {peak_rss_kb() / 1024:>7.0f} MB (started at {before / 1024:.0f} MB)")
+    os.remove(dst)
+
+def main():
+    directory = tempfile.mkdtemp()
+    src = os.path.join(directory, "input.bin")
+    dst = os.path.join(directory, "output.bin")
+    block = os.urandom(1024 * 1024)
+    with open(src, "wb") as file:
+        for _ in range(SIZE_MB):
+            file.write(block)
+    print(f"> {SIZE_MB} MB file over 127.0.0.1")
+    # streamed first, peak RSS only goes up
+    run("sendfile + recv_into", streamed, src, dst)
+    run("read() + send", whole_file, src, dst)
+    os.remove(src)
+    os.rmdir(directory)
+
+if __name__ == "__main__":
+    main()
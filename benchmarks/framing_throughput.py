@@ -0,0 +1,85 @@
+# framing_throughput.py
+# small message throughput over loopback: raw recv(SIZE) vs length-prefixed frames
+# usage: python framing_throughput.py [messages] [payload bytes]
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.framing import FrameReader, encode_frame, encode_frames
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+PAYLOAD = b"x" * (int(sys.argv[2]) if len(sys.argv) > 2 else 32)
+SIZE = 1024
+BATCH = 64
+
+def connected_pair():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    sender = socket.create_connection(listener.getsockname())
+    receiver, _ = listener.accept()
+    listener.close()
+    for s in (sender, receiver):
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sender, receiver
+
+def run(name, send, receive):
+    sender, receiver = connected_pair()
+    result = {}
+    reader_thread = threading.Thread(target=lambda: result.update(receive(receiver)))
+    reader_thread.start()
+    start = time.perf_counter()
+    send(sender)
+    sender.close()
+    reader_thread.join()
+    elapsed = time.perf_counter() - start
+    receiver.close()
+    seen = result["messages"]
+    print(f"{name:<28} {MESSAGES / elapsed:>12,.0f} msg/s   parsed {seen:>8} of {MESSAGES}"
+          f"{'' if seen == MESSAGES else '  (messages merged/split)'}")
+
+def send_raw(sock):                                         # what the labs do today: one send per message
+    for _ in range(MESSAGES):
+        sock.send(PAYLOAD)
+
+def recv_raw(sock):                                         # ... and one recv(SIZE) treated as one message
+    messages = 0
+    while sock.recv(SIZE):
+        messages += 1
+    return {"messages": messages}
+
+def send_framed(sock):
+    frame = encode_frame(PAYLOAD)
+    for _ in range(MESSAGES):
+        sock.sendall(frame)
+
+def send_framed_batched(sock):                              # many frames per send call
+    batch = encode_frames([PAYLOAD] * BATCH)
+    full, rest = divmod(MESSAGES, BATCH)
+    for _ in range(full):
+        sock.sendall(batch)
+    sock.sendall(encode_frames([PAYLOAD] * rest))
+
+def recv_framed(sock):
+    reader = FrameReader()
+    messages = 0
+    while True:
+        frames = reader.recv_frames(sock)
+        if frames is None:
+            break
+        for frame in frames:
+            if frame == PAYLOAD:
+                messages += 1
+    return {"messages": messages}
+
+def main():
+    print(f"> {MESSAGES} messages of {len(PAYLOAD)} bytes over 127.0.0.1")
+    run("before: raw send/recv", send_raw, recv_raw)
+    run("after: framed", send_framed, recv_framed)
+    run(f"after: framed, batch {BATCH}", send_framed_batched, recv_framed)
+
+if __name__ == "__main__":
+    main()
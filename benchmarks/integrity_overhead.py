@@ -0,0 +1,62 @@
+# integrity_overhead.py
+# lab-06 receive MB/s with and without hashing on the writer thread, and time to repair corrupted chunks
+# usage: python integrity_overhead.py [size in MB]
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import integrity
+from common.filewriter import FileWriter
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+BLOCK = 1024 * 1024
+
+def receive(path, blocks, hasher):                          # what the receiving client does per frame
+    start = time.perf_counter()
+    writer = FileWriter(path, len(blocks) * BLOCK, hasher=hasher)
+    for block in blocks:
+        writer.write(block)
+    writer.close()
+    elapsed = time.perf_counter() - start
+    return len(blocks) * BLOCK / elapsed / 1e6
+
+def main():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "received.bin")
+    blocks = [os.urandom(BLOCK) for _ in range(SIZE_MB)]
+    try:
+        plain = receive(path, blocks, None)
+        hasher = integrity.ChunkHasher()
+        hashed = receive(path, blocks, hasher)
+        print(f"> FileWriter                  : {plain:7.0f} MB/s")
+        print(f"> FileWriter + ChunkHasher    : {hashed:7.0f} MB/s  ({(1 - hashed / plain) * 100:.0f}% slower)")
+
+        sender = integrity.ChunkHasher()
+        for block in blocks:
+            sender.update(block)
+        whole, expected = sender.finish()
+        corrupt = list(range(0, SIZE_MB, max(1, SIZE_MB // 4)))
+        with open(path, "r+b") as file:                     # flip one byte in a few chunks
+            for index in corrupt:
+                file.seek(index * integrity.CHUNK_SIZE)
+                file.write(bytes([blocks[index][0] ^ 1]))
+        start = time.perf_counter()
+        received = integrity.ChunkHasher()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(integrity.CHUNK_SIZE), b""):
+                received.update(block)
+        bad = integrity.bad_chunks(expected, received.finish()[1])
+        for index in bad:
+            integrity.write_chunk(path, index, blocks[index])
+        ok = integrity.file_digest(path) == whole
+        elapsed = time.perf_counter() - start
+        print(f"> found and repaired {len(bad)} of {len(expected)} chunks in {elapsed:.2f} s, "
+              f"{'verified' if ok else 'NOT verified'} (re-sent {len(bad) * integrity.CHUNK_SIZE >> 20} MB instead of {SIZE_MB} MB)")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# interest.py
+# lab-07 bytes per client per second as the world and its population grow at the same density,
+# every client getting the whole world vs only its --view (area of interest)
+# usage: python interest.py [player counts] [seconds]
+import math
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import load_lab_module, start_lab_server, wait_for_port
+from common import gamewire
+from common.framing import FramedSocket
+from common.snapshot import SnapshotBuffer
+
+COUNTS = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [4, 16, 64]
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+VIEW = "600x400"
+MOVES = [{**dict.fromkeys(gamewire.KEYS, False), key: True} for key in gamewire.KEYS]
+HOLD = 0.5
+
+def play(player, seed, stop, totals):                       # ack every state, count what is in it and who came and went
+    moves = random.Random(seed)
+    snapshots = SnapshotBuffer()
+    states = received = seen = events = 0
+    keys, next_move = MOVES[0], 0
+    while time.perf_counter() < stop:
+        if time.perf_counter() >= next_move:
+            keys, next_move = moves.choice(MOVES), time.perf_counter() + HOLD
+        player.send(gamewire.encode_input(keys, snapshots.latest))
+        for frame in player.recv_many():
+            received += len(frame)
+            kind, message = gamewire.decode(frame)
+            state = snapshots.apply(message) if kind == gamewire.SNAPSHOT else None
+            if state is None:
+                continue
+            states += 1
+            seen += len(state['players'])
+            if message[1]:                                  # a delta, in a full snapshot everyone is new
+                events += len(snapshots.entered['players']) + len(snapshots.left['players'])
+    totals.append((states, received, seen, events))
+
+def run(addr, count, args):
+    server = start_lab_server("lab-07", *args)
+    try:
+        if not wait_for_port(addr):
+            sys.exit("lab-07 server did not start")
+        players = [FramedSocket(socket.create_connection(addr, timeout=5)) for _ in range(count)]
+        time.sleep(0.5)
+        totals = []
+        stop = time.perf_counter() + SECONDS
+        threads = [threading.Thread(target=play, args=(player, seed, stop, totals)) for seed, player in enumerate(players)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for player in players:
+            player.close()
+    finally:
+        server.kill()
+        server.wait()
+    states, received, seen, events = (sum(column) for column in zip(*totals))
+    return states / SECONDS / count, received / SECONDS / count, seen / max(states, 1), events / SECONDS / count
+
+def main():
+    addr = load_lab_module("lab-07", "server").ADDR
+    addr = (addr[0] or "127.0.0.1", addr[1])
+    print(f"> {SECONDS:.0f}s per run, 4 players and 10 coins per 600x400 of map, view {VIEW}")
+    print(f"{'players':>8} {'map':>10} {'mode':>6} {'states/s':>9} {'bytes/s per client':>19} {'players seen':>13} {'enter+leave/s':>14}")
+    for count in COUNTS:
+        scale = math.sqrt(count / 4)
+        size = f"{int(600 * scale)}x{int(400 * scale)}"
+        world = [f"--map={size}", f"--coins={int(10 * scale * scale)}"]
+        for mode, args in (("whole", world), ("view", world + [f"--view={VIEW}"])):
+            states, received, seen, events = run(addr, count, args)
+            print(f"{count:>8} {size:>10} {mode:>6} {states:>9.1f} {received:>19.0f} {seen:>13.1f} {events:>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# lab03_idle_clients.py
+# open many idle clients against the lab-03 server and report its memory
+# usage: python lab03_idle_clients.py [clients] [--threads]
+import socket
+import sys
+import time
+
+from bench_utils import load_lab_module, raise_fd_limit, rss_kb, start_lab_server, wait_for_port
+
+CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 10000
+ENGINE = "threads" if "--threads" in sys.argv else "selectors"
+STEP = max(CLIENTS // 10, 1)
+
+def main():
+    lab03 = load_lab_module("lab-03", "server")
+    raise_fd_limit()
+
+    server = start_lab_server("lab-03", f"--{ENGINE}")
+    try:
+        if not wait_for_port(lab03.ADDR):
+            print("> Server did not start")
+            return
+        time.sleep(0.5)
+        base_rss = rss_kb(server.pid)
+        print(f"> Engine : {ENGINE}")
+        print(f"{'clients':>8} {'rss (MB)':>10} {'KB/client':>10}")
+        print(f"{0:>8} {base_rss / 1024:>10.1f} {'-':>10}")
+
+        conns = []
+        start = time.time()
+        while len(conns) < CLIENTS:
+            try:
+                conns.append(socket.create_connection(lab03.ADDR))
+            except OSError as e:
+                print(f"> Stopped at {len(conns)} clients : {e}")
+                break
+            if len(conns) % STEP == 0:
+                time.sleep(0.2)                             # let the server accept the backlog
+                rss = rss_kb(server.pid)
+                print(f"{len(conns):>8} {rss / 1024:>10.1f} {(rss - base_rss) / len(conns):>10.2f}")
+        elapsed = time.time() - start
+
+        # every client must still be served, not just accepted
+        conns[-1].send(b"ping")
+        conns[-1].settimeout(5)
+        reply = conns[-1].recv(1024)
+        print(f"> Reached {len(conns)} connections in {elapsed:.1f}s, server RSS {rss_kb(server.pid) / 1024:.1f} MB")
+        print(f"> Last client reply : {reply.decode()!r}")
+        for conn in conns:
+            conn.close()
+    finally:
+        server.kill()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
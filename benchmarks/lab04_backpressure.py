@@ -0,0 +1,105 @@
+# lab04_backpressure.py
+# lab-04 relay throughput to a fast client, alone and while another client floods a throttled peer
+# usage: python lab04_backpressure.py [messages]
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import load_lab_module, start_lab_server, wait_for_port
+from common.framing import FrameReader, encode_frames
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+BATCH = 100
+
+def target(sock):
+    host, port = sock.getsockname()
+    return f"{host}:{port}"
+
+def send_to(sender, receiver, count, stop=None):
+    batch = encode_frames([f"{target(receiver)}&{'x' * 32}&msg".encode()] * BATCH)
+    sent = 0
+    while sent < count and not (stop and stop.is_set()):
+        sender.sendall(batch)
+        sent += BATCH
+    return sent
+
+def receive(sock, count, result):
+    reader = FrameReader()
+    got = 0
+    start = time.perf_counter()
+    while got < count:
+        frames = reader.recv_frames(sock)
+        if frames is None:
+            break
+        got += len(frames)
+    result["got"] = got
+    result["elapsed"] = time.perf_counter() - start
+
+def flood(sender, receiver, stop):                           # keeps sending until stopped or the socket is closed
+    try:
+        send_to(sender, receiver, 10 ** 9, stop)
+    except OSError:
+        pass
+
+def throttled_reader(sock, stop, result):                    # reads 1 KB every 10 ms
+    got = 0
+    sock.settimeout(0.5)
+    while not stop.is_set():
+        try:
+            got += len(sock.recv(1024))
+        except socket.timeout:
+            pass
+        time.sleep(0.01)
+    result["bytes"] = got
+
+def run(addr, with_slow_peer):
+    fast_sender = socket.create_connection(addr)
+    fast = socket.create_connection(addr)
+    flood_sender = socket.create_connection(addr)
+    slow = socket.create_connection(addr)
+    slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    time.sleep(0.3)
+
+    stop = threading.Event()
+    slow_result = {}
+    threads = []
+    if with_slow_peer:
+        threads.append(threading.Thread(target=throttled_reader, args=(slow, stop, slow_result)))
+        threads.append(threading.Thread(target=flood, args=(flood_sender, slow, stop), daemon=True))
+    for t in threads:
+        t.start()
+    time.sleep(0.2)
+
+    result = {}
+    receiver = threading.Thread(target=receive, args=(fast, MESSAGES, result))
+    receiver.start()
+    send_to(fast_sender, fast, MESSAGES)
+    receiver.join()
+    stop.set()
+
+    label = "with throttled peer" if with_slow_peer else "no throttled peer"
+    print(f"{label:<22} {result['got'] / result['elapsed']:>12,.0f} msg/s   delivered {result['got']} of {MESSAGES}")
+    if with_slow_peer:
+        threads[0].join()
+        print(f"{'':<22} throttled peer read {slow_result['bytes'] / 1024:.0f} KB, flooding sender was paused by the server")
+    for s in (fast_sender, fast, flood_sender, slow):
+        s.close()
+
+def main():
+    lab04 = load_lab_module("lab-04", "server")
+    server = start_lab_server("lab-04", "--framed")
+    try:
+        if not wait_for_port(lab04.ADDR):
+            print("> Server did not start")
+            return
+        run(lab04.ADDR, False)
+        run(lab04.ADDR, True)
+    finally:
+        server.kill()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
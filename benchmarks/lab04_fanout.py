@@ -0,0 +1,102 @@
+# lab04_fanout.py
+# group messages delivered per second by the lab-04 relay at different group sizes
+# usage: python lab04_fanout.py [group sizes...]
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import load_lab_module, raise_fd_limit, start_lab_server, wait_for_port
+from common.framing import FrameReader, FramedSocket, encode_frames
+
+GROUP_SIZES = [int(n) for n in sys.argv[1:]] or [10, 100, 1000]
+DELIVERIES = 200000                                         # messages x members per run
+BATCH = 50
+
+def read_members(members, expected, result):                # count frames arriving on every member socket
+    sel = selectors.DefaultSelector()
+    for sock in members:
+        sock.setblocking(False)
+        sel.register(sock, selectors.EVENT_READ, FrameReader())
+    got, last = 0, time.perf_counter()
+    while got < expected and time.perf_counter() - last < 2:
+        for key, _ in sel.select(0.5):
+            try:
+                frames = key.data.recv_frames(key.fileobj)
+            except BlockingIOError:
+                continue
+            if frames:
+                got += len(frames)
+                last = time.perf_counter()
+    result["got"] = got
+    result["end"] = last
+    sel.close()
+
+def run(addr, size, group):
+    sender = FramedSocket(socket.create_connection(addr))
+    members = []
+    for _ in range(size):
+        member = FramedSocket(socket.create_connection(addr))
+        member.send(f"{group}&&join".encode())
+        member.recv()                                       # "Joined ..." notice
+        members.append(member.sock)
+
+    messages = max(DELIVERIES // size, 100)
+    expected = messages * size
+    result = {}
+    reader = threading.Thread(target=read_members, args=(members, expected, result))
+    reader.start()
+    start = time.perf_counter()
+    batch = encode_frames([f"{group}&{'x' * 32}&msg".encode()] * BATCH)
+    for _ in range(messages // BATCH):
+        sender.sock.sendall(batch)
+    reader.join()
+    elapsed = result["end"] - start
+    print(f"{size:>8} {messages:>9} {result['got']:>11} {result['got'] / elapsed:>14,.0f}")
+
+    for sock in members + [sender.sock]:
+        sock.close()
+
+def ack_summary(addr):                                      # 10 members ack one message, the sender sees one summary
+    sender = FramedSocket(socket.create_connection(addr))
+    members = []
+    for _ in range(10):
+        member = FramedSocket(socket.create_connection(addr))
+        member.send(b"#acks&&join")
+        member.recv()
+        members.append(member)
+    sender.send(b"#acks&hello&msg")
+    for member in members:
+        origin, _, msg_type = member.recv().decode().split("&")
+        member.send(f"{origin}&Message recieved]&ack{msg_type[3:]}".encode())
+    sender.settimeout(2)
+    print(f"> Sender got : {sender.recv().decode()!r}")
+    try:
+        extra = sender.recv()
+    except socket.timeout:
+        extra = None
+    print(f"> Extra acks sent to the sender : {0 if extra is None else 'yes'}")
+    for sock in members + [sender]:
+        sock.close()
+
+def main():
+    raise_fd_limit()
+    lab04 = load_lab_module("lab-04", "server")
+    server = start_lab_server("lab-04", "--framed")
+    try:
+        if not wait_for_port(lab04.ADDR):
+            print("> Server did not start")
+            return
+        print(f"{'members':>8} {'messages':>9} {'delivered':>11} {'delivered/s':>14}")
+        for size in GROUP_SIZES:
+            run(lab04.ADDR, size, f"#bench{size}")
+        ack_summary(lab04.ADDR)
+    finally:
+        server.kill()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
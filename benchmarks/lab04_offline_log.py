@@ -0,0 +1,111 @@
+# lab04_offline_log.py
+# append/drain rate of the lab-04 offline message log, and live relay latency while a backlog is replayed
+# usage: python lab04_offline_log.py [messages]
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import load_lab_module, start_lab_server, wait_for_port
+from common.framing import FrameReader, FramedSocket, encode_frames
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+OFFLINE_PORT = 47001
+BATCH = 100
+
+def log_rates(message_log_module):
+    directory = tempfile.mkdtemp()
+    log = message_log_module.MessageLog(directory, segment_size=1024 * 1024)
+    payload = b"127.0.0.1:5000&" + b"x" * 48 + b"&msg"
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        log.append(f"127.0.0.1:{6000 + i % 100}", payload)
+    append_rate = MESSAGES / (time.perf_counter() - start)
+    start = time.perf_counter()
+    drained = 0
+    for i in range(100):
+        while True:
+            batch = log.read(f"127.0.0.1:{6000 + i}")
+            if not batch:
+                break
+            log.delivered(f"127.0.0.1:{6000 + i}", len(batch))
+            drained += len(batch)
+    drain_rate = drained / (time.perf_counter() - start)
+    log.compact()                                           # the server runs it on a timer
+    left = [name for name in os.listdir(directory) if name.startswith("segment-")]
+    log.close()
+    shutil.rmtree(directory)
+    print(f"> append {append_rate:,.0f} msg/s, drain {drain_rate:,.0f} msg/s, segments left after compaction: {len(left)}")
+
+def live_latency(sender, receiver, rounds=300):
+    host, port = receiver.sock.getsockname()
+    msg = f"{host}:{port}&ping&note".encode()
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        sender.send(msg)
+        receiver.recv()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+def replay(addr, result):
+    offline = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    offline.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    offline.bind(("", OFFLINE_PORT))
+    start = time.perf_counter()
+    offline.connect(addr)
+    reader, got = FrameReader(), 0
+    while got < MESSAGES:
+        frames = reader.recv_frames(offline)
+        if frames is None:
+            break
+        got += len(frames)
+    result["got"] = got
+    result["elapsed"] = time.perf_counter() - start
+    offline.close()
+
+def main():
+    lab04 = load_lab_module("lab-04", "server")
+    log_rates(load_lab_module("lab-04", "message_log"))
+
+    directory = tempfile.mkdtemp()
+    server = start_lab_server("lab-04", "--framed", f"--offline-dir={directory}")
+    try:
+        if not wait_for_port(lab04.ADDR):
+            print("> Server did not start")
+            return
+        sender = FramedSocket(socket.create_connection(lab04.ADDR))
+        receiver = FramedSocket(socket.create_connection(lab04.ADDR))
+
+        batch = encode_frames([f"127.0.0.1:{OFFLINE_PORT}&{'x' * 32}&note".encode()] * BATCH)
+        start = time.perf_counter()
+        for _ in range(MESSAGES // BATCH):
+            sender.sock.sendall(batch)
+        live_latency(sender, receiver, 1)                   # returns once the server has caught up
+        print(f"> Stored {MESSAGES} messages for an offline client in {time.perf_counter() - start:.2f}s (through the relay)")
+
+        p50, p99 = live_latency(sender, receiver)
+        print(f"> Live relay latency, idle       : p50 {p50:.0f} us, p99 {p99:.0f} us")
+
+        result = {}
+        replayer = threading.Thread(target=replay, args=(lab04.ADDR, result))
+        replayer.start()
+        p50, p99 = live_latency(sender, receiver)
+        replayer.join()
+        print(f"> Live relay latency, replaying  : p50 {p50:.0f} us, p99 {p99:.0f} us")
+        print(f"> Replayed {result['got']} of {MESSAGES} messages in {result['elapsed']:.2f}s")
+        sender.close()
+        receiver.close()
+    finally:
+        server.kill()
+        server.wait()
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# lab06_receive.py
+# lab-06 receiving client: reopen the file in 'ab' mode per packet (before) vs one FileWriter
+# usage: python lab06_receive.py [size in MB]
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.filewriter import FileWriter
+from common.framing import FramedSocket, encode_frame
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+
+def connected_pair():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    a = socket.create_connection(listener.getsockname())
+    b, _ = listener.accept()
+    listener.close()
+    return a, b
+
+def reopen_per_packet(client, path, size):                  # what handle_server did
+    with open(path, 'wb'):
+        pass
+    file_data = client.recv()
+    while file_data != b'EOF':
+        with open(path, 'ab') as file:
+            file.write(file_data)
+        file_data = client.recv()
+
+def file_writer(client, path, size):
+    writer = FileWriter(path, size)
+    file_data = client.recv()
+    while file_data != b'EOF':
+        writer.write(file_data)
+        file_data = client.recv()
+    writer.close()
+
+def run(receive, packet, path):                             # MB/s seen by the receiver
+    sender, receiver = connected_pair()
+    total = SIZE_MB * 1024 * 1024
+    per_block = max(1, (1024 * 1024) // packet)             # packets per sendall
+    block = encode_frame(os.urandom(packet)) * per_block
+
+    def send():
+        for _ in range(total // (packet * per_block)):
+            sender.sendall(block)
+        sender.sendall(encode_frame(b'EOF'))
+
+    threading.Thread(target=send).start()
+    start = time.perf_counter()
+    receive(FramedSocket(receiver), path, total)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(path)
+    sender.close()
+    receiver.close()
+    os.remove(path)
+    return size / elapsed / 1e6, size
+
+def main():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "received.bin")
+    try:
+        for name, receive, packet in [("reopen 'ab' per 1 KB packet (before)", reopen_per_packet, 1024),
+                                      ("FileWriter, 1 KB packets", file_writer, 1024),
+                                      ("FileWriter, 1 MB frames", file_writer, 1024 * 1024)]:
+            rate, size = run(receive, packet, path)
+            print(f"> {name:38s}: {rate:7.0f} MB/s  ({size >> 20} MB)")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
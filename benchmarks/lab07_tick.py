@@ -0,0 +1,70 @@
+# lab07_tick.py
+# lab-07 game states and bytes sent per second as the number of players grows
+# usage: python lab07_tick.py [player counts] [seconds]
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import load_lab_module, start_lab_server, wait_for_port
+from common import gamewire
+from common.framing import FramedSocket
+
+COUNTS = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1, 2, 4, 8, 16]
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+STALL = 2                                                   # seconds without a state before a player counts as stuck
+
+def play(player, stop, totals):                             # send an input, read every state that came back, like the client
+    data = gamewire.encode_input({"right": True, "down": True})     # acks nothing, every state is a full snapshot
+    inputs = states = received = 0
+    try:
+        while time.perf_counter() < stop:
+            player.send(data)
+            inputs += 1
+            for frame in player.recv_many():
+                states += 1
+                received += len(frame)
+    except socket.timeout:                                  # server stopped sending to this player
+        totals.append((inputs, states, received, True))
+        return
+    totals.append((inputs, states, received, False))
+
+def run(addr, count):
+    players = [FramedSocket(socket.create_connection(addr, timeout=STALL)) for _ in range(count)]
+    time.sleep(0.3)
+    totals = []
+    stop = time.perf_counter() + SECONDS
+    threads = [threading.Thread(target=play, args=(player, stop, totals)) for player in players]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for player in players:
+        player.close()
+    time.sleep(0.3)                                         # players removed before the next run
+    inputs, states, received, stalled = (sum(column) for column in zip(*totals))
+    return inputs / SECONDS, states / SECONDS, received / SECONDS, stalled
+
+def main():
+    addr = load_lab_module("lab-07", "server").ADDR
+    addr = (addr[0] or "127.0.0.1", addr[1])
+    server = start_lab_server("lab-07", *sys.argv[3:])
+    try:
+        if not wait_for_port(addr):
+            sys.exit("lab-07 server did not start")
+        print(f"> {SECONDS:.0f}s per run, every player sends an input after each read, {os.cpu_count()} CPU(s)")
+        print(f"{'players':>8} {'inputs/s':>10} {'states/s':>10} {'per player':>11} {'KB/s sent':>10} {'KB/s per player':>16}")
+        for count in COUNTS:
+            inputs, states, received, stalled = run(addr, count)
+            print(f"{count:>8} {inputs:>10.0f} {states:>10.0f} {states / count:>11.0f} {received / 1024:>10.0f} {received / 1024 / count:>16.1f}"
+                  + (f"  {stalled} player(s) stalled" if stalled else ""))
+            if stalled:                                     # the server is stuck, later runs would be too
+                break
+    finally:
+        server.kill()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
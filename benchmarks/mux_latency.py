@@ -0,0 +1,96 @@
+# mux_latency.py
+# lab-06: time until a 10 KB file arrives when it is sent during a large one, one file after the other vs --mux channels
+# usage: python mux_latency.py [large file MB]
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import start_lab_server, wait_for_port
+from common import mux
+from common.framing import FramedSocket
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+SMALL_SIZE = 10 * 1024
+DELAY = 0.2                                                 # the small file is sent this long after the large one started
+ADDR = ("127.0.0.1", 8011)
+
+def receive_framed(receiver, arrived):                      # f;sender;name;size, frames, EOF, one file after the other
+    while len(arrived) < 2:
+        name = receiver.recv().decode().split(";")[2]
+        while receiver.recv() != b"EOF":
+            pass
+        arrived[name] = time.perf_counter()
+
+def receive_mux(receiver, arrived):                         # frames of both channels mixed
+    names = {}
+    while len(arrived) < 2:
+        channel, payload = mux.split(receiver.recv())
+        if channel not in names:
+            names[channel] = payload.decode().split(";")[2]
+        elif payload == b"EOF":
+            arrived[names.pop(channel)] = time.perf_counter()
+
+def send_framed(sender, neigh, path):                       # what main() does without --mux
+    sender.send(f"f;{neigh};{path};{os.path.getsize(path)}".encode())
+    with open(path, "rb") as file:
+        for data in iter(lambda: file.read(1024 * 1024), b""):
+            sender.send(data)
+    sender.send(b"EOF")
+
+def run(flag):                                              # (seconds until the small file arrived, until the large one did)
+    server = start_lab_server("lab-06", flag)
+    if not wait_for_port(ADDR):
+        sys.exit("lab-06 server did not start")
+    sender = FramedSocket(socket.create_connection(ADDR))
+    receiver = FramedSocket(socket.create_connection(ADDR))
+    time.sleep(0.2)                                         # both registered with the server
+    neigh = "{}:{}".format(*receiver.getsockname())
+    arrived = {}
+    receiving = threading.Thread(target=receive_mux if flag == "--mux" else receive_framed, args=(receiver, arrived))
+    receiving.start()
+    try:
+        start = time.perf_counter()
+        if flag == "--mux":
+            channels = mux.Mux(sender)
+            channels.open(mux.file_frames("large.bin", f"f;{neigh};large.bin;{SIZE_MB << 20}".encode()))
+            time.sleep(DELAY)
+            issued = time.perf_counter()
+            channels.open(mux.file_frames("small.bin", f"f;{neigh};small.bin;{SMALL_SIZE}".encode()))
+            channels.close()
+        else:                                               # the user asks for the small file while the large one is sent
+            issued = start + DELAY
+            send_framed(sender, neigh, "large.bin")
+            send_framed(sender, neigh, "small.bin")
+        receiving.join()
+        return arrived["small.bin"] - issued, arrived["large.bin"] - start
+    finally:
+        sender.close()
+        receiver.close()
+        server.kill()
+        server.wait()
+
+def main():
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+    block = os.urandom(1024 * 1024)
+    with open("large.bin", "wb") as file:
+        for _ in range(SIZE_MB):
+            file.write(block)
+    with open("small.bin", "wb") as file:
+        file.write(os.urandom(SMALL_SIZE))
+    print(f"> {SIZE_MB} MB file, then a {SMALL_SIZE >> 10} KB file {DELAY}s later, lab-06 relay on {ADDR[0]}:{ADDR[1]}")
+    try:
+        for name, flag in [("one file after the other (before)", "--framed"), ("--mux channels", "--mux")]:
+            small, large = run(flag)
+            print(f"> {name:34s}: small file after {small * 1000:8.1f} ms, large file after {large:5.2f}s "
+                  f"({SIZE_MB / large:5.0f} MB/s)")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
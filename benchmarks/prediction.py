@@ -0,0 +1,148 @@
+# prediction.py
+# lab-07 client view with network latency: how soon the own square reacts to a key and how smoothly the others move,
+# drawing the server's states as they come vs client side prediction and interpolation (common/prediction.py)
+# usage: python prediction.py [latencies ms] [seconds]
+import os
+import random
+import statistics
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import load_lab_module, start_lab_server, wait_for_port
+from common import gamewire
+from common.datagram import DatagramClient
+from common.prediction import Interpolator, Predictor
+from common.snapshot import SnapshotBuffer
+
+LATENCIES = [float(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [0, 50, 100]
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 6
+MAP = "4000x4000"                                           # walls are rarely in the way
+WIDTH, HEIGHT = 4000, 4000
+PLAYER_SIZE, PLAYER_SPEED = 30, 90
+FPS = 60
+HOLD = 0.5
+MOVES = [{**dict.fromkeys(gamewire.KEYS, False), key: True} for key in gamewire.KEYS]   # one arrow key each
+DIRECTIONS = {"left": (-1, 0), "right": (1, 0), "up": (0, -1), "down": (0, 1)}
+
+class Bot:
+    '''A client without a window: the receiving thread and the 60 Hz loop of lab-07/client.py'''
+
+    def __init__(self, addr, latency, seed):
+        self.client = DatagramClient(addr, latency=latency / 1000, jitter=latency / 2000)
+        self.client.connect()
+        self.moves = random.Random(seed)
+        self.snapshots = SnapshotBuffer()
+        self.predictor = Predictor(WIDTH, HEIGHT, PLAYER_SIZE)
+        self.others = Interpolator()
+        self.lock = threading.Lock()
+        self.state = None                                   # newest state, what a client without prediction draws
+        self.me = None
+        self.corrections = []                               # pixels the prediction was off when a state arrived
+        self.running = True
+        threading.Thread(target=self.receive, daemon=True).start()
+
+    def receive(self):
+        while self.running:
+            try:
+                kind, message = gamewire.decode(self.client.recv())
+            except (socket.timeout, ValueError):
+                continue
+            except OSError:                                 # closed
+                return
+            state = self.snapshots.apply(message) if kind == gamewire.SNAPSHOT else None
+            if state is None:
+                continue
+            player_id, applied = message[3:]
+            with self.lock:
+                self.state, self.me = state, player_id
+                if player_id in state['players']:
+                    before = self.predictor.position
+                    self.predictor.reconcile(state['players'][player_id], applied)
+                    if before is not None:
+                        self.corrections.append(abs(self.predictor.error[0]) + abs(self.predictor.error[1]))
+                self.others.add({other: position for other, position in state['players'].items() if other != player_id})
+
+    def frame(self, keys):                                  # one frame: send the keys, return what would be drawn
+        with self.lock:
+            seq = self.predictor.input(keys, PLAYER_SPEED / FPS)
+            own = self.predictor.draw()
+            smooth = self.others.positions()
+            state, me = self.state, self.me
+        self.client.send(gamewire.encode_input(keys, self.snapshots.latest, seq))
+        raw = dict(state['players']) if state else {}
+        return own, raw.pop(me, None), smooth, raw
+
+    def close(self):
+        self.running = False
+        self.client.close()
+
+def moved(before, after, direction):                        # did the square move the way the keys point
+    return before is not None and after is not None and (after[0] - before[0]) * direction[0] + (after[1] - before[1]) * direction[1] > 0
+
+def run(addr, latency):
+    watched, other = Bot(addr, latency, 1), Bot(addr, latency, 2)
+    time.sleep(0.5)
+    predicted_delay, server_delay, smooth_steps, raw_steps = [], [], [], []
+    keys, change, direction = {}, 0, None
+    waiting = None                                          # [time of the key change, predicted seen, server seen]
+    last = None
+    stop = time.perf_counter() + SECONDS
+    while time.perf_counter() < stop:
+        now = time.perf_counter()
+        if now >= change:
+            keys = watched.moves.choice(MOVES)
+            change, direction = now + HOLD, DIRECTIONS[next(key for key in gamewire.KEYS if keys[key])]
+            waiting = [now, None, None]
+        own, server, smooth, raw = watched.frame(keys)
+        other.frame(MOVES[1])                               # the other one keeps walking right
+        if last is not None:
+            if waiting and waiting[1] is None and moved(last[0], own, direction):
+                waiting[1] = now - waiting[0]
+                predicted_delay.append(waiting[1])
+            if waiting and waiting[2] is None and moved(last[1], server, direction):
+                waiting[2] = now - waiting[0]
+                server_delay.append(waiting[2])
+            for player_id, (x, y) in smooth.items():        # how far the other square jumps from one frame to the next
+                if player_id in last[2]:
+                    smooth_steps.append(abs(x - last[2][player_id][0]) + abs(y - last[2][player_id][1]))
+            for player_id, (x, y) in raw.items():
+                if player_id in last[3]:
+                    raw_steps.append(abs(x - last[3][player_id][0]) + abs(y - last[3][player_id][1]))
+        last = own, server, smooth, raw
+        time.sleep(max(0, now + 1 / FPS - time.perf_counter()))
+    corrections = watched.corrections
+    watched.close()
+    other.close()
+    return predicted_delay, server_delay, smooth_steps, raw_steps, corrections
+
+def ms(values, quantile=0.5):
+    values = sorted(values)
+    return values[int((len(values) - 1) * quantile)] * 1000 if values else float("nan")
+
+def px(values, quantile):
+    values = sorted(values)
+    return values[int((len(values) - 1) * quantile)] if values else float("nan")
+
+def main():
+    addr = load_lab_module("lab-07", "server").ADDR
+    addr = (addr[0] or "127.0.0.1", addr[1])
+    print(f"> {SECONDS:.0f}s per run at {FPS} fps, keys change every {HOLD}s, latency is one way (both ways, plus up to half as much jitter)")
+    print(f"{'latency':>8} {'react ms: predicted':>19} {'server':>7} {'other step px p99: interpolated':>32} {'raw':>5} "
+          f"{'raw max':>8} {'correction px':>14}")
+    for latency in LATENCIES:
+        server = start_lab_server("lab-07", "--udp", f"--map={MAP}", f"--latency={latency:g}", f"--jitter={latency / 2:g}")
+        try:
+            if not wait_for_port(addr):
+                sys.exit("lab-07 server did not start")
+            predicted, served, smooth, raw, corrections = run(addr, latency)
+            print(f"{latency:>6.0f}ms {ms(predicted):>19.1f} {ms(served):>7.1f} {px(smooth, 0.99):>32.1f} {px(raw, 0.99):>5.1f} "
+                  f"{max(raw, default=0):>8.1f} {statistics.mean(corrections) if corrections else 0:>14.2f}")
+        finally:
+            server.kill()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# registry_latency.py
+# relay latency of the lab-04 server while the number of connected clients grows,
+# plus the cost of a single lookup: list scan (old find_conn) vs ConnectionRegistry
+# usage: python registry_latency.py [max clients]
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import load_lab_module, raise_fd_limit, start_lab_server, wait_for_port
+from common.registry import ConnectionRegistry
+
+MAX_CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+ROUNDS = 500
+
+class FakeConn:
+    def __init__(self, fd):
+        self.fd = fd
+
+    def fileno(self):
+        return self.fd
+
+def list_find(clients, addr):                               # find_conn as it was in lab-04
+    conn = None
+    for client in clients:
+        if client[1] == addr:
+            conn = client[0]
+    return conn
+
+def lookup_cost(count):
+    pairs = [(FakeConn(i), ("127.0.0.1", 10000 + i)) for i in range(count)]
+    registry = ConnectionRegistry()
+    for conn, addr in pairs:
+        registry.add(conn, addr)
+    target = pairs[-1][1]
+    loops = 2000
+    start = time.perf_counter()
+    for _ in range(loops):
+        list_find(pairs, target)
+    scan = (time.perf_counter() - start) / loops
+    start = time.perf_counter()
+    for _ in range(loops):
+        registry.find(target)
+    indexed = (time.perf_counter() - start) / loops
+    return scan, indexed
+
+def relay_latency(sender, receiver):                  # sender -> server -> receiver, one message at a time
+    host, port = receiver.getsockname()
+    msg = f"{host}:{port}&ping&msg".encode()
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        sender.send(msg)
+        receiver.recv(1024)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99)]
+
+def main():
+    raise_fd_limit()
+    lab04 = load_lab_module("lab-04", "server")
+    steps = [n for n in (10, 100, 1000, 10000) if n <= MAX_CLIENTS]
+
+    print(f"{'clients':>8} {'list scan (us)':>15} {'registry (us)':>14}")
+    for count in steps:
+        scan, indexed = lookup_cost(count)
+        print(f"{count:>8} {scan * 1e6:>15.2f} {indexed * 1e6:>14.3f}")
+
+    server = start_lab_server("lab-04")
+    try:
+        if not wait_for_port(lab04.ADDR):
+            print("> Server did not start")
+            return
+        sender = socket.create_connection(lab04.ADDR)
+        receiver = socket.create_connection(lab04.ADDR)
+        idle = []
+        print(f"\n{'clients':>8} {'relay p50 (us)':>15} {'relay p99 (us)':>15}")
+        for count in steps:
+            while len(idle) + 2 < count:
+                idle.append(socket.create_connection(lab04.ADDR))
+            time.sleep(0.5)
+            p50, p99 = relay_latency(sender, receiver)
+            print(f"{count:>8} {p50 * 1e6:>15.1f} {p99 * 1e6:>15.1f}")
+        for conn in idle + [sender, receiver]:
+            conn.close()
+    finally:
+        server.kill()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
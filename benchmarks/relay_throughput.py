@@ -0,0 +1,83 @@
+# relay_throughput.py
+# framed file data through a relay thread: lab-06 1 KB frame loop vs common/relay.py, against a direct connection
+# usage: python relay_throughput.py [size in MB]
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import relay
+from common.framing import FramedSocket, encode_frame
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+
+def connected_pair():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    a = socket.create_connection(listener.getsockname())
+    b, _ = listener.accept()
+    listener.close()
+    return a, b
+
+def loop_relay(src, dst):                                   # what lab-06 did: recv one frame, send it on
+    data = src.recv(1024)
+    while data:
+        dst.send(data)
+        if data == b'EOF':
+            break
+        data = src.recv(1024)
+
+def pooled_relay(src, dst):
+    relay.relay_frames(src, dst)
+
+def run(relay_fn, frame_size, total):                       # seconds to push total bytes of frames to the receiver
+    sender, relay_in = connected_pair()
+    if relay_fn:
+        relay_out, receiver = connected_pair()
+        args = (FramedSocket(relay_in), FramedSocket(relay_out))
+        thread = threading.Thread(target=relay_fn, args=args)
+        thread.start()
+    else:
+        receiver = relay_in
+    frame = encode_frame(os.urandom(frame_size))
+    eof = encode_frame(b'EOF')
+    count = total // frame_size
+    expected = count * len(frame) + len(eof)
+
+    def send():
+        for _ in range(count):
+            sender.sendall(frame)
+        sender.sendall(eof)
+
+    start = time.perf_counter()
+    threading.Thread(target=send).start()
+    view = memoryview(bytearray(1024 * 1024))
+    received = 0
+    while received < expected:
+        n = receiver.recv_into(view)
+        if not n:
+            break
+        received += n
+    elapsed = time.perf_counter() - start
+    if relay_fn:
+        thread.join()
+        relay_out.close()
+    for sock in (sender, relay_in, receiver):
+        sock.close()
+    return elapsed, received == expected
+
+def main():
+    total = SIZE_MB * 1024 * 1024
+    cases = [("direct loopback, 1 MB frames", None, 1024 * 1024, total),
+             ("1 KB frame loop (before)", loop_relay, 1024, total // 16),
+             ("relay.py splice/pool, 1 MB frames", pooled_relay, 1024 * 1024, total)]
+    print(f"> splice available: {relay.SPLICE}")
+    for name, fn, frame_size, size in cases:
+        elapsed, ok = run(fn, frame_size, size)
+        print(f"> {name:36s}: {size / elapsed / 1e6:8.0f} MB/s  ({size >> 20} MB, ok: {ok})")
+
+if __name__ == "__main__":
+    main()
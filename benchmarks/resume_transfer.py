@@ -0,0 +1,76 @@
+# resume_transfer.py
+# time to finish a transfer that was interrupted at 90%, compared with sending the whole file
+# usage: python resume_transfer.py [size in MB]
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import filestream, resume
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+
+def connected_pair():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    sender = socket.create_connection(listener.getsockname())
+    receiver, _ = listener.accept()
+    listener.close()
+    return sender, receiver
+
+def receive(receiver, checkpoint, result):
+    try:
+        filestream.recv_file(receiver, checkpoint.path, checkpoint=checkpoint)
+        result["done"] = True
+    except ConnectionError:
+        result["done"] = False
+    receiver.close()
+
+def transfer(src, dst, stop_at=None):                       # returns (seconds, offset it resumed from, finished)
+    size = os.path.getsize(src)
+    checkpoint = resume.Checkpoint(dst, resume.transfer_id(src), size)
+    start = time.perf_counter()
+    offset = checkpoint.resume_offset()                     # what the receiver answers to the offer
+    sender, receiver = connected_pair()
+    result = {}
+    reader = threading.Thread(target=receive, args=(receiver, checkpoint, result))
+    reader.start()
+    if stop_at is None:
+        filestream.send_file(sender, src, offset)
+    else:                                                   # connection drops part way through
+        sender.sendall(filestream.FILE_HEADER.pack(size - offset))
+        with open(src, "rb") as file:
+            sender.sendfile(file, offset, stop_at - offset)
+    sender.close()
+    reader.join()
+    return time.perf_counter() - start, offset, result["done"]
+
+def main():
+    directory = tempfile.mkdtemp()
+    src = os.path.join(directory, "input.bin")
+    block = os.urandom(1024 * 1024)
+    with open(src, "wb") as file:
+        for _ in range(SIZE_MB):
+            file.write(block)
+    size = os.path.getsize(src)
+
+    full, _, _ = transfer(src, os.path.join(directory, "full.bin"))
+    print(f"> Full transfer of {SIZE_MB} MB     : {full:.2f}s")
+
+    dst = os.path.join(directory, "resumed.bin")
+    _, _, done = transfer(src, dst, stop_at=int(size * 0.9))
+    print(f"> Interrupted at 90%, finished: {done}")
+    tail, offset, done = transfer(src, dst)
+    print(f"> Resumed from {offset / size:.0%} ({offset} bytes) : {tail:.2f}s = {tail / full:.0%} of the full transfer")
+    with open(src, "rb") as a, open(dst, "rb") as b:
+        same = all(x == y for x, y in zip(iter(lambda: a.read(1 << 20), b""), iter(lambda: b.read(1 << 20), b"")))
+    print(f"> Resumed file matches the source: {same and done}")
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# snapshot_bandwidth.py
+# lab-07 bytes per client per second, full game state every tick vs delta snapshots against the acked one
+# usage: python snapshot_bandwidth.py [player counts] [seconds]
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import load_lab_module, start_lab_server, wait_for_port
+from common import gamewire
+from common.framing import FramedSocket
+from common.snapshot import SnapshotBuffer
+
+COUNTS = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [2, 8, 16]
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+STALL = 2
+MOVES = [{}, {"left": True}, {"right": True}, {"up": True}, {"down": True}, {"right": True, "down": True}]
+HOLD = 0.5                                                  # seconds a bot keeps its keys before picking new ones
+
+def play(player, seed, delta, stop, totals):                # like the client: send an input, draw every state that came back
+    moves = random.Random(seed)
+    snapshots = SnapshotBuffer()
+    states = received = broken = 0
+    keys, next_move = {}, 0
+    while time.perf_counter() < stop:
+        if time.perf_counter() >= next_move:
+            keys, next_move = moves.choice(MOVES), time.perf_counter() + HOLD
+        player.send(gamewire.encode_input(keys, snapshots.latest if delta else 0))
+        for frame in player.recv_many():
+            received += len(frame)
+            kind, msg = gamewire.decode(frame)
+            if kind != gamewire.SNAPSHOT:                   # winner
+                continue
+            states += 1
+            if snapshots.apply(msg) is None:
+                broken += 1
+    totals.append((states, received, broken))
+
+def run(addr, count, delta):
+    players = [FramedSocket(socket.create_connection(addr, timeout=STALL)) for _ in range(count)]
+    time.sleep(0.3)
+    totals = []
+    stop = time.perf_counter() + SECONDS
+    threads = [threading.Thread(target=play, args=(player, seed, delta, stop, totals)) for seed, player in enumerate(players)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for player in players:
+        player.close()
+    time.sleep(0.3)
+    states, received, broken = (sum(column) for column in zip(*totals))
+    return states / SECONDS / count, received / SECONDS / count, broken
+
+def main():
+    addr = load_lab_module("lab-07", "server").ADDR
+    addr = (addr[0] or "127.0.0.1", addr[1])
+    server = start_lab_server("lab-07")
+    try:
+        if not wait_for_port(addr):
+            sys.exit("lab-07 server did not start")
+        print(f"> {SECONDS:.0f}s per run, bots change keys every {HOLD}s (some stand still)")
+        print(f"{'players':>8} {'mode':>6} {'states/s':>9} {'bytes/s per client':>19} {'bytes per state':>16} {'reduction':>10}")
+        for count in COUNTS:
+            full_states, full_bytes, _ = run(addr, count, False)
+            print(f"{count:>8} {'full':>6} {full_states:>9.1f} {full_bytes:>19.0f} {full_bytes / max(full_states, 1):>16.0f}")
+            delta_states, delta_bytes, broken = run(addr, count, True)
+            print(f"{count:>8} {'delta':>6} {delta_states:>9.1f} {delta_bytes:>19.0f} {delta_bytes / max(delta_states, 1):>16.0f} "
+                  f"{full_bytes / max(delta_bytes, 1):>9.1f}x" + (f"  {broken} delta(s) without a base" if broken else ""))
+    finally:
+        server.kill()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
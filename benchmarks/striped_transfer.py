@@ -0,0 +1,76 @@
+# striped_transfer.py
+# lab-06 file transfer through the relay split over 1, 2, 4 and 8 connections
+# usage: python striped_transfer.py [size in MB] [stripe counts]
+import hashlib
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import load_lab_module, start_lab_server, wait_for_port
+from common.framing import FramedSocket
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+COUNTS = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 2, 4, 8]
+ADDR = ("127.0.0.1", 8011)
+
+def digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def transfer(client, sender, receiver, count):              # seconds from the offer until the sender gets the ack
+    neigh = "{}:{}".format(*receiver.getsockname())
+    start = time.perf_counter()
+    sending = threading.Thread(target=client.send_striped, args=(sender, neigh, "input.bin", count))
+    sending.start()
+    _, origin, file_name, transfer_id, size, stripes = receiver.recv().decode().split(";")
+    client.receive_striped(receiver, origin, file_name, transfer_id, int(size), int(stripes))
+    ack = sender.recv().decode()
+    elapsed = time.perf_counter() - start
+    sending.join()
+    return elapsed, "successfully" in ack
+
+def main():
+    server = start_lab_server("lab-06", "--framed")
+    if not wait_for_port(ADDR):
+        sys.exit("lab-06 server did not start")
+    client = load_lab_module("lab-06", "client")
+    client.print_msg = lambda msg: None
+    client.ADDR = ADDR
+
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+    os.mkdir("files")
+    block = os.urandom(1024 * 1024)
+    with open("input.bin", "wb") as file:
+        for _ in range(SIZE_MB):
+            file.write(block)
+    expected = digest("input.bin")
+
+    sender = FramedSocket(socket.create_connection(ADDR))
+    receiver = FramedSocket(socket.create_connection(ADDR))
+    time.sleep(0.2)                                         # both registered with the server
+    print(f"> {SIZE_MB} MB file, {os.cpu_count()} CPU(s), lab-06 relay on {ADDR[0]}:{ADDR[1]}")
+    try:
+        baseline = None
+        for count in COUNTS:
+            elapsed, acked = transfer(client, sender, receiver, count)
+            baseline = baseline or elapsed
+            same = acked and digest("files/input.bin") == expected
+            print(f"> {count} stripe(s): {elapsed:6.2f}s  {SIZE_MB / elapsed:7.0f} MB/s  "
+                  f"speedup x{baseline / elapsed:4.2f}  file ok: {same}")
+    finally:
+        sender.close()
+        receiver.close()
+        server.kill()
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
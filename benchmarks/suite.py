@@ -0,0 +1,395 @@
+# suite.py
+# every lab server on the local loop: connections/s, messages/s, file MB/s, p50/p99 latency and RSS, saved as JSON
+# usage: python suite.py [labs] [--quick] [--in-process] [--json=results.json] [--baseline=baseline.json] [--tolerance=0.15]
+#
+# each lab is started with the flags in LABS (as a subprocess, or on a thread
+# of this process with --in-process) and driven by scripted clients, nothing
+# is typed. copy a results file to baseline.json and pass --baseline to see
+# what changed since: the exit status is 1 if any number got worse by more
+# than the tolerance.
+import io
+import itertools
+import json
+import os
+import platform
+import runpy
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import lab_path, load_lab_module, raise_fd_limit, rss_kb, start_lab_server, wait_for_port
+from common import filestream, gamewire
+from common.framing import FramedSocket
+
+ARGS = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+QUICK = "--quick" in sys.argv
+IN_PROCESS = "--in-process" in sys.argv
+JSON_PATH = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--json=")), "results.json")
+JSON_PATH = os.path.abspath(JSON_PATH)                      # --in-process changes into the lab folders
+BASELINE = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--baseline=")), None)
+BASELINE = BASELINE and os.path.abspath(BASELINE)
+TOLERANCE = float(next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--tolerance=")), 0.15))
+SCALE = 0.1 if QUICK else 1
+
+CONNECTIONS = int(500 * SCALE)
+ROUNDS = int(2000 * SCALE)                                  # round trips per client
+CLIENTS = 4
+FILE_MB = max(int(256 * SCALE), 8)
+TIMEOUT = 10                                                # a lab that stops answering fails instead of hanging the suite
+BIND_WAIT = 70                                              # seconds to keep retrying a server that cannot bind yet
+HIGHER_IS_BETTER = ("connections_per_sec", "messages_per_sec", "states_per_sec", "file_mb_per_sec")
+LOWER_IS_BETTER = ("latency_p50_ms", "latency_p99_ms", "connect_p50_ms", "connect_p99_ms", "login_p50_ms", "rss_kb")
+OUT = sys.stdout                                            # servers started in this process print to /dev/null
+
+def report(msg=""):
+    print(msg, file=OUT, flush=True)
+
+def local(addr):                                            # '' binds every interface, connect over the loop
+    return (addr[0] or "127.0.0.1", addr[1])
+
+def lab_addr(lab):
+    return local(load_lab_module(lab, "server").ADDR)
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+def latency(samples, name="latency"):                       # seconds -> p50/p99 in ms
+    return {f"{name}_p50_ms": percentile(samples, 0.5) * 1000, f"{name}_p99_ms": percentile(samples, 0.99) * 1000}
+
+class Server:
+    '''A lab server started for one run, as a subprocess or on a thread of this process'''
+
+    def __init__(self, lab, flags, addr, name="server"):
+        self.addr = addr
+        self.process = self.thread = None
+        deadline = time.time() + BIND_WAIT
+        while True:
+            self.start(lab, flags, name)
+            if self.wait():
+                break
+            self.stop()
+            if time.time() > deadline:
+                raise RuntimeError(f"{lab} server did not start")
+            time.sleep(1)                                   # port still in TIME_WAIT from the last run, servers without SO_REUSEADDR
+        time.sleep(0.2)
+
+    def start(self, lab, flags, name):
+        if not IN_PROCESS:
+            self.process = start_lab_server(lab, *flags, name=name)
+            return
+        argv = sys.argv
+        sys.argv = [lab_path(lab, f"{name}.py"), *flags]    # read by the server while it starts
+        if lab_path(lab) not in sys.path:
+            sys.path.insert(0, lab_path(lab))
+        os.chdir(lab_path(lab))                             # lab-05 writes into server/
+        self.thread = threading.Thread(target=runpy.run_path, args=(sys.argv[0],), kwargs={"run_name": "__main__"}, daemon=True)
+        self.thread.start()
+        self.wait()
+        sys.argv = argv
+
+    def running(self):
+        return self.process.poll() is None if self.process else self.thread.is_alive()
+
+    def wait(self, timeout=10):                             # True once the port accepts connections
+        deadline = time.time() + timeout
+        while time.time() < deadline and self.running():
+            if wait_for_port(self.addr, 0.1):
+                return True
+        return False
+
+    def rss(self):                                          # the whole process with --in-process
+        return rss_kb(self.process.pid if self.process else None)
+
+    def stop(self):                                         # a server thread runs until the suite exits
+        if self.process:
+            self.process.kill()
+            self.process.wait()
+
+def connect_rate(addr, hello=None, reply=False, count=None):   # connect (+ hello, + first reply) and close, one after the other
+    count = count or CONNECTIONS
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        began = time.perf_counter()
+        with socket.create_connection(addr, timeout=TIMEOUT) as sock:
+            if hello:
+                sock.sendall(hello(i))
+            if reply:
+                sock.recv(1024)
+            samples.append(time.perf_counter() - began)
+    return {"connections_per_sec": count / (time.perf_counter() - start), **latency(samples, "connect")}
+
+def round_trips(exchanges, rounds=None):                    # one thread per exchange() callable, each repeated rounds times
+    rounds = rounds or ROUNDS
+    samples = []
+
+    def run(exchange):
+        for _ in range(rounds):
+            began = time.perf_counter()
+            exchange()
+            samples.append(time.perf_counter() - began)
+
+    threads = [threading.Thread(target=run, args=(exchange,)) for exchange in exchanges]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"messages_per_sec": len(samples) / (time.perf_counter() - start), **latency(samples)}
+
+def framed(addr):
+    return FramedSocket(socket.create_connection(addr, timeout=TIMEOUT))
+
+def target(sock):
+    return "{}:{}".format(*sock.getsockname())
+
+def bench_lab02(server):                                    # greeting on connect, then closed
+    return connect_rate(server.addr, reply=True)
+
+def bench_lab03(server):                                    # every message is answered
+    result = connect_rate(server.addr)
+    clients = [framed(server.addr) for _ in range(CLIENTS)]
+
+    def exchange(client):
+        return lambda: (client.send(b"ping"), client.recv())
+
+    result.update(round_trips([exchange(client) for client in clients]))
+    for client in clients:
+        client.close()
+    return result
+
+def bench_lab04(server):                                    # sender -> server -> receiver, pairs of clients
+    result = connect_rate(server.addr)
+    pairs = [(framed(server.addr), framed(server.addr)) for _ in range(CLIENTS)]
+    time.sleep(0.2)
+
+    def exchange(sender, receiver):
+        msg = f"{target(receiver)}&ping&msg".encode()
+        return lambda: (sender.send(msg), receiver.recv())
+
+    result.update(round_trips([exchange(*pair) for pair in pairs]))
+    for pair in pairs:
+        for client in pair:
+            client.close()
+    return result
+
+def upload(client, name, path):                             # lab-05 file upload, answered with two acks
+    client.send(f"f;{name}".encode())
+    client.recv()
+    filestream.send_file(client, path)
+    client.recv()
+
+def bench_lab05(server, directory):
+    result = connect_rate(server.addr)
+    small, large = os.path.join(directory, "small.bin"), os.path.join(directory, "large.bin")
+    with open(small, "wb") as file:
+        file.write(os.urandom(1024))
+    client = framed(server.addr)
+    try:
+        result.update(latency(timed(lambda: upload(client, "bench_suite.bin", small), ROUNDS // 10)))
+        write_file(large, FILE_MB)
+        start = time.perf_counter()
+        upload(client, "bench_suite.bin", large)
+        result["file_mb_per_sec"] = FILE_MB / (time.perf_counter() - start)
+    finally:
+        client.close()
+        try:
+            os.remove(lab_path("lab-05", "server", "bench_suite.bin"))
+        except OSError:
+            pass
+    return result
+
+def bench_lab06(server, directory):                         # messages and a file relayed between two clients
+    result = connect_rate(server.addr)
+    sender, receiver = framed(server.addr), framed(server.addr)
+    time.sleep(0.2)
+    neigh = target(receiver)
+    result.update(round_trips([lambda: (sender.send(f"w;{neigh};ping".encode()), receiver.recv())]))
+    large = os.path.join(directory, "large.bin")
+    write_file(large, FILE_MB)
+
+    def receive():
+        receiver.recv()                                     # f;sender;name;size
+        while receiver.recv() not in (b"EOF", b""):
+            pass
+
+    receiving = threading.Thread(target=receive)
+    receiving.start()
+    start = time.perf_counter()
+    sender.send(f"f;{neigh};large.bin;{FILE_MB << 20}".encode())
+    with open(large, "rb") as file:
+        for data in iter(lambda: file.read(filestream.CHUNK_SIZE), b""):
+            sender.send(data)
+    sender.send(b"EOF")
+    receiving.join()
+    result["file_mb_per_sec"] = FILE_MB / (time.perf_counter() - start)
+    sender.close()
+    receiver.close()
+    return result
+
+def game_input():
+    return gamewire.encode_input({"right": True, "down": True})   # acks nothing, every state is a full snapshot
+
+def game_traffic(players, seconds):                         # every player sends inputs and reads what came back, game states per second
+    data = game_input()
+    received = [0] * len(players)
+    stop = time.perf_counter() + seconds
+
+    def play(i, player):
+        while time.perf_counter() < stop:
+            player.send(data)
+            received[i] += len(player.recv_many())
+
+    threads = [threading.Thread(target=play, args=(i, player)) for i, player in enumerate(players)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(received) / seconds
+
+def game_round_trips(player):                               # one player alone: input -> next game state
+    data = game_input()
+    return round_trips([lambda: (player.send(data), player.recv())], ROUNDS // 4)
+
+def bench_lab07(server):                                    # players send inputs and get game states back
+    result = connect_rate(server.addr, count=CONNECTIONS // 5)
+    players = [framed(server.addr)]
+    time.sleep(0.2)
+    result.update(game_round_trips(players[0]))
+    players += [framed(server.addr) for _ in range(CLIENTS - 1)]
+    time.sleep(0.2)
+    result["states_per_sec"] = game_traffic(players, 2 * SCALE + 1)
+    for player in players:
+        player.close()
+    return result
+
+def lab08_login(addr, mac):                                 # register, pay and log in, returns the connection
+    client = framed(addr)
+    for msg in (f"REGISTER/{mac}", f"PAY/{mac}/1000", f"LOGIN/{mac}"):
+        client.send(gamewire.encode_text(msg))
+        client.recv()
+    return client
+
+def bench_lab08(server):
+    result = connect_rate(server.addr, count=CONNECTIONS // 5)
+    stamp = int(time.time())
+    macs = (f"bench-{stamp}-{i}" for i in itertools.count())
+    samples = timed(lambda: lab08_login(server.addr, next(macs)).close(), 20)
+    result["login_p50_ms"] = percentile(samples, 0.5) * 1000
+    time.sleep(1)                                           # the logged in clients above are gone, so the next ones get to play
+    players = [lab08_login(server.addr, next(macs))]
+    time.sleep(0.3)
+    result.update(game_round_trips(players[0]))
+    players.append(lab08_login(server.addr, next(macs)))    # MAX_PLAYERS
+    time.sleep(0.3)
+    result["states_per_sec"] = game_traffic(players, 2 * SCALE + 1)
+    for player in players:
+        player.close()
+    return result
+
+def bench_exam1(server):                                    # connect and send an id, no answer
+    stamp = int(time.time())
+    return connect_rate(server.addr, hello=lambda i: f"bench-{stamp}-{i}".encode())
+
+def bench_exam2(server):
+    return connect_rate(server.addr, hello=lambda i: f"bench-{i}".encode())
+
+def timed(call, count):
+    samples = []
+    for _ in range(count):
+        began = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - began)
+    return samples
+
+def write_file(path, size_mb):
+    if os.path.exists(path):
+        return
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as file:
+        for _ in range(size_mb):
+            file.write(block)
+
+# lab -> (server flags, address to connect to, benchmark)
+LABS = {
+    "lab-02": ([], lambda: ("127.0.0.1", 8005), bench_lab02),
+    "lab-03": (["--selectors", "--framed"], lambda: lab_addr("lab-03"), bench_lab03),
+    "lab-04": (["--framed"], lambda: lab_addr("lab-04"), bench_lab04),
+    "lab-05": (["--stream"], lambda: lab_addr("lab-05"), bench_lab05),
+    "lab-06": (["--framed"], lambda: lab_addr("lab-06"), bench_lab06),
+    "lab-07": ([], lambda: lab_addr("lab-07"), bench_lab07),
+    "lab-08": ([], lambda: lab_addr("lab-08"), bench_lab08),
+    "lab-exam/Question-1": ([], lambda: ("127.0.0.1", 4002), bench_exam1),
+    "lab-exam/Question-2": ([], lambda: ("127.0.0.1", 9101), bench_exam2),
+}
+
+def run_lab(lab, directory):
+    flags, addr, bench = LABS[lab]
+    server = Server(lab, flags, addr())
+    try:
+        if bench in (bench_lab05, bench_lab06):
+            result = bench(server, directory)
+        else:
+            result = bench(server)
+        result["rss_kb"] = server.rss()
+        return result
+    finally:
+        server.stop()
+
+def compare(results, baseline):                             # prints the changes, returns the number of regressions
+    regressions = 0
+    report(f"\n> compared with {BASELINE} (tolerance {TOLERANCE:.0%})")
+    if (baseline.get("mode"), baseline.get("quick")) != ("in-process" if IN_PROCESS else "subprocess", QUICK):
+        report(f"> the baseline was a {baseline.get('mode')} run{' with --quick' if baseline.get('quick') else ''}, numbers may not be comparable")
+    for lab, metrics in results.items():
+        for name, value in metrics.items():
+            old = baseline.get("results", {}).get(lab, {}).get(name)
+            if not old:
+                continue
+            change = (value - old) / old
+            worse = -change if name in HIGHER_IS_BETTER else change if name in LOWER_IS_BETTER else 0
+            flag = "REGRESSION" if worse > TOLERANCE else ""
+            regressions += bool(flag)
+            report(f"  {lab:20s} {name:20s} {old:12.2f} -> {value:12.2f}  {change:+7.1%}  {flag}")
+    return regressions
+
+def main():
+    global OUT
+    raise_fd_limit()
+    labs = [lab for lab in LABS if not ARGS or any(lab.startswith(arg.rstrip("/")) for arg in ARGS)]
+    if IN_PROCESS:
+        sys.stdin = io.StringIO()                           # server prompts give up instead of waiting
+        sys.stdout = sys.stderr = open(os.devnull, "w")
+    directory = tempfile.mkdtemp()
+    results = {}
+    report(f"> {len(labs)} labs, {'in-process' if IN_PROCESS else 'subprocess'} servers, {os.cpu_count()} CPU(s)")
+    for lab in labs:
+        try:
+            results[lab] = run_lab(lab, directory)
+        except (OSError, RuntimeError, ValueError) as e:
+            report(f"> {lab:20s} failed: {e!r}")
+            continue
+        report(f"> {lab:20s} " + "  ".join(f"{name} {value:.1f}" for name, value in results[lab].items()))
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+    document = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                "cpus": os.cpu_count(), "mode": "in-process" if IN_PROCESS else "subprocess",
+                "quick": QUICK, "results": results}
+    with open(JSON_PATH, "w") as file:
+        json.dump(document, file, indent=2)
+    report(f"> results written to {JSON_PATH}")
+    if BASELINE:
+        with open(BASELINE) as file:
+            regressions = compare(results, json.load(file))
+        if regressions:
+            report(f"> {regressions} regression(s)")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# udp_loss.py
+# lab-07 state delivery over UDP with datagrams dropped and delayed by the shim on both sides, TCP on a clean loopback for reference
+# usage: python udp_loss.py [loss rates] [latency ms] [players] [seconds]
+import os
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench_utils import load_lab_module, start_lab_server, wait_for_port
+from common import gamewire
+from common.datagram import DatagramClient
+from common.framing import FramedSocket
+from common.snapshot import SnapshotBuffer
+
+LOSSES = [float(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [0, 0.05, 0.2]
+LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 20  # ms one way, plus up to half as much jitter
+PLAYERS = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+SECONDS = float(sys.argv[4]) if len(sys.argv) > 4 else 4
+MOVES = [{}, {"left": True}, {"right": True}, {"up": True}, {"down": True}]
+HOLD = 0.5
+
+def play(player, seed, stop, totals):                       # send an input, apply whatever state came back, like the client
+    moves = random.Random(seed)
+    snapshots = SnapshotBuffer()
+    gaps, broken, last = [], 0, None
+    keys, next_move = {}, 0
+    while time.perf_counter() < stop:
+        if time.perf_counter() >= next_move:
+            keys, next_move = moves.choice(MOVES), time.perf_counter() + HOLD
+        player.send(gamewire.encode_input(keys, snapshots.latest))
+        try:
+            data = player.recv(65536)
+        except socket.timeout:
+            continue
+        if not data:
+            break
+        kind, msg = gamewire.decode(data)
+        if kind != gamewire.SNAPSHOT:
+            continue
+        now = time.perf_counter()
+        if last is not None:
+            gaps.append(now - last)
+        last = now
+        if snapshots.apply(msg) is None:
+            broken += 1
+    totals.append((gaps, broken, getattr(player, "stale", 0)))
+
+def run(players):
+    totals = []
+    stop = time.perf_counter() + SECONDS
+    threads = [threading.Thread(target=play, args=(player, seed, stop, totals)) for seed, player in enumerate(players)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for player in players:
+        player.close()
+    gaps = sorted(gap for player_gaps, _, _ in totals for gap in player_gaps)
+    broken = sum(player_broken for _, player_broken, _ in totals)
+    stale = sum(player_stale for _, _, player_stale in totals)
+    return len(gaps) / SECONDS / len(players), gaps, broken, stale
+
+def report(mode, loss, states, gaps, broken, stale):
+    p50 = statistics.median(gaps) * 1000 if gaps else 0
+    p99 = gaps[int(len(gaps) * 0.99)] * 1000 if gaps else 0
+    print(f"{mode:>5} {loss:>6.0%} {states:>9.1f} {p50:>12.1f} {p99:>12.1f} {max(gaps, default=0) * 1000:>12.1f} {stale:>6} {broken:>8}")
+
+def main():
+    addr = load_lab_module("lab-07", "server").ADDR
+    addr = (addr[0] or "127.0.0.1", addr[1])
+    shim = ["--latency=%g" % LATENCY, "--jitter=%g" % (LATENCY / 2)]
+    print(f"> {PLAYERS} players, {SECONDS:.0f}s per run, UDP with {LATENCY:g} ms +0-{LATENCY / 2:g} ms each way, TCP undisturbed")
+    print(f"{'mode':>5} {'loss':>6} {'states/s':>9} {'gap p50 ms':>12} {'gap p99 ms':>12} {'gap max ms':>12} {'stale':>6} {'no base':>8}")
+
+    server = start_lab_server("lab-07")
+    try:
+        if not wait_for_port(addr):
+            sys.exit("lab-07 server did not start")
+        report("tcp", 0, *run([FramedSocket(socket.create_connection(addr, timeout=1)) for _ in range(PLAYERS)]))
+    finally:
+        server.kill()
+        server.wait()
+
+    for loss in LOSSES:                                     # the server drops and delays what it sends the same way
+        options = shim + ["--loss=%g" % loss]
+        server = start_lab_server("lab-07", "--udp", *options)
+        try:
+            if not wait_for_port(addr):
+                sys.exit("lab-07 server did not start")
+            players = [DatagramClient(addr, loss=loss, latency=LATENCY / 1000, jitter=LATENCY / 2000) for _ in range(PLAYERS)]
+            for player in players:
+                player.connect()
+            report("udp", loss, *run(players))
+        finally:
+            server.kill()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
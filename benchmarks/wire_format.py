@@ -0,0 +1,61 @@
+# wire_format.py
+# encode/decode time and bytes per game message, pickle vs the gamewire binary format
+# usage: python wire_format.py [player counts]
+import os
+import pickle
+import random
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import gamewire
+from common.snapshot import SnapshotHistory
+
+COUNTS = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [2, 8, 32]
+COINS = 10
+WIDTH, HEIGHT = 600, 400
+
+def game_state(players):
+    return {
+        'players': {i: (float(random.randint(0, WIDTH)), float(random.randint(0, HEIGHT))) for i in range(players)},
+        'player_scores': {i: random.randint(0, 9) for i in range(players)},
+        'coins': [(random.randint(0, WIDTH), random.randint(0, HEIGHT)) for _ in range(COINS)],
+        'color': {i: tuple(random.randint(10, 255) for _ in range(3)) for i in range(players)},
+    }
+
+def measure(value, encode, decode):                         # (encode us, decode us, bytes)
+    data = encode(value)
+    number = 2000
+    encode_us = min(timeit.repeat(lambda: encode(value), number=number, repeat=3)) / number * 1e6
+    decode_us = min(timeit.repeat(lambda: decode(data), number=number, repeat=3)) / number * 1e6
+    return encode_us, decode_us, len(data)
+
+def row(name, value, wire_value, wire_encode):
+    pickled = measure(value, pickle.dumps, pickle.loads)
+    wire = measure(wire_value, wire_encode, gamewire.decode)
+    print(f"{name:<22} {pickled[0]:>9.2f} {pickled[1]:>9.2f} {pickled[2]:>7} {wire[0]:>9.2f} {wire[1]:>9.2f} {wire[2]:>7} {pickled[2] / wire[2]:>6.1f}x")
+
+def main():
+    random.seed(1)
+    print(f"{'':<22} {'pickle':^27} {'gamewire':^27}")
+    print(f"{'message':<22} {'enc us':>9} {'dec us':>9} {'bytes':>7} {'enc us':>9} {'dec us':>9} {'bytes':>7} {'size':>7}")
+    keys = {"left": False, "right": True, "up": False, "down": True}
+    row("input", keys, keys, gamewire.encode_input)
+    row("input + ack + seq", {**keys, "ack": 1234, "seq": 5678}, keys, lambda keys: gamewire.encode_input(keys, 1234, 5678))
+    for count in COUNTS:
+        state = game_state(count)
+        history = SnapshotHistory(lambda message: message)
+        history.record(state)
+        full = history.message(0)
+        for player in range(count):                         # everyone moves, one coin is collected
+            x, y = state['players'][player]
+            state['players'][player] = (x + 3, y)
+        state['coins'][0] = (1, 1)
+        state['player_scores'][0] += 1
+        history.record(state)
+        delta = history.message(1)
+        row(f"full state, {count} players", state, full, gamewire.encode_snapshot)
+        row(f"delta, {count} players", delta, delta, gamewire.encode_snapshot)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# coingrid.py
+# uniform grid over the coins so a player step only tests the coins near it
+#
+# the map is cut into CELL x CELL squares and every coin slot is listed in
+# the cell of its top left corner. a square at (x, y) can only touch coins
+# whose corner lies between (x - coin size, y - coin size) and its own bottom
+# right corner, so a step looks at the few cells that range covers whatever
+# the number of coins. the grid shares the coin list of the game state: a
+# respawned coin is written to its slot and moved to its new cell, nothing is
+# rebuilt.
+CELL = 64                                                   # pixels, a few player sizes
+
+class CoinGrid:
+    '''Coin slots by grid cell, over the (x, y) list of game_state['coins']'''
+
+    def __init__(self, coins, coin_size, cell=CELL):
+        self.coins = coins                                  # changed in place by move()
+        self.coin_size = coin_size
+        self.cell = cell
+        self.cells = {}                                     # (column, row) -> set of coin slots
+        for slot, (x, y) in enumerate(coins):
+            self.cells.setdefault(self.key(x, y), set()).add(slot)
+
+    def key(self, x, y):
+        return int(x) // self.cell, int(y) // self.cell
+
+    def move(self, slot, x, y):                             # respawn a coin somewhere else
+        old = self.key(*self.coins[slot])
+        cell = self.cells[old]
+        cell.discard(slot)
+        if not cell:
+            del self.cells[old]
+        self.coins[slot] = (x, y)
+        self.cells.setdefault(self.key(x, y), set()).add(slot)
+
+    def inside(self, left, top, right, bottom):             # slots of the coins with their top left corner in the box
+        first_column, first_row = self.key(left, top)
+        last_column, last_row = self.key(right, bottom)
+        slots = []
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                for slot in self.cells.get((column, row), ()):
+                    x, y = self.coins[slot]
+                    if left <= x <= right and top <= y <= bottom:
+                        slots.append(slot)
+        return slots
+
+    def touching(self, x, y, size):                         # slots of the coins a size x size square at (x, y) overlaps
+        coin_size = self.coin_size
+        left, top = self.key(x - coin_size, y - coin_size)
+        right, bottom = self.key(x + size, y + size)
+        slots = []
+        for column in range(left, right + 1):
+            for row in range(top, bottom + 1):
+                for slot in self.cells.get((column, row), ()):
+                    coin_x, coin_y = self.coins[slot]
+                    if x < coin_x + coin_size and x + size > coin_x and y < coin_y + coin_size and y + size > coin_y:
+                        slots.append(slot)
+        return slots
@@ -0,0 +1,86 @@
+# compress.py
+# streaming compression for file transfers, codec agreed on by both sides
+#
+# each side lists the codecs it supports, the intersection (in the order of
+# the side that asked) is what either side may use. for every file the sender
+# picks the first agreed codec, or none at all when the file is already
+# compressed (known extension, or a quick zlib pass over the first 64 KB
+# barely shrinks it). the file is read, compressed and sent one chunk at a
+# time as frames, the receiver decompresses each frame as it arrives, so
+# neither side holds more than a chunk in memory.
+import bz2
+import lzma
+import os
+import zlib
+
+from common.framing import FramedSocket, encode_frame
+
+CODECS = {
+    "zlib": (lambda: zlib.compressobj(6), zlib.decompressobj),
+    "lzma": (lambda: lzma.LZMACompressor(preset=1), lzma.LZMADecompressor),
+    "bz2": (lambda: bz2.BZ2Compressor(9), bz2.BZ2Decompressor),
+}
+PREFERENCE = ["zlib", "lzma", "bz2"]                        # fast first, the ratio gain of the others is rarely worth it
+COMPRESSED_TYPES = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".mp4", ".mkv", ".avi", ".mov", ".webm", ".mp3", ".aac", ".ogg", ".flac",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".zst",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp", ".jar", ".apk",
+}
+SAMPLE_SIZE = 64 * 1024
+MIN_SAVING = 0.1                                            # skip compression if the sample shrinks by less than 10%
+CHUNK_SIZE = 1024 * 1024
+
+def agree(ours, theirs):                                    # codecs both sides support, in our order
+    return [name for name in ours if name in theirs and name in CODECS]
+
+def choose(path, agreed):                                   # codec for this file, None to send it as it is
+    if not agreed or os.path.splitext(path)[1].lower() in COMPRESSED_TYPES:
+        return None
+    with open(path, "rb") as file:
+        sample = file.read(SAMPLE_SIZE)
+    if len(zlib.compress(sample, 1)) > len(sample) * (1 - MIN_SAVING):
+        return None
+    return agreed[0]
+
+def send_stream(sock, path, codec):                         # compressed frames of the file, returns the wire bytes
+    compressor = CODECS[codec][0]()
+    raw = sock.sock if isinstance(sock, FramedSocket) else sock
+    wire = 0
+    with sock.send_lock, open(path, "rb") as file:          # the frames of one file must not be interleaved
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            data = compressor.compress(chunk) if chunk else compressor.flush()
+            if data:                                        # lzma and bz2 buffer a lot before they output anything
+                raw.sendall(encode_frame(data))
+                wire += len(data)
+            if not chunk:
+                return wire
+
+def decompress(decompressor, data):                         # output in pieces of at most CHUNK_SIZE, a small frame can expand a lot
+    out = decompressor.decompress(data, CHUNK_SIZE)
+    if hasattr(decompressor, "needs_input"):                # lzma, bz2
+        while True:
+            if out:
+                yield out
+            if decompressor.eof or decompressor.needs_input:
+                return
+            out = decompressor.decompress(b"", CHUNK_SIZE)
+    while out:                                              # zlib keeps the input it did not get to in unconsumed_tail
+        yield out
+        if len(out) < CHUNK_SIZE and not decompressor.unconsumed_tail:
+            return
+        out = decompressor.decompress(decompressor.unconsumed_tail, CHUNK_SIZE)
+
+def recv_stream(sock, path, codec):                         # until the end of the compressed stream, returns (size, wire bytes)
+    decompressor = CODECS[codec][1]()
+    size = wire = 0
+    with open(path, "wb", buffering=0) as file:
+        while not decompressor.eof:
+            data = sock.recv()
+            if not data:
+                raise ConnectionError("connection closed during compressed transfer")
+            wire += len(data)
+            for out in decompress(decompressor, data):
+                size += file.write(out)
+    return size, wire
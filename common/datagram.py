@@ -0,0 +1,226 @@
+# datagram.py
+# game inputs and states over UDP: handshake, sequence numbers, newest state wins
+#
+# every datagram starts with PACKET: its kind, the session and a sequence
+# number that goes up by one per datagram in each direction. a client sends
+# HELLO (with a token, lab-08 uses the MAC it logged in with over TCP) until
+# the server answers WELCOME with the session, either of them may be lost. a
+# state (a gamewire snapshot or winner) is never resent: the receiver drops
+# any state older than the newest it has, and a lost delta is covered by the
+# next one because the server diffs against the last snapshot the client
+# acked. an INPUTS datagram repeats the last REDUNDANCY inputs with their own
+# numbers, so an input lost on the way arrives with the next datagram, and
+# the server takes the ones it has not seen yet in order. the server sends no
+# state until an INPUTS datagram came back with the session (the client sends
+# an empty one right after WELCOME): a HELLO from a forged address only ever
+# gets a WELCOME as small as itself, and such a session is dropped after
+# HANDSHAKE seconds. a session that is silent for TIMEOUT seconds is dropped,
+# BYE ends it early. a state that does not fit a datagram is dropped and
+# reported once per session. Shim drops and
+# delays outgoing datagrams (--loss, --latency, --jitter) to try all of this
+# on loopback.
+import heapq
+import itertools
+import random
+import socket
+import struct
+import threading
+import time
+
+HELLO, WELCOME, INPUTS, STATE, BYE = 1, 2, 3, 4, 5
+PACKET = struct.Struct("!BHI")                              # kind, session, seq
+ENTRY = struct.Struct("!IB")                                # input seq, length, then the input
+REDUNDANCY = 3                                              # inputs repeated in every INPUTS datagram
+HELLO_EVERY = 0.2                                           # seconds between HELLOs until WELCOME
+TIMEOUT = 5.0                                               # seconds of silence before a session is dropped
+HANDSHAKE = 2.0                                             # seconds for a session to send its first INPUTS
+MAX_DATAGRAM = 65507
+
+def pack(kind, session, seq, payload=b""):
+    return PACKET.pack(kind, session, seq) + payload
+
+def unpack(data):                                           # (kind, session, seq, payload), ValueError if too short
+    if len(data) < PACKET.size:
+        raise ValueError("datagram too short")
+    kind, session, seq = PACKET.unpack_from(data)
+    return kind, session, seq, data[PACKET.size:]
+
+def pack_inputs(entries):                                   # [(seq, input)] -> payload
+    return b"".join(ENTRY.pack(seq, len(data)) + data for seq, data in entries)
+
+def unpack_inputs(payload):                                 # payload -> [(seq, input)], oldest first
+    entries, offset = [], 0
+    while offset + ENTRY.size <= len(payload):
+        seq, length = ENTRY.unpack_from(payload, offset)
+        offset += ENTRY.size
+        entries.append((seq, payload[offset:offset + length]))
+        offset += length
+    return entries
+
+def shim_options(argv):                                     # --loss=P --latency=MS --jitter=MS -> Shim keyword arguments
+    options = {}
+    for arg in argv:
+        name, _, value = arg.partition("=")
+        if name == "--loss":
+            options["loss"] = float(value)
+        elif name in ("--latency", "--jitter"):
+            options[name[2:]] = float(value) / 1000
+    return options
+
+class Shim:
+    '''sendto() of a UDP socket with artificial loss and one-way latency, for testing on loopback'''
+
+    def __init__(self, sock, loss=0.0, latency=0.0, jitter=0.0):
+        self.sock = sock
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter                                # extra random delay, datagrams may arrive out of order
+        self.dropped = 0
+        self.pending = []                                   # heap of (due, order, data, addr)
+        self.order = itertools.count()
+        self.ready = threading.Condition()
+        if latency or jitter:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def sendto(self, data, addr):
+        if self.loss and random.random() < self.loss:
+            self.dropped += 1
+            return len(data)
+        if not (self.latency or self.jitter):
+            return self.sock.sendto(data, addr)
+        due = time.monotonic() + self.latency + random.uniform(0, self.jitter)
+        with self.ready:
+            heapq.heappush(self.pending, (due, next(self.order), data, addr))
+            self.ready.notify()
+        return len(data)
+
+    def run(self):
+        while True:
+            with self.ready:
+                while not self.pending or self.pending[0][0] > time.monotonic():
+                    self.ready.wait(self.pending[0][0] - time.monotonic() if self.pending else None)
+                _, _, data, addr = heapq.heappop(self.pending)
+            try:
+                self.sock.sendto(data, addr)
+            except OSError:
+                pass
+
+class Peer:
+    '''Server side of one client session, every send is a single STATE datagram'''
+
+    framed = False                                          # like an OutboundQueue over a plain socket
+
+    def __init__(self, endpoint, addr, session):
+        self.endpoint = endpoint
+        self.addr = addr
+        self.session = session
+        self.seq = 0                                        # of the last datagram sent
+        self.last_input = 0                                 # newest input taken, older copies are ignored
+        self.seen = time.monotonic()
+        self.confirmed = False                              # an INPUTS datagram came back, addr really is the client
+        self.oversized = False                              # a state too big for a datagram was reported
+        self.closed = False
+
+    def encode(self, data):
+        return data
+
+    def send_encoded(self, data, timeout=None):             # same as OutboundQueue.send_encoded, never blocks
+        if self.closed:
+            raise BrokenPipeError("session is closed")
+        if not self.confirmed:
+            return 0
+        if len(data) + PACKET.size > MAX_DATAGRAM:
+            if not self.oversized:
+                self.oversized = True
+                print(f"> [UDP] a {len(data)} byte state does not fit a datagram, {self.addr[0]}:{self.addr[1]} gets none that big")
+            return 0
+        self.seq += 1
+        return self.endpoint.sendto(pack(STATE, self.session, self.seq, data), self.addr)
+
+    send = send_encoded
+
+    def welcome(self):
+        self.seq += 1
+        self.endpoint.sendto(pack(WELCOME, self.session, self.seq), self.addr)
+
+    def take_inputs(self, payload):                         # the inputs of an INPUTS datagram not seen yet, oldest first
+        self.seen = time.monotonic()
+        self.confirmed = True
+        entries = unpack_inputs(payload)
+        fresh = [data for seq, data in entries if seq > self.last_input]
+        self.last_input = max([self.last_input] + [seq for seq, _ in entries])
+        return fresh
+
+    def expired(self, now):
+        return now - self.seen > (TIMEOUT if self.confirmed else HANDSHAKE)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.endpoint.sendto(pack(BYE, self.session, self.seq + 1), self.addr)
+
+class DatagramClient:
+    '''Client side: send() an input, recv() the newest state, like a socket for the game loop'''
+
+    def __init__(self, addr, token=b"", recv_timeout=0.1, **shim):
+        self.addr = addr
+        self.token = token
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.settimeout(recv_timeout)                  # recv() gives up after this, the loop keeps sending inputs
+        self.endpoint = Shim(self.sock, **shim)
+        self.session = None
+        self.seq = 0                                        # of the last datagram sent
+        self.input_seq = 0
+        self.recent = []                                    # last REDUNDANCY (seq, input) sent
+        self.newest = 0                                     # seq of the newest state received
+        self.stale = 0                                      # states that arrived after a newer one and were dropped
+
+    def connect(self, timeout=5.0):                         # HELLO until WELCOME, returns the session
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.seq += 1
+            self.endpoint.sendto(pack(HELLO, 0, self.seq, self.token), self.addr)
+            try:
+                data = self.sock.recv(MAX_DATAGRAM)
+            except socket.timeout:
+                time.sleep(HELLO_EVERY)
+                continue
+            kind, session, seq, _ = unpack(data)
+            if kind == WELCOME:
+                self.session = session
+                self.newest = seq
+                self.seq += 1                               # no inputs yet, this lets the server send states
+                self.endpoint.sendto(pack(INPUTS, session, self.seq), self.addr)
+                return session
+        raise ConnectionError(f"no WELCOME from {self.addr[0]}:{self.addr[1]}")
+
+    def send(self, data):                                   # one input, sent with the ones before it
+        self.input_seq += 1
+        self.recent = (self.recent + [(self.input_seq, data)])[-REDUNDANCY:]
+        self.seq += 1
+        return self.endpoint.sendto(pack(INPUTS, self.session, self.seq, pack_inputs(self.recent)), self.addr)
+
+    def recv(self, size=None):                              # newest state, b'' once the server said BYE, socket.timeout if none came
+        while True:
+            data = self.sock.recv(MAX_DATAGRAM)
+            try:
+                kind, session, seq, payload = unpack(data)
+            except ValueError:
+                continue
+            if session != self.session:
+                continue
+            if kind == BYE:
+                return b""
+            if kind != STATE:
+                continue
+            if seq <= self.newest:                          # an older state overtaken by a newer one
+                self.stale += 1
+                continue
+            self.newest = seq
+            return payload
+
+    def close(self):
+        if self.session is not None:
+            self.seq += 1
+            self.endpoint.sendto(pack(BYE, self.session, self.seq), self.addr)
+        self.sock.close()
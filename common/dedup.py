@@ -0,0 +1,136 @@
+# dedup.py
+# content-defined chunking and a chunk store, so a file that was sent before
+# only costs the chunks that changed
+#
+# every byte is mapped to one bit (TABLE) and a chunk ends where the bits of
+# the last 16 bytes spell PATTERN, which makes the boundaries depend on the
+# content around them instead of on offsets: an insert or edit only changes
+# the chunks it touches, the rest line up again right after it. translate()
+# and find() do the scanning in C, a python loop over a rolling hash would be
+# about 40 times slower. chunks are named by their blake2b digest.
+#
+# protocol: the sender offers the list of digests (the manifest), the receiver
+# answers with the indices of chunks it does not have, the sender sends those
+# chunks as frames in that order and the receiver rebuilds the file from its
+# store.
+import hashlib
+import os
+import random
+
+from common.framing import FramedSocket, encode_frames
+
+MIN_CHUNK = 16 * 1024
+MAX_CHUNK = 256 * 1024                                      # average is about MIN_CHUNK + 64 KB
+PATTERN = b"0110100111010001"                               # 16 bits, one in 65536 positions matches
+TABLE = bytes(b"01"[bit] for bit in random.Random(0x6c6162).choices((0, 1), k=256))
+DIGEST_SIZE = 16
+READ_SIZE = 8 * 1024 * 1024
+BATCH_SIZE = 4 * 1024 * 1024                                # chunk bytes per sendall
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest()
+
+def cut_points(data, final):                                # chunk lengths in data, the tail is left if more may follow
+    bits = data.translate(TABLE)
+    start, end = 0, len(data)
+    lengths = []
+    while start < end:
+        match = bits.find(PATTERN, start + MIN_CHUNK - len(PATTERN), start + MAX_CHUNK)
+        if match >= 0:
+            cut = match + len(PATTERN)
+        elif start + MAX_CHUNK <= end:
+            cut = start + MAX_CHUNK
+        elif final:
+            cut = end
+        else:
+            break
+        lengths.append(cut - start)
+        start = cut
+    return lengths
+
+def chunk_file(path):                                       # [(offset, length, digest)] covering the whole file
+    chunks = []
+    offset = 0
+    tail = b""
+    with open(path, "rb") as file:
+        while True:
+            block = file.read(READ_SIZE)
+            data = tail + block
+            view = memoryview(data)
+            start = 0
+            for length in cut_points(data, final=not block):
+                chunks.append((offset, length, digest(view[start:start + length])))
+                offset += length
+                start += length
+            tail = data[start:]
+            if not block:
+                return chunks
+
+def encode_manifest(chunks):
+    return ",".join(chunk[2] for chunk in chunks)
+
+def decode_manifest(text):
+    return text.split(",") if text else []
+
+class ChunkStore:
+    '''Chunks received so far, one file per digest'''
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name[:2], name)
+
+    def has(self, name):
+        return os.path.exists(self.path(name))
+
+    def missing(self, digests):                             # index of the first use of every chunk we do not have
+        wanted, seen = [], set()
+        for i, name in enumerate(digests):
+            if name not in seen and not self.has(name):
+                wanted.append(i)
+            seen.add(name)
+        return wanted
+
+    def put(self, name, data):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as file:
+            file.write(data)
+        os.replace(tmp, path)                               # a chunk is either complete or not there
+
+    def assemble(self, digests, path):                      # write the file out of the store, returns its size
+        size = 0
+        with open(path, "wb") as out:
+            for name in digests:
+                with open(self.path(name), "rb") as file:
+                    size += out.write(file.read())
+        return size
+
+def send_chunks(sock, path, chunks):                        # chunk frames in order, returns the bytes sent
+    raw = sock.sock if isinstance(sock, FramedSocket) else sock
+    sent = 0
+    with sock.send_lock, open(path, "rb") as file:          # no other frame may end up between the chunks
+        batch, batch_size = [], 0
+        for offset, length, _ in chunks:
+            batch.append(os.pread(file.fileno(), length, offset))
+            batch_size += length
+            if batch_size >= BATCH_SIZE:
+                raw.sendall(encode_frames(batch))
+                sent += batch_size
+                batch, batch_size = [], 0
+        if batch:
+            raw.sendall(encode_frames(batch))
+            sent += batch_size
+    return sent
+
+def recv_chunks(sock, store, digests):                      # one frame per digest, each checked before it is stored
+    for name in digests:
+        data = sock.recv()
+        if not data:
+            raise ConnectionError("connection closed during chunk transfer")
+        if digest(data) != name:
+            raise ValueError(f"chunk {name} does not match its digest")
+        store.put(name, data)
\ No newline at end of file
@@ -0,0 +1,238 @@
+# entities.py
+# players and coins of the game as columns of numbers, moved and checked all at once
+#
+# every player is a slot in a set of arrays (x, y, score, color, held keys)
+# instead of a tuple in a dict per field, and one tick moves, clamps and
+# checks all of them together. with numpy the whole tick is a few array
+# operations: players move by keys * distance and are clipped to the map,
+# and player/coin overlaps are found by sorting the coins by grid cell and
+# looking up the cells every player can reach (searchsorted), then testing
+# only those pairs. a coin touched by several players goes to the lowest
+# slot. without numpy the same store keeps array('f') columns and loops over
+# the players, with a CoinGrid for the coins. game_state() gives the dict the
+# snapshots and the clients use.
+import random
+from array import array
+
+from common.coingrid import CELL, CoinGrid
+
+try:
+    import numpy as np
+except ImportError:                                         # array('f') columns, one player at a time
+    np = None
+
+def keys_of(input_data):                                    # (dx, dy) of the arrow keys held, each -1, 0 or 1
+    return (bool(input_data['right']) - bool(input_data['left']),
+            bool(input_data['down']) - bool(input_data['up']))
+
+def move(x, y, keys, distance, max_x, max_y):              # one step with the keys (dx, dy) held, clamped to the map
+    return max(0, min(x + keys[0] * distance, max_x)), max(0, min(y + keys[1] * distance, max_y))
+
+class EntityStore:
+    '''Players and coins in array columns, a player is the same slot in every column'''
+
+    FREE = None                                             # player id of a free slot
+
+    def __init__(self, width, height, player_size, coin_size, coin_count):
+        self.width, self.height = width, height
+        self.player_size, self.coin_size = player_size, coin_size
+        self.slots = {}                                     # player_id -> slot
+        self.ids = []                                       # slot -> player_id, None when free
+        self.free = []
+        self.x, self.y = array('f'), array('f')
+        self.score = array('i')
+        self.move_x, self.move_y = array('b'), array('b')
+        self.color = []
+        self.coins = [self.random_coin() for _ in range(coin_count)]
+        self.coin_grid = CoinGrid(self.coins, coin_size)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, player_id):
+        return player_id in self.slots
+
+    def random_coin(self):
+        return random.randint(0, self.width - self.coin_size), random.randint(0, self.height - self.coin_size)
+
+    def new_slot(self):
+        if self.free:
+            return self.free.pop()
+        self.ids.append(None)
+        self.x.append(0)
+        self.y.append(0)
+        self.score.append(0)
+        self.move_x.append(0)
+        self.move_y.append(0)
+        self.color.append((0, 0, 0))
+        return len(self.ids) - 1
+
+    def add_player(self, player_id, x, y, color):
+        slot = self.slots[player_id] = self.new_slot()
+        self.ids[slot] = player_id
+        self.x[slot], self.y[slot] = x, y
+        self.score[slot] = 0
+        self.move_x[slot] = self.move_y[slot] = 0
+        self.color[slot] = color
+
+    def remove_player(self, player_id):
+        slot = self.slots.pop(player_id)
+        self.ids[slot] = self.FREE
+        self.move_x[slot] = self.move_y[slot] = 0
+        self.free.append(slot)
+
+    def set_keys(self, player_id, input_data):              # held until the next input
+        slot = self.slots[player_id]
+        self.move_x[slot], self.move_y[slot] = keys_of(input_data)
+
+    def step(self, distance):                               # move every player with keys held, clamped to the map
+        max_x, max_y = self.width - self.player_size, self.height - self.player_size
+        for slot in self.slots.values():
+            if self.move_x[slot] or self.move_y[slot]:
+                keys = self.move_x[slot], self.move_y[slot]
+                self.x[slot], self.y[slot] = move(self.x[slot], self.y[slot], keys, distance, max_x, max_y)
+
+    def collect(self):                                      # score and respawn every coin a player touches, returns how many
+        collected = 0
+        for slot in sorted(self.slots.values()):
+            touched = self.coin_grid.touching(self.x[slot], self.y[slot], self.player_size)
+            self.score[slot] += len(touched)
+            for coin in touched:
+                self.coin_grid.move(coin, *self.random_coin())
+            collected += len(touched)
+        return collected
+
+    def coins_inside(self, left, top, right, bottom):       # coin slots with their corner in the box, for the area of interest
+        return self.coin_grid.inside(left, top, right, bottom)
+
+    def game_state(self):                                   # {'players', 'player_scores', 'color', 'coins'} as the clients draw it
+        slots = self.slots.items()
+        return {
+            'players': {player_id: (self.x[slot], self.y[slot]) for player_id, slot in slots},
+            'player_scores': {player_id: self.score[slot] for player_id, slot in slots},
+            'color': {player_id: self.color[slot] for player_id, slot in slots},
+            'coins': list(self.coins),
+        }
+
+class NumpyEntityStore(EntityStore):
+    '''The same store with numpy columns, step() and collect() handle every player at once'''
+
+    FREE = -1
+
+    def __init__(self, width, height, player_size, coin_size, coin_count, cell=CELL):
+        self.width, self.height = width, height
+        self.player_size, self.coin_size = player_size, coin_size
+        self.cell = cell
+        self.columns = width // cell + 3                    # cells from -1 to past the right edge
+        self.span = (player_size + coin_size) // cell + 2   # cells a player can reach on each axis
+        self.rng = np.random.default_rng()
+        self.slots = {}
+        self.free = []
+        self.ids = np.full(0, self.FREE, np.int64)
+        self.x, self.y = np.zeros(0, np.float32), np.zeros(0, np.float32)
+        self.score = np.zeros(0, np.int64)
+        self.move_x, self.move_y = np.zeros(0, np.int8), np.zeros(0, np.int8)
+        self.color = np.zeros((0, 3), np.uint8)
+        self.coin_x = self.rng.integers(0, width - coin_size + 1, coin_count)
+        self.coin_y = self.rng.integers(0, height - coin_size + 1, coin_count)
+        self.coins = list(zip(self.coin_x.tolist(), self.coin_y.tolist()))     # as tuples for game_state(), respawns are written to both
+        self.sort_coins()
+
+    def new_slot(self):
+        if self.free:
+            return self.free.pop()
+        size = len(self.ids)
+        grow = max(size, 16)                                # double the columns when every slot is taken
+        self.ids = np.concatenate([self.ids, np.full(grow, self.FREE, np.int64)])
+        for name in ('x', 'y', 'score', 'move_x', 'move_y', 'color'):
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate([column, np.zeros((grow,) + column.shape[1:], column.dtype)]))
+        self.free = list(range(size + grow - 1, size, -1))
+        return size
+
+    def cells(self, x, y):                                  # grid cell numbers, shifted so -1 is still a column
+        return (y // self.cell + 1).astype(np.int64) * self.columns + (x // self.cell + 1).astype(np.int64)
+
+    def sort_coins(self):
+        cells = self.cells(self.coin_x, self.coin_y)
+        self.coin_order = np.argsort(cells, kind='stable')
+        self.coin_cells = cells[self.coin_order]
+
+    def step(self, distance):
+        self.x += self.move_x * np.float32(distance)
+        self.y += self.move_y * np.float32(distance)
+        np.clip(self.x, 0, self.width - self.player_size, out=self.x)
+        np.clip(self.y, 0, self.height - self.player_size, out=self.y)
+
+    def collect(self):
+        players = np.flatnonzero(self.ids != self.FREE)
+        if not players.size or not self.coin_x.size:
+            return 0
+        size, coin_size = self.player_size, self.coin_size
+        px, py = self.x[players], self.y[players]
+        left = (px - coin_size) // self.cell                # first and last cell a coin corner can be in
+        top = (py - coin_size) // self.cell
+        right = (px + size) // self.cell
+        bottom = (py + size) // self.cell
+
+        # every (player, cell) the player can reach, then the coins sorted into those cells
+        owner, cells = [], []
+        for dx in range(self.span):
+            for dy in range(self.span):
+                inside = (left + dx <= right) & (top + dy <= bottom)
+                owner.append(np.flatnonzero(inside))
+                cells.append(self.cells((left[inside] + dx) * self.cell, (top[inside] + dy) * self.cell))
+        owner, cells = np.concatenate(owner), np.concatenate(cells)
+        first = np.searchsorted(self.coin_cells, cells, 'left')
+        counts = np.searchsorted(self.coin_cells, cells, 'right') - first
+        total = int(counts.sum())
+        if not total:
+            return 0
+        pair_player = np.repeat(owner, counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_coin = self.coin_order[np.repeat(first, counts) + offsets]
+
+        # the real overlap test, only for the pairs in reachable cells
+        cx, cy = self.coin_x[pair_coin], self.coin_y[pair_coin]
+        x, y = px[pair_player], py[pair_player]
+        hit = (x < cx + coin_size) & (x + size > cx) & (y < cy + coin_size) & (y + size > cy)
+        if not hit.any():
+            return 0
+        pair_player, pair_coin = pair_player[hit], pair_coin[hit]
+        by_player = np.argsort(pair_player, kind='stable')  # a coin goes to the lowest slot that touches it
+        coins, first_hit = np.unique(pair_coin[by_player], return_index=True)
+        np.add.at(self.score, players[pair_player[by_player][first_hit]], 1)
+
+        self.coin_x[coins] = self.rng.integers(0, self.width - coin_size + 1, coins.size)
+        self.coin_y[coins] = self.rng.integers(0, self.height - coin_size + 1, coins.size)
+        for coin, x, y in zip(coins.tolist(), self.coin_x[coins].tolist(), self.coin_y[coins].tolist()):
+            self.coins[coin] = (x, y)
+        self.sort_coins()
+        return int(coins.size)
+
+    def coins_inside(self, left, top, right, bottom):       # a searchsorted range of the sorted cells per row of the box
+        last = self.columns - 1
+        first_column = min(max(int(left) // self.cell + 1, 0), last)
+        last_column = min(max(int(right) // self.cell + 1, 0), last)
+        rows = np.arange(max(int(top) // self.cell + 1, 0), max(int(bottom) // self.cell + 2, 0))
+        begin = np.searchsorted(self.coin_cells, rows * self.columns + first_column, 'left')
+        end = np.searchsorted(self.coin_cells, rows * self.columns + last_column, 'right')
+        if not rows.size or not (end - begin).any():
+            return []
+        coins = np.concatenate([self.coin_order[first:stop] for first, stop in zip(begin.tolist(), end.tolist())])
+        x, y = self.coin_x[coins], self.coin_y[coins]
+        return coins[(x >= left) & (x <= right) & (y >= top) & (y <= bottom)].tolist()
+
+    def game_state(self):
+        slots = np.flatnonzero(self.ids != self.FREE)
+        ids = self.ids[slots].tolist()
+        return {
+            'players': dict(zip(ids, zip(self.x[slots].tolist(), self.y[slots].tolist()))),
+            'player_scores': dict(zip(ids, self.score[slots].tolist())),
+            'color': dict(zip(ids, map(tuple, self.color[slots].tolist()))),
+            'coins': list(self.coins),
+        }
+
+def entity_store(width, height, player_size, coin_size, coin_count):   # numpy columns when numpy is installed
+    store = NumpyEntityStore if np is not None else EntityStore
+    return store(width, height, player_size, coin_size, coin_count)
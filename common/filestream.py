@@ -0,0 +1,69 @@
+# filestream.py
+# streaming file transfer: an 8 byte size header followed by the raw file bytes
+#
+# the sender uses socket.sendfile (kernel zero-copy where available) and the
+# receiver reads into one fixed buffer with recv_into, so memory use does not
+# grow with the file size and any file type (binary or text) is supported.
+import os
+import struct
+from contextlib import nullcontext
+
+from common.framing import FramedSocket
+
+FILE_HEADER = struct.Struct("!Q")
+CHUNK_SIZE = 1024 * 1024
+
+def split_socket(sock):                                     # raw socket + bytes a FramedSocket already read past its frame
+    if isinstance(sock, FramedSocket):
+        return sock.sock, sock.reader.take_buffered()
+    return sock, b""
+
+def send_file(sock, path, offset=0):                        # returns the number of bytes sent
+    size = os.path.getsize(path) - offset
+    raw = sock.sock if isinstance(sock, FramedSocket) else sock
+    lock = sock.send_lock if isinstance(sock, FramedSocket) else nullcontext()
+    with lock, open(path, "rb") as file:                    # no other frame may be sent in the middle of the file
+        raw.sendall(FILE_HEADER.pack(size))
+        if size:
+            raw.sendfile(file, offset)                      # falls back to send() where os.sendfile is missing
+    return size
+
+def recv_exact(raw, size, pending=b""):
+    while len(pending) < size:
+        data = raw.recv(size - len(pending))
+        if not data:
+            raise ConnectionError("connection closed during file transfer")
+        pending += data
+    return pending
+
+def recv_file(sock, path, buffer=None, checkpoint=None):    # returns the number of bytes written to path
+    raw, pending = split_socket(sock)
+    pending = recv_exact(raw, FILE_HEADER.size, pending)
+    (size,) = FILE_HEADER.unpack_from(pending)
+    pending = pending[FILE_HEADER.size:]
+    if len(pending) > size and isinstance(sock, FramedSocket):
+        sock.reader.feed(pending[size:])                    # frames that came right after the file
+    view = memoryview(buffer if buffer is not None else bytearray(CHUNK_SIZE))
+
+    # unbuffered, each chunk goes straight to write(); a checkpoint resumes a .part file instead
+    file = checkpoint.open() if checkpoint else open(path, "wb", buffering=0)
+    try:
+        file.write(pending[:size])
+        remaining = size - len(pending[:size])
+        while remaining:
+            n = raw.recv_into(view[:min(remaining, len(view))])
+            if n == 0:
+                raise ConnectionError(f"connection closed with {remaining} bytes of the file missing")
+            file.write(view[:n])
+            remaining -= n
+            if checkpoint:
+                checkpoint.update(file, file.tell())
+    except BaseException:
+        if checkpoint:                                      # keep what arrived, the next attempt resumes from here
+            checkpoint.save(file, file.tell())
+        raise
+    finally:
+        file.close()
+    if checkpoint:
+        checkpoint.finish()
+    return size
@@ -0,0 +1,76 @@
+# filewriter.py
+# writes an incoming file on a background thread so the socket keeps being read
+#
+# the file is opened once, preallocated to its final size when that is known
+# (os.posix_fallocate), and every chunk goes through a bounded queue to a
+# writer thread. when the disk is slower than the network the queue fills up
+# and write() blocks, so memory use stays at about QUEUE_DEPTH chunks. small
+# pieces (1 KB packets) are gathered into CHUNK_SIZE blocks before queueing.
+# an optional hasher (integrity.ChunkHasher) sees every block right after it
+# is written, on the same thread, so checking the file needs no second pass.
+import os
+import queue
+import threading
+
+QUEUE_DEPTH = 64                                            # chunks waiting for the disk at most
+CHUNK_SIZE = 256 * 1024                                     # small writes are queued together once this much arrived
+
+class FileWriter:
+    '''One open file written by a background thread'''
+
+    def __init__(self, path, size=None, depth=QUEUE_DEPTH, hasher=None):
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.hasher = hasher
+        self.written = 0
+        self.error = None
+        if size and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self.fd, 0, size)        # reserve the blocks up front, less fragmentation
+            except OSError:                                 # not supported by every file system
+                pass
+        self.pending = bytearray()
+        self.chunks = queue.Queue(depth)
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def write_loop(self):
+        while True:
+            data = self.chunks.get()
+            if data is None:
+                return
+            if self.error:                                  # keep taking chunks so write() never blocks forever
+                continue
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(self.fd, view):]
+                self.written += len(data)
+                if self.hasher:
+                    self.hasher.update(data)
+            except OSError as e:
+                self.error = e
+
+    def write(self, data):
+        if self.error:
+            raise self.error
+        if not self.pending and len(data) >= CHUNK_SIZE:
+            self.chunks.put(data)                           # blocks while the writer is QUEUE_DEPTH chunks behind
+            return
+        self.pending += data
+        if len(self.pending) >= CHUNK_SIZE:
+            self.chunks.put(bytes(self.pending))
+            self.pending.clear()
+
+    def close(self):                                        # wait for the queue to drain, returns the bytes written
+        if self.pending:
+            self.chunks.put(bytes(self.pending))
+            self.pending.clear()
+        self.chunks.put(None)
+        self.thread.join()
+        try:
+            os.ftruncate(self.fd, self.written)             # drop preallocated space that was never filled
+        finally:
+            os.close(self.fd)
+        if self.error:
+            raise self.error
+        return self.written
\ No newline at end of file
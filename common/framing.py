@@ -0,0 +1,133 @@
+# framing.py
+# length-prefixed framing shared by the lab servers and clients
+#
+# every frame is a 4 byte big endian length followed by the payload, so a
+# message is never split or merged with its neighbours by TCP.
+import struct
+import threading
+
+HEADER = struct.Struct("!I")
+HEADER_SIZE = HEADER.size
+MAX_FRAME = 64 * 1024 * 1024                                # refuse anything bigger than 64 MB
+RECV_SIZE = 64 * 1024
+
+class FrameError(Exception):
+    pass
+
+def encode_frame(payload):
+    return HEADER.pack(len(payload)) + payload
+
+def encode_frames(payloads):                                # many frames in one buffer (one send call)
+    out = bytearray()
+    for payload in payloads:
+        out += HEADER.pack(len(payload))
+        out += payload
+    return out
+
+def send_frame(sock, payload):
+    sock.sendall(encode_frame(payload))
+
+class FrameReader:
+    '''Incremental frame parser, one recv can give back many frames'''
+
+    def __init__(self, recv_size=RECV_SIZE):
+        self.buffer = bytearray()                           # bytes received but not yet parsed
+        self.start = 0                                      # first unparsed byte in buffer
+        self.chunk = bytearray(recv_size)                   # reused for every recv_into
+        self.view = memoryview(self.chunk)
+
+    def feed(self, data):
+        self.buffer += data
+
+    def next_frame(self):                                   # one complete frame, or None if it has not fully arrived
+        buffer, start = self.buffer, self.start
+        if len(buffer) - start < HEADER_SIZE:
+            return None
+        (length,) = HEADER.unpack_from(buffer, start)
+        if length > MAX_FRAME:
+            raise FrameError(f"frame of {length} bytes is too large")
+        begin = start + HEADER_SIZE
+        if len(buffer) - begin < length:
+            return None
+        frame = bytes(buffer[begin:begin + length])
+        self.start = begin + length
+        if self.start == len(buffer):                       # everything parsed, reuse the buffer
+            buffer.clear()
+            self.start = 0
+        elif self.start > RECV_SIZE and self.start * 2 > len(buffer):
+            del buffer[:self.start]                         # compact now and then, not once per frame
+            self.start = 0
+        return frame
+
+    def frames(self):                                       # yield every complete frame in the buffer
+        buffer = self.buffer
+        offset, end = self.start, len(buffer)
+        while end - offset >= HEADER_SIZE:
+            (length,) = HEADER.unpack_from(buffer, offset)
+            if length > MAX_FRAME:
+                raise FrameError(f"frame of {length} bytes is too large")
+            if end - offset - HEADER_SIZE < length:
+                break
+            begin = offset + HEADER_SIZE
+            offset = begin + length
+            self.start = offset
+            yield bytes(buffer[begin:offset])
+        if offset == end:
+            buffer.clear()
+        elif offset:
+            del buffer[:offset]                             # compact once per batch, not once per frame
+        self.start = 0
+
+    def take_buffered(self):                                # unparsed bytes, for a raw stream that follows a frame
+        data = bytes(self.buffer[self.start:])
+        self.buffer.clear()
+        self.start = 0
+        return data
+
+    def recv_frames(self, sock):                            # one recv, returns [] if no frame completed, None on EOF
+        n = sock.recv_into(self.chunk)
+        if n == 0:
+            return None
+        self.buffer += self.view[:n]
+        return list(self.frames())
+
+class FramedSocket:
+    '''Wraps a socket so send()/recv() work on whole frames instead of raw bytes'''
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = FrameReader()
+        self.send_lock = threading.Lock()                   # several threads may send to the same peer
+
+    def send(self, payload):
+        if not payload:                                     # like a raw socket, an empty send puts nothing on the wire
+            return 0
+        with self.send_lock:
+            self.sock.sendall(encode_frame(payload))
+        return len(payload)
+
+    sendall = send
+
+    def send_many(self, payloads):
+        with self.send_lock:
+            self.sock.sendall(encode_frames(payloads))
+
+    def recv(self, size=None):                              # size is ignored, a whole frame is returned
+        reader = self.reader
+        frame = reader.next_frame()                         # frames are parsed one at a time, so raw bytes
+        while frame is None:                                # after a frame stay in the buffer (see take_buffered)
+            n = self.sock.recv_into(reader.chunk)
+            if n == 0:
+                return b""
+            reader.buffer += reader.view[:n]
+            frame = reader.next_frame()
+        return frame
+
+    def recv_many(self):                                    # every frame already received (at least one), [] on EOF
+        frame = self.recv()
+        if not frame:
+            return []
+        return [frame] + list(self.reader.frames())
+
+    def __getattr__(self, name):                            # close(), fileno(), setblocking() ...
+        return getattr(self.sock, name)
@@ -0,0 +1,144 @@
+# gamewire.py
+# binary messages of the lab-07/lab-08 game, instead of pickled dicts
+#
+# every message starts with two bytes: the schema VERSION and the kind. an
+# input is one byte with a bit per key, the number of the last snapshot the
+# client has and the input's own number. a snapshot (see snapshot.py) starts
+# with OWNER: the player the receiving client plays and the number of its
+# last input the state includes, for client side prediction. every client
+# gets the same encoding with its own OWNER written in by address(). then
+# come seq, base and the number of changed and removed entries of every
+# section, then for every section the changed ones as fixed-width records
+# and the removed keys. a winner is a player id and lab-08's
+# REGISTER/PAY/LOGIN/QUEUE... strings are utf-8 text. nothing here
+# can run code on the receiver like pickle.loads could, a malformed message
+# raises ValueError. a section is packed with one struct call for all of its
+# records and unpacked with iter_unpack, there is no per-field python code.
+import functools
+import itertools
+import struct
+
+VERSION = 2
+INPUT, SNAPSHOT, WINNER, TEXT = 1, 2, 3, 4
+
+HEADER = struct.Struct("!BB")                               # version, kind
+KEYS = ("left", "right", "up", "down")                      # bit 0, 1, 2, 3
+INPUT_BODY = struct.Struct("!BII")                          # keys, ack, input seq
+OWNER = struct.Struct("!HI")                                # player id of the receiver (NOBODY if it does not play), last input applied
+NOBODY = 0xFFFF
+MAX_PLAYER_ID = NOBODY - 1                                  # player ids are "H" fields and NOBODY is taken
+MAX_COINS = 0xFFFF                                          # coin slots are "H" fields
+MAX_SIDE = 0x7FFF                                           # positions are "h" fields, the map must fit them
+WINNER_BODY = struct.Struct("!H")
+KEY = "H"                                                   # player id or coin slot
+RECORDS = (                                                 # one per snapshot.SECTIONS, key first
+    "Hhh",                                                  # players: id, x, y
+    "HI",                                                   # player_scores: id, score
+    "HBBB",                                                 # color: id, r, g, b
+    "Hhh",                                                  # coins: slot, x, y
+)
+SNAPSHOT_BODY = struct.Struct("!II" + "HH" * len(RECORDS))  # seq, base, (changed, removed) per section
+RECORD_STRUCTS = [struct.Struct("!" + fields) for fields in RECORDS]
+SCORES = 1                                                  # the one section with single values, the others are tuples
+PRESSED = [{name: bool(keys >> bit & 1) for bit, name in enumerate(KEYS)} for keys in range(1 << len(KEYS))]
+
+@functools.lru_cache(maxsize=256)
+def records(fields, count):                                 # struct for count records in a row
+    return struct.Struct("!" + fields * count)
+
+def pack_section(index, changed):
+    fields = RECORDS[index]
+    if index == SCORES:
+        flat = list(itertools.chain.from_iterable(changed.items()))
+    else:
+        flat = []
+        for key, value in changed.items():
+            flat.append(key)
+            flat.extend(value)
+    return records(fields, len(changed)).pack(*flat)
+
+def unpack_section(index, data):
+    record = RECORD_STRUCTS[index]
+    if index == SCORES:
+        return dict(record.iter_unpack(data))
+    return {values[0]: values[1:] for values in record.iter_unpack(data)}
+
+def check_world(width, height, coins):                      # ValueError if the map or the coins do not fit the records
+    if not (0 < width <= MAX_SIDE and 0 < height <= MAX_SIDE):
+        raise ValueError(f"the map is {width}x{height}, each side must be 1 to {MAX_SIDE} pixels")
+    if not 0 <= coins <= MAX_COINS:
+        raise ValueError(f"{coins} coins, at most {MAX_COINS} fit in a snapshot")
+
+def encode_input(input_data, ack=0, seq=0):                 # {'left': ..., 'right': ...} -> bytes
+    keys = 0
+    for bit, name in enumerate(KEYS):
+        if input_data.get(name):
+            keys |= 1 << bit
+    return HEADER.pack(VERSION, INPUT) + INPUT_BODY.pack(keys, ack, seq)
+
+def encode_snapshot(message):                               # (seq, base, delta) from snapshot.SnapshotHistory, for NOBODY
+    seq, base, delta = message
+    counts = [seq, base]
+    parts = [HEADER.pack(VERSION, SNAPSHOT) + OWNER.pack(NOBODY, 0), b""]
+    for index in range(len(RECORDS)):
+        changed, removed = delta.get(index, ({}, []))
+        counts += len(changed), len(removed)
+        if changed:
+            parts.append(pack_section(index, changed))
+        if removed:
+            parts.append(records(KEY, len(removed)).pack(*removed))
+    parts[1] = SNAPSHOT_BODY.pack(*counts)
+    return b"".join(parts)
+
+def address(data, player_id, applied):                      # an encoded snapshot with the OWNER of one client, a copy
+    return b"".join((data[:HEADER.size], OWNER.pack(player_id, applied), data[HEADER.size + OWNER.size:]))
+
+def encode_winner(player_id):
+    return HEADER.pack(VERSION, WINNER) + WINNER_BODY.pack(player_id)
+
+def encode_text(text):
+    return HEADER.pack(VERSION, TEXT) + text.encode()
+
+def decode_snapshot(data, offset):                          # (seq, base, delta, player id, last input applied)
+    player_id, applied = OWNER.unpack_from(data, offset)
+    seq, base, *counts = SNAPSHOT_BODY.unpack_from(data, offset + OWNER.size)
+    offset += OWNER.size + SNAPSHOT_BODY.size
+    delta = {}
+    for index, record in enumerate(RECORD_STRUCTS):
+        changed_count, removed_count = counts[2 * index:2 * index + 2]
+        if not (changed_count or removed_count):
+            continue
+        end = offset + changed_count * record.size
+        changed = unpack_section(index, data[offset:end])
+        offset = end
+        removed = list(records(KEY, removed_count).unpack_from(data, offset))
+        offset += records(KEY, removed_count).size
+        delta[index] = (changed, removed)
+    if offset != len(data):
+        raise ValueError("snapshot has trailing bytes")
+    return seq, base, delta, player_id, applied
+
+def decode(data):                                           # (kind, value), ValueError if it is not a message of this VERSION
+    try:
+        version, kind = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ValueError(f"unsupported message version {version}")
+        if kind == INPUT:
+            if len(data) != HEADER.size + INPUT_BODY.size:  # two inputs merged by an unframed stream
+                raise ValueError("input has trailing bytes")
+            keys, ack, seq = INPUT_BODY.unpack_from(data, HEADER.size)
+            input_data = PRESSED[keys & len(PRESSED) - 1].copy()     # bits of keys this version does not know are ignored
+            input_data["ack"] = ack
+            input_data["seq"] = seq
+            return kind, input_data
+        if kind == SNAPSHOT:
+            return kind, decode_snapshot(data, HEADER.size)
+        if kind == WINNER:
+            if len(data) != HEADER.size + WINNER_BODY.size:
+                raise ValueError("winner has trailing bytes")
+            return kind, WINNER_BODY.unpack_from(data, HEADER.size)[0]
+        if kind == TEXT:
+            return kind, bytes(data[HEADER.size:]).decode()
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"malformed message: {e}") from None
+    raise ValueError(f"unknown message kind {kind}")
@@ -0,0 +1,73 @@
+# integrity.py
+# per-chunk and whole-file digests computed while a file streams past
+#
+# the sender hashes every CHUNK_SIZE bytes as it reads them and sends the
+# digests after the data (the trailer). the receiver feeds the same bytes to a
+# ChunkHasher on its writer thread (see FileWriter), so checking costs no
+# extra pass over the file. chunks whose digests differ, or that never
+# arrived, can be asked for again one by one. the whole-file digest is the
+# sha256 of the chunk digests, so every byte is hashed once; sha256 rather
+# than blake2b because most cpus have instructions for it (about 3x faster).
+import hashlib
+import os
+
+CHUNK_SIZE = 1024 * 1024                                    # bytes covered by one chunk digest
+DIGEST_SIZE = 16
+
+def chunk_digest(data):
+    return hashlib.sha256(data).hexdigest()[:DIGEST_SIZE * 2]
+
+def whole_digest(chunks):                                   # digest of the file from the digests of its chunks
+    return hashlib.sha256(",".join(chunks).encode()).hexdigest()
+
+class ChunkHasher:
+    '''One digest per CHUNK_SIZE bytes plus the whole-file digest, fed in any piece sizes'''
+
+    def __init__(self):
+        self.chunk = hashlib.sha256()
+        self.chunk_fill = 0
+        self.chunks = []
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            take = min(len(view), CHUNK_SIZE - self.chunk_fill)
+            self.chunk.update(view[:take])
+            self.chunk_fill += take
+            view = view[take:]
+            if self.chunk_fill == CHUNK_SIZE:
+                self.chunks.append(self.chunk.hexdigest()[:DIGEST_SIZE * 2])
+                self.chunk = hashlib.sha256()
+                self.chunk_fill = 0
+
+    def finish(self):                                       # (whole-file digest, chunk digests)
+        if self.chunk_fill:
+            self.chunks.append(self.chunk.hexdigest()[:DIGEST_SIZE * 2])
+            self.chunk = hashlib.sha256()
+            self.chunk_fill = 0
+        return whole_digest(self.chunks), self.chunks
+
+def encode_trailer(whole, chunks):
+    return f"{whole};{','.join(chunks)}"
+
+def decode_trailer(text):
+    whole, chunks = text.split(";", 1)
+    return whole, chunks.split(",") if chunks else []
+
+def bad_chunks(expected, received):                         # indices that differ or never arrived
+    return [i for i, name in enumerate(expected) if i >= len(received) or received[i] != name]
+
+def file_digest(path):                                      # whole-file digest read back from disk, only needed after repairs
+    with open(path, "rb") as file:
+        return whole_digest([chunk_digest(block) for block in iter(lambda: file.read(CHUNK_SIZE), b"")])
+
+def read_chunk(path, index):
+    with open(path, "rb") as file:
+        return os.pread(file.fileno(), CHUNK_SIZE, index * CHUNK_SIZE)
+
+def write_chunk(path, index, data):
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        os.pwrite(fd, data, index * CHUNK_SIZE)
+    finally:
+        os.close(fd)
\ No newline at end of file
@@ -0,0 +1,62 @@
+# interest.py
+# area of interest: each client is sent only the part of the world around its own player
+#
+# with --view=WIDTHxHEIGHT smaller than the map, the client's window shows a
+# view of that size centred on its player, and the server sends it only the
+# players and coins inside that box plus MARGIN, so they are there before
+# they scroll into sight. the players are put in a PointGrid once per tick
+# and the coins come from the coin index the server already has (CoinGrid or
+# the entity store), so finding a client's entities costs the few cells
+# around it, not a pass over the world. every client has its own
+# SnapshotHistory of what it was sent: an entity that comes into view is a
+# new record of the delta (enter) and one that goes out of it is a removed
+# key (leave), the deltas stay as they were. what a client receives depends
+# on how crowded its surroundings are, not on how many players and coins the
+# whole world has.
+CELL = 128                                                  # pixels, a view spans a handful of cells
+MARGIN = 64                                                 # pixels around the view that are sent too
+
+def parse_view(text, width, height):                        # --view=WIDTHxHEIGHT, the whole map if not given
+    if not text:
+        return width, height
+    view_width, view_height = (int(n) for n in text.split('x'))
+    return min(view_width, width), min(view_height, height)
+
+def view_box(x, y, size, view, margin=MARGIN):              # (left, top, right, bottom) around the player at (x, y)
+    center_x, center_y = x + size / 2, y + size / 2
+    half_width, half_height = view[0] / 2 + margin, view[1] / 2 + margin
+    return center_x - half_width, center_y - half_height, center_x + half_width, center_y + half_height
+
+def camera(x, y, size, view, width, height):                # top left corner of the client's window on the map
+    left = min(max(x + size / 2 - view[0] / 2, 0), width - view[0])
+    top = min(max(y + size / 2 - view[1] / 2, 0), height - view[1])
+    return left, top
+
+class PointGrid:
+    '''Keys of points by grid cell, built once per tick to find the players near each client'''
+
+    def __init__(self, points, cell=CELL):
+        self.points = points                                # {key: (x, y)}
+        self.cell = cell
+        self.cells = {}
+        for key, (x, y) in points.items():
+            self.cells.setdefault((int(x) // cell, int(y) // cell), []).append(key)
+
+    def inside(self, left, top, right, bottom):             # keys of the points in the box
+        cell, points = self.cell, self.points
+        keys = []
+        for column in range(int(left) // cell, int(right) // cell + 1):
+            for row in range(int(top) // cell, int(bottom) // cell + 1):
+                for key in self.cells.get((column, row), ()):
+                    x, y = points[key]
+                    if left <= x <= right and top <= y <= bottom:
+                        keys.append(key)
+        return keys
+
+def area_of_interest(game_state, players, coins):           # the game_state of one client: these player ids and coin slots
+    return {
+        'players': {player_id: game_state['players'][player_id] for player_id in players},
+        'player_scores': {player_id: game_state['player_scores'][player_id] for player_id in players},
+        'color': {player_id: game_state['color'][player_id] for player_id in players},
+        'coins': {slot: game_state['coins'][slot] for slot in coins},   # keyed by slot, a coin keeps its place in the full list
+    }
@@ -0,0 +1,95 @@
+# mux.py
+# many file transfers and control messages sharing one framed connection
+#
+# every frame starts with a 4 byte channel id. channel 0 carries the control
+# messages (w;... acks, f;... offers) and any other channel is one file: its
+# first frame is the f;... header, then the data, then EOF or ABORT. the
+# sending thread sends queued control messages first and then one QUANTUM of
+# each open channel in turn, so a small file finishes after a few rounds
+# instead of waiting behind a large one. files are read while they are sent,
+# nothing is queued ahead in memory.
+import collections
+import itertools
+import struct
+import threading
+
+CHANNEL = struct.Struct("!I")
+CONTROL = 0
+QUANTUM = 64 * 1024                                         # bytes of a channel sent per turn
+STOP_FRAMES = (b'EOF', b'ABORT')
+
+def pack(channel, payload):
+    return CHANNEL.pack(channel) + payload
+
+def split(frame):                                           # (channel, payload)
+    return CHANNEL.unpack_from(frame)[0], frame[CHANNEL.size:]
+
+def file_frames(path, header, quantum=QUANTUM):             # the header, the file in quantum pieces, then EOF
+    yield header
+    try:
+        with open(path, "rb") as file:
+            for data in iter(lambda: file.read(quantum), b""):
+                yield data
+    except OSError:
+        yield b'ABORT'
+        return
+    yield b'EOF'
+
+class Mux:
+    '''Sends control messages and channel frames over one FramedSocket, channels take turns'''
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.control = collections.deque()
+        self.channels = collections.deque()                 # (channel, frames) in the order of their next turn
+        self.ready = threading.Condition()
+        self.ids = itertools.count(1)
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def send(self, payload):                                # control message, goes out before the next file frame
+        with self.ready:
+            self.control.append(payload)
+            self.ready.notify()
+        return len(payload)
+
+    def open(self, frames):                                 # new channel sending an iterable of payloads, returns its id
+        channel = next(self.ids)
+        with self.ready:
+            self.channels.append((channel, iter(frames)))
+            self.ready.notify()
+        return channel
+
+    def close(self):                                        # send what is queued, then stop the thread
+        with self.ready:
+            self.closed = True
+            self.ready.notify()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.ready:
+                while not (self.control or self.channels or self.closed):
+                    self.ready.wait()
+                if not (self.control or self.channels):     # closed and everything sent
+                    return
+                if self.control:
+                    channel, frames = CONTROL, None
+                    payload = self.control.popleft()
+                else:
+                    channel, frames = self.channels.popleft()
+            if frames is not None:
+                payload = next(frames, None)                # read outside the lock, send()/open() never wait for the disk
+                if payload is None:                         # channel finished
+                    continue
+                with self.ready:
+                    self.channels.append((channel, frames)) # back of the line
+            try:
+                self.sock.send(pack(channel, payload))
+            except OSError:
+                with self.ready:
+                    self.closed = True
+                    self.control.clear()
+                    self.channels.clear()
+                return
@@ -0,0 +1,115 @@
+# outbound.py
+# bounded per-connection send queue, drained by its own writer thread
+import threading
+from collections import deque
+
+from common.framing import FramedSocket, encode_frame
+
+HIGH_WATER = 256 * 1024                                     # senders are paused above this many queued bytes
+LOW_WATER = 64 * 1024                                       # ... and resumed once the writer drains below this
+MAX_BATCH = 64                                              # messages handed to one sendmsg call
+
+def send_buffers(sock, buffers):                            # sendall for a list of buffers, handles short sends
+    if not hasattr(sock, "sendmsg"):
+        sock.sendall(b"".join(buffers))
+        return
+    views = [memoryview(b) for b in buffers]
+    first = 0
+    while first < len(views):
+        sent = sock.sendmsg(views[first:first + MAX_BATCH])
+        while sent:
+            size = len(views[first])
+            if sent >= size:
+                sent -= size
+                first += 1
+            else:
+                views[first] = views[first][sent:]
+                sent = 0
+
+class OutboundQueue:
+    '''Messages waiting to be written to one peer, so a slow peer never blocks the sender's thread'''
+
+    def __init__(self, conn, high_water=HIGH_WATER, low_water=LOW_WATER):
+        self.conn = conn
+        self.framed = isinstance(conn, FramedSocket)
+        self.high_water = high_water
+        self.low_water = low_water
+        self.items = deque()
+        self.queued_bytes = 0
+        self.paused = False                                 # set at the high watermark, cleared at the low one
+        self.closed = False
+        self.broken = False                                 # a write failed, what is still queued is never sent
+        self.queued_total = 0                               # bytes ever queued ...
+        self.written_total = 0                              # ... and written to the socket
+        self.lock = threading.Lock()
+        self.has_items = threading.Condition(self.lock)     # writer waits here for work
+        self.resumed = threading.Condition(self.lock)       # paused senders wait here
+        self.written = threading.Condition(self.lock)       # flush() waits here
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def encode(self, data):                                 # bytes exactly as they go on the wire
+        return encode_frame(data) if self.framed else data
+
+    def send(self, data, timeout=None):                     # queue data, blocks while the peer is backed up
+        return self.send_encoded(self.encode(data), timeout)
+
+    def send_encoded(self, data, timeout=None):             # data (or a list of them) from encode(), can be shared by many queues
+        buffers = data if isinstance(data, list) else [data]
+        size = sum(len(buf) for buf in buffers)
+        with self.lock:
+            if self.paused and not self.resumed.wait_for(lambda: not self.paused or self.closed, timeout):
+                return 0                                    # peer stalled for too long, message dropped
+            if self.closed:
+                raise BrokenPipeError("connection is closed")
+            if not self.items:                              # writer is idle, wake it (otherwise it is busy sending)
+                self.has_items.notify()
+            self.items.extend(buffers)
+            self.queued_bytes += size
+            self.queued_total += size
+            if self.queued_bytes >= self.high_water:
+                self.paused = True
+        return size
+
+    def write_loop(self):
+        while True:
+            with self.lock:
+                self.has_items.wait_for(lambda: self.items or self.closed)
+                if not self.items:                          # closed and fully drained
+                    return
+                batch = list(self.items)                    # take everything queued, one write for all of it
+                self.items.clear()
+            try:
+                if self.framed:
+                    with self.conn.send_lock:
+                        send_buffers(self.conn.sock, batch)
+                else:
+                    send_buffers(self.conn, batch)
+            except OSError:
+                with self.lock:
+                    self.broken = True
+                    self.written.notify_all()
+                self.close()
+                return
+            with self.lock:
+                self.queued_bytes -= sum(len(data) for data in batch)
+                self.written_total += sum(len(data) for data in batch)
+                self.written.notify_all()
+                if self.paused and self.queued_bytes <= self.low_water:
+                    self.paused = False
+                    self.resumed.notify_all()
+
+    def flush(self, timeout=None):                          # True once everything queued so far is written to the socket
+        with self.lock:
+            mark = self.queued_total
+            self.written.wait_for(lambda: self.written_total >= mark or self.broken, timeout)
+            return self.written_total >= mark
+
+    def close(self):                                        # already queued messages are still written
+        with self.lock:
+            self.closed = True
+            self.has_items.notify()
+            self.resumed.notify_all()
+
+    def fileno(self):
+        return self.conn.fileno()
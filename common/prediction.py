@@ -0,0 +1,89 @@
+# prediction.py
+# client side prediction of the own player and interpolation of the others
+#
+# the client moves its own square as soon as a key is held, with the same
+# move() the server uses, and numbers every input it sends. every snapshot
+# says which input of this client the server applied last (gamewire OWNER):
+# the inputs up to it are dropped, the position in the snapshot becomes the
+# starting point and the inputs the server has not seen yet are replayed on
+# top of it. what is left of a difference after that is faded out over a few
+# frames instead of shown as a jump. the other players are drawn DELAY
+# seconds in the past, between the two snapshots received around that time,
+# so they glide from state to state and a late or lost snapshot is covered by
+# the next one.
+import time
+from collections import deque
+
+from common.entities import keys_of, move
+
+DELAY = 0.1                                                 # seconds the other players are drawn behind the newest snapshot
+SMOOTHING = 0.25                                            # part of a correction taken away per frame
+SNAP = 60                                                   # pixels, a bigger correction is shown at once (respawn, lost inputs)
+PENDING = 256                                               # inputs kept for replay, the oldest go when the server is far behind
+
+class Predictor:
+    '''The own player's position, ahead of the server by the inputs it has not applied yet'''
+
+    def __init__(self, width, height, size):
+        self.max_x, self.max_y = width - size, height - size
+        self.seq = 0                                        # of the last input sent
+        self.pending = deque(maxlen=PENDING)                # (seq, (dx, dy), distance) not in a snapshot yet
+        self.position = None                                # predicted, None until a snapshot has this player
+        self.error = (0.0, 0.0)                             # correction not shown yet
+
+    def input(self, input_data, distance):                  # number an input and move by it at once, returns its seq
+        self.seq += 1
+        keys = keys_of(input_data)
+        self.pending.append((self.seq, keys, distance))
+        if self.position is not None:
+            self.position = move(*self.position, keys, distance, self.max_x, self.max_y)
+        return self.seq
+
+    def reconcile(self, position, applied):                 # position from a snapshot that includes the inputs up to applied
+        while self.pending and self.pending[0][0] <= applied:
+            self.pending.popleft()
+        x, y = position
+        for _, keys, distance in self.pending:
+            x, y = move(x, y, keys, distance, self.max_x, self.max_y)
+        if self.position is not None:                       # keep drawing where it was, the error fades in draw()
+            error_x = self.position[0] + self.error[0] - x
+            error_y = self.position[1] + self.error[1] - y
+            self.error = (error_x, error_y) if abs(error_x) + abs(error_y) < SNAP else (0.0, 0.0)
+        self.position = (x, y)
+
+    def draw(self):                                         # where to draw the player this frame, None if unknown
+        if self.position is None:
+            return None
+        error_x, error_y = self.error
+        self.error = (error_x * (1 - SMOOTHING), error_y * (1 - SMOOTHING))
+        return self.position[0] + error_x, self.position[1] + error_y
+
+class Interpolator:
+    '''Positions of the other players, DELAY seconds behind the snapshots received'''
+
+    def __init__(self, delay=DELAY):
+        self.delay = delay
+        self.frames = deque(maxlen=32)                      # (time received, {player_id: (x, y)})
+
+    def add(self, players):
+        self.frames.append((time.monotonic(), players))
+
+    def positions(self):                                    # {player_id: (x, y)} at the time drawn
+        frames = list(self.frames)                          # the receiving thread keeps adding
+        if not frames:
+            return {}
+        moment = time.monotonic() - self.delay
+        older, newer = frames[0], None
+        for frame in frames:
+            if frame[0] > moment:
+                newer = frame
+                break
+            older = frame
+        if newer is None or older is newer:                 # past the newest, or before the oldest
+            return dict(older[1])
+        fraction = (moment - older[0]) / (newer[0] - older[0])
+        positions = {}
+        for player_id, (x, y) in newer[1].items():          # a player that left is gone, one that joined starts where it is
+            old_x, old_y = older[1].get(player_id, (x, y))
+            positions[player_id] = (old_x + (x - old_x) * fraction, old_y + (y - old_y) * fraction)
+        return positions
@@ -0,0 +1,58 @@
+# registry.py
+# thread-safe table of connected clients, indexed by address and by socket fd
+import threading
+
+class ConnectionRegistry:
+    '''O(1) add/find/remove of (conn, addr) pairs shared by the client threads'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_addr = {}                                   # addr -> (conn, fd)
+        self.by_fd = {}                                     # fd -> (conn, addr)
+
+    def add(self, conn, addr):
+        fd = conn.fileno()                                  # kept, since fileno() is -1 once the socket is closed
+        with self.lock:
+            old = self.by_addr.pop(addr, None)
+            if old is not None:                             # same address reconnected, drop the stale entry
+                self.by_fd.pop(old[1], None)
+            stale = self.by_fd.pop(fd, None)
+            if stale is not None:                           # fd was reused after a close we never heard about
+                self.by_addr.pop(stale[1], None)
+            self.by_addr[addr] = (conn, fd)
+            self.by_fd[fd] = (conn, addr)
+
+    def find(self, addr):                                   # a single dict lookup is atomic, no lock needed
+        entry = self.by_addr.get(addr)
+        return entry[0] if entry is not None else None
+
+    def find_fd(self, fd):
+        return self.by_fd.get(fd)
+
+    def remove(self, addr):                                 # returns the removed conn or None
+        with self.lock:
+            entry = self.by_addr.pop(addr, None)
+            if entry is None:
+                return None
+            self.by_fd.pop(entry[1], None)
+            return entry[0]
+
+    def remove_fd(self, fd):                                # returns the removed (conn, addr) or None
+        with self.lock:
+            entry = self.by_fd.pop(fd, None)
+            if entry is not None:
+                self.by_addr.pop(entry[1], None)
+            return entry
+
+    def snapshot(self):                                     # copy of every (conn, addr), safe to iterate for broadcast
+        with self.lock:
+            return list(self.by_fd.values())
+
+    def __len__(self):
+        return len(self.by_addr)
+
+    def __contains__(self, addr):
+        return addr in self.by_addr
+
+    def __iter__(self):
+        return iter(self.snapshot())
@@ -0,0 +1,165 @@
+# relay.py
+# forwarding data from one socket to another without building bytes objects
+#
+# on linux os.splice moves the bytes socket -> pipe -> socket inside the kernel,
+# elsewhere a pooled bytearray is reused with recv_into. frame headers are
+# still read in python so a framed file stream can be relayed untouched up to
+# and including its EOF/ABORT frame, which is returned to the caller. when the
+# sender drops in the middle of a frame, the frame is padded with zeros so
+# the receiver stays in step and reads the ABORT that follows as a frame.
+import os
+import threading
+from contextlib import nullcontext
+
+from common.framing import HEADER, MAX_FRAME, FrameError, FramedSocket
+from common.filestream import recv_exact, split_socket
+
+BUFFER_SIZE = 1024 * 1024                                   # largest single copy
+POOL_SIZE = 64                                              # idle buffers/pipes kept for reuse
+SPLICE = hasattr(os, "splice")
+STOP_FRAMES = (b'EOF', b'ABORT')
+
+class Pool:
+    '''Reusable objects, created on demand and kept up to a limit'''
+
+    def __init__(self, create, destroy=None, limit=POOL_SIZE):
+        self.create = create
+        self.destroy = destroy
+        self.limit = limit
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return self.create()
+
+    def put(self, item):
+        with self.lock:
+            if len(self.idle) < self.limit:
+                self.idle.append(item)
+                return
+        if self.destroy:
+            self.destroy(item)
+
+def new_pipe():
+    r, w = os.pipe()
+    try:
+        import fcntl
+        fcntl.fcntl(w, fcntl.F_SETPIPE_SZ, BUFFER_SIZE)     # default pipe holds only 64 KB
+    except (ImportError, AttributeError, OSError):
+        pass
+    return r, w
+
+def close_pipe(pipe):
+    os.close(pipe[0])
+    os.close(pipe[1])
+
+buffers = Pool(lambda: memoryview(bytearray(BUFFER_SIZE)))
+pipes = Pool(new_pipe, close_pipe)
+
+def remaining(count, copied):
+    return BUFFER_SIZE if count is None else min(count - copied, BUFFER_SIZE)
+
+def copy_forward(raw, out, count):                          # recv_into a pooled buffer, out=None discards
+    view = buffers.get()
+    copied, delivered = 0, out is not None
+    try:
+        while count is None or copied < count:
+            try:
+                n = raw.recv_into(view[:remaining(count, copied)])
+            except ConnectionError:                         # sender reset, same as EOF: the caller sees copied < count
+                break
+            if n == 0:
+                break
+            copied += n
+            if delivered:
+                try:
+                    out.sendall(view[:n])
+                except OSError:                             # receiver is gone, keep reading so the sender is not stuck
+                    delivered = False
+    finally:
+        buffers.put(view)
+    return copied, delivered
+
+def splice_forward(raw, out, count):                        # socket -> pooled pipe -> socket, no copy to user space
+    pipe = pipes.get()
+    r, w = pipe
+    src, dst = raw.fileno(), out.fileno()
+    copied = 0
+    try:
+        while count is None or copied < count:
+            try:
+                n = os.splice(src, w, remaining(count, copied))
+            except ConnectionError:
+                break
+            if n == 0:
+                break
+            copied += n
+            try:
+                while n:
+                    n -= os.splice(r, dst, n)
+            except OSError:
+                close_pipe(pipe)                            # still holds bytes, never reuse it
+                more, _ = copy_forward(raw, None, None if count is None else count - copied)
+                return copied + more, False
+    except BaseException:
+        close_pipe(pipe)
+        raise
+    pipes.put(pipe)
+    return copied, True
+
+def forward(raw, out, count=None):
+    '''Copy count bytes (None = until EOF) from raw to out, returns (bytes read, all delivered)'''
+    if out is None:
+        return copy_forward(raw, None, count)
+    if SPLICE:
+        return splice_forward(raw, out, count)
+    return copy_forward(raw, out, count)
+
+def relay_frames(src, dst, stop=STOP_FRAMES):
+    '''Copy frames from src to dst unchanged up to and including a stop frame, returns (stop frame or b'' on EOF, all delivered)'''
+    raw, pending = split_socket(src)
+    out = dst.sock if isinstance(dst, FramedSocket) else dst
+    lock = dst.send_lock if isinstance(dst, FramedSocket) else nullcontext()
+    longest = max(len(frame) for frame in stop)
+
+    def send(data):
+        nonlocal out
+        if out is not None:
+            try:
+                out.sendall(data)
+            except OSError:
+                out = None
+
+    with lock:                                              # no other frame may reach dst in the middle
+        try:
+            while True:
+                pending = recv_exact(raw, HEADER.size, pending)
+                (length,) = HEADER.unpack_from(pending)
+                if length > MAX_FRAME:
+                    raise FrameError(f"frame of {length} bytes is too large")
+                if length <= longest:                       # small enough to be a stop frame, look at it
+                    pending = recv_exact(raw, HEADER.size + length, pending)
+                    frame, pending = pending[:HEADER.size + length], pending[HEADER.size + length:]
+                    send(frame)
+                    if frame[HEADER.size:] in stop:
+                        if pending and isinstance(src, FramedSocket):
+                            src.reader.feed(pending)        # frames the sender wrote after the file
+                        return frame[HEADER.size:], out is not None
+                    continue
+                head, pending = pending[:HEADER.size + length], pending[HEADER.size + length:]
+                send(head)                                  # header and whatever part of the payload is buffered
+                rest = HEADER.size + length - len(head)
+                copied, delivered = forward(raw, out, rest)
+                if not delivered:
+                    out = None
+                if copied < rest:                           # sender dropped inside the frame, finish it with zeros
+                    missing = rest - copied                 # so the receiver reads the ABORT after it as a frame
+                    while missing and out is not None:
+                        send(bytes(min(missing, BUFFER_SIZE)))
+                        missing -= min(missing, BUFFER_SIZE)
+                    return b'', False
+        except ConnectionError:                             # sender closed in the middle of the file
+            return b'', False
\ No newline at end of file
@@ -0,0 +1,65 @@
+# resume.py
+# checkpoints that let an interrupted file transfer continue where it stopped
+#
+# the receiver writes into "<file>.part" and keeps "<file>.ckpt" with the id of
+# the transfer and how many bytes are safely on disk. when the same transfer
+# is offered again it answers with that offset and only the tail is sent.
+import hashlib
+import json
+import os
+
+CHECKPOINT_EVERY = 16 * 1024 * 1024                         # fsync + save progress after this many bytes
+
+def transfer_id(path):                                      # same file offered again -> same id
+    stat = os.stat(path)
+    key = f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+class Checkpoint:
+    '''Progress of one incoming transfer, persisted next to the partial file'''
+
+    def __init__(self, path, transfer_id, size):
+        self.path = path
+        self.part_path = path + ".part"
+        self.ckpt_path = path + ".ckpt"
+        self.transfer_id = transfer_id
+        self.size = size
+        self.saved = 0
+
+    def resume_offset(self):                                # bytes already committed for this transfer
+        try:
+            with open(self.ckpt_path) as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            state = {}
+        committed = state.get("committed", 0)
+        if state.get("id") != self.transfer_id or not os.path.exists(self.part_path) \
+                or os.path.getsize(self.part_path) < committed:
+            committed = 0                                   # different file or nothing usable, start over
+        with open(self.part_path, "ab") as file:            # drop anything written after the last checkpoint
+            file.truncate(committed)
+        self.saved = committed
+        return committed
+
+    def open(self):                                         # partial file, positioned at the resume offset
+        file = open(self.part_path, "r+b", buffering=0)
+        file.seek(self.saved)
+        return file
+
+    def update(self, file, position):                       # called as data arrives, saves every CHECKPOINT_EVERY bytes
+        if position - self.saved >= CHECKPOINT_EVERY:
+            self.save(file, position)
+
+    def save(self, file, position):
+        file.flush()
+        os.fsync(file.fileno())                             # data first, then the checkpoint that points at it
+        tmp = self.ckpt_path + ".tmp"
+        with open(tmp, "w") as ckpt:
+            json.dump({"id": self.transfer_id, "size": self.size, "committed": position}, ckpt)
+        os.replace(tmp, self.ckpt_path)
+        self.saved = position
+
+    def finish(self):                                       # whole file received, move it into place
+        os.replace(self.part_path, self.path)
+        if os.path.exists(self.ckpt_path):
+            os.remove(self.ckpt_path)
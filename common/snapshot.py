@@ -0,0 +1,122 @@
+# snapshot.py
+# numbered game state snapshots sent as deltas against what the client has
+#
+# the server records every state it sends under a sequence number. clients
+# put the number of the last snapshot they received in their input ('ack'),
+# and the server sends each of them only what changed since that snapshot
+# (a full snapshot is a delta against nothing). the client keeps the last few
+# snapshots, applies the delta to the one it was made against and acks the
+# result. colors never change and coins rarely do, so after the first
+# snapshot a delta is mostly the positions of the players that moved.
+#
+# a snapshot is {section: {key: value}}, coins are keyed by their slot in the
+# list, so a collected coin must be replaced in place, not popped. positions
+# are rounded to whole pixels, that is all the client can draw anyway. a
+# message is the tuple (seq, base, delta) and a delta is keyed by the index of
+# the section, gamewire.encode_snapshot packs it. the coins of a partial
+# state (interest.py) are already a {slot: (x, y)} dict. the client keeps the
+# keys that came into and went out of its snapshot with the last message
+# (entered, left), for the players that is who came into view and who left it.
+# both sides keep snapshots by age as well as by count: lab-08 records one
+# per input, many more per second than lab-07's tick, and a client whose ack
+# takes a round trip to come back must still find its base on both sides.
+import time
+from collections import OrderedDict, deque
+
+SECTIONS = ("players", "player_scores", "color", "coins")
+HISTORY = 64                                                # snapshots kept to diff against, at least
+KEEP_SECONDS = 2.0                                          # and every one recorded this recently, covers the round trip of an ack
+MAX_HISTORY = 256                                           # but never more than this many
+
+def capture(game_state):                                    # game_state dict -> snapshot
+    snapshot = {name: dict(game_state[name]) for name in SECTIONS if name != "coins"}
+    snapshot["players"] = {key: (round(x), round(y)) for key, (x, y) in game_state["players"].items()}
+    coins = game_state["coins"]
+    snapshot["coins"] = dict(coins) if isinstance(coins, dict) else dict(enumerate(coins))
+    return snapshot
+
+def to_game_state(snapshot):                                # snapshot -> the game_state dict the clients draw
+    game_state = {name: dict(snapshot[name]) for name in SECTIONS if name != "coins"}
+    game_state["coins"] = [snapshot["coins"][i] for i in sorted(snapshot["coins"])]
+    return game_state
+
+def diff(old, new):                                         # {section index: (changed {key: value}, removed [keys])}
+    delta = {}
+    for index, name in enumerate(SECTIONS):
+        before, after = old.get(name, {}), new[name]
+        changed = {key: value for key, value in after.items() if before.get(key) != value}
+        removed = [key for key in before if key not in after]
+        if changed or removed:
+            delta[index] = (changed, removed)
+    return delta
+
+def patch(snapshot, delta):                                 # new snapshot, the old one is left as it is
+    result = {}
+    for index, name in enumerate(SECTIONS):
+        section = dict(snapshot.get(name, {}))
+        if index in delta:
+            changed, removed = delta[index]
+            section.update(changed)
+            for key in removed:
+                section.pop(key, None)
+        result[name] = section
+    return result
+
+def trim(snapshots, times, keep, seconds):                  # drop the oldest beyond keep that are old enough, or beyond MAX_HISTORY
+    cutoff = time.monotonic() - seconds
+    while len(snapshots) > keep and (len(snapshots) > MAX_HISTORY or times[0] < cutoff):
+        snapshots.popitem(last=False)
+        times.popleft()
+
+class SnapshotHistory:
+    '''Server side: recent snapshots by sequence number, deltas are made against the one a client acked'''
+
+    def __init__(self, encode, keep=HISTORY, seconds=KEEP_SECONDS):
+        self.encode = encode
+        self.keep = keep
+        self.seconds = seconds
+        self.seq = 0
+        self.snapshots = OrderedDict()
+        self.times = deque()                                # when each of snapshots was recorded, in the same order
+        self.deltas = {}                                    # base seq -> encoded message for the latest snapshot, shared by clients
+
+    def record(self, game_state):                           # returns the new sequence number
+        self.seq += 1
+        self.snapshots[self.seq] = capture(game_state)
+        self.times.append(time.monotonic())
+        trim(self.snapshots, self.times, self.keep, self.seconds)
+        self.deltas = {}
+        return self.seq
+
+    def message(self, acked):                               # encoded (seq, base, delta) for a client that acked this seq
+        base = acked if acked in self.snapshots else 0      # 0 = full snapshot
+        if base not in self.deltas:                         # clients that acked the same snapshot share one encoding
+            self.deltas[base] = self.encode((self.seq, base, diff(self.snapshots.get(base, {}), self.snapshots[self.seq])))
+        return self.deltas[base]
+
+class SnapshotBuffer:
+    '''Client side: the snapshots received so far, the latest one is what gets acked'''
+
+    def __init__(self, keep=HISTORY // 2, seconds=KEEP_SECONDS):
+        self.keep = keep
+        self.seconds = seconds
+        self.snapshots = OrderedDict()
+        self.times = deque()                                # when each of snapshots arrived, in the same order
+        self.latest = 0
+        self.entered = {}                                   # section -> keys new in the last snapshot applied
+        self.left = {}                                      # section -> keys gone from it
+
+    def apply(self, message):                               # game_state dict, or None if the base is gone
+        seq, base_seq, delta = message[:3]                  # a decoded message also has the OWNER fields
+        base = {} if base_seq == 0 else self.snapshots.get(base_seq)
+        if base is None:
+            return None
+        snapshot = patch(base, delta)
+        self.entered = {name: [key for key in snapshot[name] if key not in base.get(name, {})] for name in SECTIONS}
+        self.left = {name: [key for key in base.get(name, {}) if key not in snapshot[name]] for name in SECTIONS}
+        if seq not in self.snapshots:                       # a repeated one keeps its place
+            self.times.append(time.monotonic())
+        self.snapshots[seq] = snapshot
+        trim(self.snapshots, self.times, self.keep, self.seconds)
+        self.latest = max(self.latest, seq)
+        return to_game_state(snapshot)
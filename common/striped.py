@@ -0,0 +1,50 @@
+# striped.py
+# one file sent as byte ranges over several connections at the same time
+#
+# every stripe starts with a 16 byte header (offset, length) followed by the
+# raw bytes of that range. the receiver writes each range straight to its
+# offset with os.pwrite, all stripes share one file descriptor of a file that
+# already has its final size, so nothing has to be joined afterwards.
+import os
+import struct
+
+from common.filestream import CHUNK_SIZE, recv_exact, split_socket
+
+RANGE_HEADER = struct.Struct("!QQ")                         # offset, length
+
+def split_ranges(size, count):                              # count (offset, length) pairs covering size bytes
+    bounds = [size * i // count for i in range(count + 1)]
+    return [(bounds[i], bounds[i + 1] - bounds[i]) for i in range(count)]
+
+def send_range(sock, path, offset, length):
+    raw, _ = split_socket(sock)
+    raw.sendall(RANGE_HEADER.pack(offset, length))
+    if length:
+        with open(path, "rb") as file:
+            raw.sendfile(file, offset, length)
+
+def write_at(fd, data, position):
+    written = 0
+    while written < len(data):                              # pwrite may write less than asked
+        written += os.pwrite(fd, data[written:], position + written)
+
+def recv_range(sock, fd, buffer=None):                      # write one stripe into fd, returns the number of bytes
+    raw, pending = split_socket(sock)
+    pending = recv_exact(raw, RANGE_HEADER.size, pending)
+    offset, length = RANGE_HEADER.unpack_from(pending)
+    pending = pending[RANGE_HEADER.size:RANGE_HEADER.size + length]
+    write_at(fd, pending, offset)
+    position, end = offset + len(pending), offset + length
+    view = memoryview(buffer if buffer is not None else bytearray(CHUNK_SIZE))
+    while position < end:
+        n = raw.recv_into(view[:min(end - position, len(view))])
+        if n == 0:
+            raise ConnectionError(f"stripe at {offset} closed with {end - position} bytes missing")
+        write_at(fd, view[:n], position)
+        position += n
+    return length
+
+def open_target(path, size):                                # file every stripe writes into, already at its final size
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    os.ftruncate(fd, size)
+    return fd
\ No newline at end of file
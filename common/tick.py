@@ -0,0 +1,98 @@
+# tick.py
+# fixed-rate simulation loop for the game servers, with tick timing stats
+#
+# step(tick) runs every 1/rate seconds on its own thread and returns the bytes
+# it sent. a tick that overruns its budget only delays the next one: if the
+# loop falls more than a whole tick behind, the schedule starts over instead of
+# running the missed ticks back to back. every report_every seconds report()
+# gets the stats of the ticks since the last report. a step that raises is
+# printed and the loop goes on with the next tick, but after MAX_FAILURES
+# failed ticks in a row it stops and calls failed(): a server whose game
+# cannot advance should go down, not keep taking players it never sends a
+# state.
+import threading
+import time
+import traceback
+
+MAX_FAILURES = 30                                           # ticks in a row that raised before the loop gives up
+
+class TickStats:
+    '''Durations and bytes of the ticks since the last report'''
+
+    def __init__(self):
+        self.durations = []
+        self.late = 0                                       # ticks that took longer than their budget
+        self.failed = 0                                     # ticks whose step raised
+        self.sent = 0
+
+    def summary(self, seconds, rate):
+        durations = sorted(self.durations) or [0.0]
+        return {
+            "rate": rate,
+            "ticks": len(self.durations),
+            "avg_ms": sum(durations) / len(durations) * 1000,
+            "p99_ms": durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1000,
+            "max_ms": durations[-1] * 1000,
+            "late": self.late,
+            "failed": self.failed,
+            "sent_per_sec": self.sent / seconds,
+        }
+
+class TickLoop:
+    '''Calls step(tick) rate times per second on a background thread'''
+
+    def __init__(self, rate, step, report=None, report_every=5.0, failed=None, max_failures=MAX_FAILURES):
+        self.rate = rate
+        self.interval = 1 / rate
+        self.step = step
+        self.report = report
+        self.report_every = report_every
+        self.failed = failed                                # called once the loop has given up
+        self.max_failures = max_failures
+        self.stats = TickStats()
+        self.tick = 0
+        self.running = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def run(self):
+        next_tick = last_report = time.perf_counter()
+        failures = 0                                        # in a row
+        while self.running:
+            began = time.perf_counter()
+            try:
+                sent = self.step(self.tick) or 0
+                failures = 0
+            except Exception:
+                sent = 0
+                failures += 1
+                self.stats.failed += 1
+                if failures == 1:                           # the same error every tick is printed once
+                    traceback.print_exc()
+                if failures >= self.max_failures:
+                    print(f"> [Tick] {failures} ticks in a row failed, stopping the simulation")
+                    self.running = False
+                    if self.failed:
+                        self.failed()
+                    return
+            now = time.perf_counter()
+            self.tick += 1
+            self.stats.durations.append(now - began)
+            self.stats.sent += sent
+            if now - began > self.interval:
+                self.stats.late += 1
+            if self.report and now - last_report >= self.report_every:
+                self.report(self.stats.summary(now - last_report, self.rate))
+                self.stats = TickStats()
+                last_report = now
+            next_tick += self.interval
+            if next_tick < now - self.interval:             # far behind, do not try to catch up
+                next_tick = now
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
@@ -3,12 +3,16 @@ import threading
 import sys
 import os
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.framing import FramedSocket
+
 IP = socket.gethostbyname(socket.gethostname())
 PORT = 8308
 ADDR = (IP, PORT)
 SIZE = 1024
 FORMAT = "UTF-8"
 DISCONNECT_MSG = "disconnect"
+FRAMED = "--framed" in sys.argv                 # length-prefixed messages, server must use --framed too
 
 def handleServer(client):
     connected = True
@@ -31,6 +35,8 @@ def handleServer(client):
 def main():
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     client.connect(ADDR)
+    if FRAMED:
+        client = FramedSocket(client)
     print(f"> Client connected to {IP}:{PORT}")
 
     thread = threading.Thread(target=handleServer, args=(client,))
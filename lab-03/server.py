@@ -1,6 +1,17 @@
 import socket
 import threading
+import selectors
 import sys
+import os
+import time
+try:
+    import resource                             # only used to raise the open file limit on unix
+except ImportError:
+    resource = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.framing import FrameReader, FramedSocket, encode_frame
+from common.registry import ConnectionRegistry
 
 IP = socket.gethostbyname(socket.gethostname())
 PORT = 8308
@@ -8,16 +19,43 @@ ADDR = (IP, PORT)
 SIZE = 1024
 FORMAT = "UTF-8"
 DISCONNECT_MSG = "disconnect"
-clients = []
+ENGINE = "selectors" if "--selectors" in sys.argv else "threads"
+FRAMED = "--framed" in sys.argv                 # length-prefixed messages, clients must use --framed too
+clients = ConnectionRegistry()
+
+# state used only by the selectors engine
+selector = None
+waker_r, waker_w = None, None
+outgoing = []                                   # (conn, data) queued by the operator console
+outgoing_lock = threading.Lock()
+listener = None                                 # the listening socket while accepting is paused (out of fds)
+resume_at = 0.0                                 # monotonic time to try accepting again
+ACCEPT_RETRY = 1.0                              # seconds before accepting again if no connection closes first
+
+class Connection:
+    '''Per-client state kept by the selectors engine'''
+    __slots__ = ("conn", "addr", "outbuf", "closing", "reader")
+
+    def __init__(self, conn, addr):
+        self.conn = conn
+        self.addr = addr
+        self.outbuf = b""
+        self.closing = False
+        self.reader = FrameReader(SIZE) if FRAMED else None
 
 def send_message(msg, client):
-    conn = None
-    for c in clients:
-        if c[1] == client:
-            conn = c[0]
-            break
+    conn = clients.find(client)
     if conn is None:
         return False
+    if ENGINE == "selectors":
+        # sockets are owned by the event loop, so hand the message over to it
+        with outgoing_lock:
+            outgoing.append((conn, msg.encode(FORMAT)))
+        try:
+            waker_w.send(b"\0")
+        except BlockingIOError:
+            pass
+        return True
     try:
         conn.send(msg.encode(FORMAT))
     except OSError:
@@ -42,10 +80,7 @@ def handleClient(conn, addr):
         if recv_msg.lower() == DISCONNECT_MSG:
             send_msg += f"\n\t - Server is disconnected"
             connected = False
-            for c in clients:
-                if c[1] == addr:
-                    clients.remove(c)
-                    break
+            clients.remove(addr)
 
         try:
             conn.send(send_msg.encode(FORMAT))
@@ -54,15 +89,178 @@ def handleClient(conn, addr):
             connected = False
         print("\nSend message to (ip:port) : ", end="")
         sys.stdout.flush()
+    clients.remove(addr)
     print(f"\r> Connection {addr[0]}:{addr[1]} is disconnected.")
     conn.close()
-    
+
+def close_connection(state):
+    addr = state.addr
+    selector.unregister(state.conn)
+    clients.remove(addr)
+    print(f"\r> Connection {addr[0]}:{addr[1]} is disconnected.")
+    state.conn.close()
+    resume_accepting()                          # a file descriptor is free again
+
+def pause_accepting(server):                    # the listener stays readable, a level-triggered select would spin
+    global listener, resume_at
+    if listener is None:
+        selector.unregister(server)
+        listener = server
+        resume_at = time.monotonic() + ACCEPT_RETRY
+
+def resume_accepting():
+    global listener
+    if listener is not None:
+        selector.register(listener, selectors.EVENT_READ, "accept")
+        listener = None
+
+def queue_send(state, data):
+    if FRAMED:
+        data = encode_frame(data)
+    if not state.outbuf:
+        try:
+            sent = state.conn.send(data)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            close_connection(state)
+            return
+        data = data[sent:]
+        if not data:
+            return
+        selector.modify(state.conn, selectors.EVENT_READ | selectors.EVENT_WRITE, state)
+    state.outbuf += data
+
+def flush_outbuf(state):
+    try:
+        sent = state.conn.send(state.outbuf)
+    except BlockingIOError:
+        return
+    except OSError:
+        close_connection(state)
+        return
+    state.outbuf = state.outbuf[sent:]
+    if not state.outbuf:
+        if state.closing:
+            close_connection(state)
+        else:
+            selector.modify(state.conn, selectors.EVENT_READ, state)
+
+def client_readable(state):                     # same steps as handleClient, one recv at a time
+    addr = state.addr
+    try:
+        data = state.conn.recv(SIZE)
+    except BlockingIOError:
+        return
+    except OSError:
+        data = b""
+    if not data:
+        print(f"\r> Client {addr[0]}:{addr[1]} is disconnected.")
+        close_connection(state)
+        return
+
+    if FRAMED:
+        state.reader.feed(data)
+        messages = list(state.reader.frames())
+    else:
+        messages = [data]
+    for recv_msg in messages:
+        if state.closing or state.conn.fileno() == -1:
+            break
+        recv_msg = recv_msg.decode(FORMAT)
+        print(f"\r> Message from client {addr[0]}:{addr[1]} : {recv_msg}")
+        send_msg = f"MSG was received by server"
+
+        if recv_msg.lower() == DISCONNECT_MSG:
+            send_msg += f"\n\t - Server is disconnected"
+            state.closing = True
+
+        queue_send(state, send_msg.encode(FORMAT))
+    if state.closing and not state.outbuf and state.conn.fileno() != -1:
+        close_connection(state)
+    print("\nSend message to (ip:port) : ", end="")
+    sys.stdout.flush()
+
+def accept_clients(server):
+    while True:
+        try:
+            conn, addr = server.accept()
+        except BlockingIOError:
+            break
+        except OSError as e:                    # out of file descriptors, wait for one to be freed
+            print(f"\r> Accept failed : {e}, pausing accepts")
+            pause_accepting(server)
+            break
+        conn.setblocking(False)
+        clients.add(conn, addr)
+        selector.register(conn, selectors.EVENT_READ, Connection(conn, addr))
+        print(f"\r> New connection {addr[0]}:{addr[1]} is connected.")
+    print(f"> Current Active Connections : {len(clients)}")
+    print("\nSend message to (ip:port) : ", end="")
+    sys.stdout.flush()
+
+def drain_outgoing():
+    try:
+        while waker_r.recv(SIZE):
+            pass
+    except BlockingIOError:
+        pass
+    with outgoing_lock:
+        pending = outgoing[:]
+        outgoing.clear()
+    for conn, data in pending:
+        try:
+            key = selector.get_key(conn)
+        except (KeyError, ValueError):          # client went away before the loop got to it
+            print("Message was not sent, client is disconnected")
+            continue
+        queue_send(key.data, data)
+
+def setup_event_loop(server):
+    global selector, waker_r, waker_w
+    if resource is not None:                    # one file descriptor per idle client
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    selector = selectors.DefaultSelector()
+    waker_r, waker_w = socket.socketpair()      # lets the console thread wake up select()
+    waker_r.setblocking(False)
+    waker_w.setblocking(False)
+
+    server.setblocking(False)
+    selector.register(server, selectors.EVENT_READ, "accept")
+    selector.register(waker_r, selectors.EVENT_READ, "wake")
+
+def event_loop(server):                         # single thread serving every client
+    while True:
+        timeout = None if listener is None else max(0, resume_at - time.monotonic())
+        ready = selector.select(timeout)
+        if listener is not None and time.monotonic() >= resume_at:   # nothing closed while paused, try again
+            resume_accepting()
+        for key, events in ready:
+            if key.data == "accept":
+                accept_clients(server)
+            elif key.data == "wake":
+                drain_outgoing()
+            else:
+                state = key.data
+                if events & selectors.EVENT_WRITE:
+                    flush_outbuf(state)
+                if events & selectors.EVENT_READ and state.conn.fileno() != -1:
+                    client_readable(state)
+
 def sendMsg():
     while True:
-        client_addr = input("\nSend message to (ip:port) : ")
-        client_addr = (client_addr.split(":")[0], int(client_addr.split(":")[1]))
+        try:
+            client_addr = input("\nSend message to (ip:port) : ")
+            client_addr = (client_addr.split(":")[0], int(client_addr.split(":")[1]))
 
-        msg_input = input("Enter your message : ")
+            msg_input = input("Enter your message : ")
+        except EOFError:
+            return
+        except (IndexError, ValueError):
+            print("Enter the address as ip:port")
+            continue
 
         if not send_message(msg_input, client_addr):
             print(f"Message was not sent to {client_addr[0]}:{client_addr[1]}")
@@ -70,18 +268,27 @@ def sendMsg():
 def main():
     print("> Server is starting...")
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
     server.bind(ADDR)
 
-    server.listen()
-    print(f"Server is listening on {IP}:{PORT}")
+    server.listen(socket.SOMAXCONN)
+    print(f"Server is listening on {IP}:{PORT} ({ENGINE} engine)")
+
+    if ENGINE == "selectors":
+        setup_event_loop(server)
+        thread1 = threading.Thread(target=sendMsg, args=())
+        thread1.start()
+        event_loop(server)
 
     thread1 = threading.Thread(target=sendMsg, args=())
     thread1.start()
 
     while True:
         conn, addr = server.accept()
-        clients.append((conn, addr))
+        if FRAMED:
+            conn = FramedSocket(conn)
+        clients.add(conn, addr)
 
         thread2 = threading.Thread(target=handleClient, args=(conn, addr))
         thread2.start()
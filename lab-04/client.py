@@ -1,6 +1,10 @@
 import socket
 import threading
 import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.framing import FramedSocket
 
 IP = socket.gethostbyname(socket.gethostname())
 PORT = 8026
@@ -8,6 +12,9 @@ ADDR = (IP, PORT)
 SIZE = 1024
 FORMAT = "UTF-8"
 DISCONNECT_MSG = "disconnect"
+FRAMED = "--framed" in sys.argv     # length-prefixed messages, server must use --framed too
+# a fixed local port keeps our ip:port the same across reconnects, so stored messages find us
+LOCAL_PORT = next((int(arg.split("=")[1]) for arg in sys.argv if arg.startswith("--port=")), 0)
 
 def handle_client(client):
     connected = True
@@ -24,16 +31,21 @@ def handle_client(client):
         print("Enter ip:addr : ", end="")
         sys.stdout.flush()
 
-        if type != 'ack':
+        if not type.startswith('ack'):
             ack = f"Message recieved]\n"
-            send_msg = sender_client + "&" + ack + '&ack'
+            send_msg = sender_client + "&" + ack + '&ack' + type[3:]   # group messages are 'msg#<id>', ack with the same id
 
             client.send(send_msg.encode(FORMAT))
 
 def main():
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if LOCAL_PORT:
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        client.bind(('', LOCAL_PORT))
 
     client.connect(ADDR)
+    if FRAMED:
+        client = FramedSocket(client)
     print(f"> Client connected to {IP}:{PORT}")
 
     client_thread = threading.Thread(target = handle_client, args = (client,))
@@ -41,8 +53,12 @@ def main():
 
     connected = True
     while connected:
-        neigh_client = input("Enter ip:port : ")
-        if neigh_client.lower() != DISCONNECT_MSG:
+        neigh_client = input("Enter ip:port : ")          # or #group, * for everyone, join #group, leave #group
+        command = neigh_client.split(" ")[0].lower()
+        if command in ('join', 'leave') and len(neigh_client.split(" ")) == 2:
+            msg = neigh_client.split(" ")[1] + "&&" + command
+            client.send(msg.encode(FORMAT))
+        elif neigh_client.lower() != DISCONNECT_MSG:
             msg = input("Enter a message: ")
             msg = neigh_client + "&" + msg + '&msg'
             client.send(msg.encode(FORMAT))
@@ -0,0 +1,192 @@
+# message_log.py
+# append-only on-disk store for messages whose recipient is not connected
+#
+# messages go into numbered segment files, each record is
+#   [recipient length (2 bytes)][payload length (4 bytes)][seq (8 bytes)][recipient][payload]
+# seq goes up by one per message. an in-memory index maps every recipient to
+# its records, and load() puts them back in seq order: compact() moves old
+# records into the newest segment, so the segment order is not enough.
+# read() returns the oldest ones without removing them, only delivered()
+# writes them to the tombstone file once they were actually sent, so a
+# client that goes away mid-replay gets them again, in order. segments with
+# no live records left are deleted and compact(), run now and then by the
+# server, rewrites mostly delivered ones. a recipient holds at most MAX_PENDING messages and the log
+# MAX_BYTES of undelivered ones, append() refuses anything beyond that.
+import itertools
+import os
+import struct
+import threading
+from collections import deque
+
+RECORD = struct.Struct("!HIQ")                              # recipient length, payload length, seq
+TOMBSTONE = struct.Struct("!IQ")                            # segment id, record offset
+SEGMENT_SIZE = 4 * 1024 * 1024                              # start a new segment after this many bytes
+COMPACT_RATIO = 0.25                                        # rewrite sealed segments with fewer live records than this
+MAX_PENDING = 100000                                        # undelivered messages per recipient
+MAX_BYTES = 256 * 1024 * 1024                               # undelivered bytes in the whole log
+TOMBSTONES = "delivered.log"
+
+class MessageLog:
+    '''Messages for offline clients, indexed by recipient'''
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, max_pending=MAX_PENDING, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.live_bytes = 0                                 # size of the records not delivered yet
+        self.seq = 0                                        # of the last message appended
+        self.lock = threading.Lock()
+        self.index = {}                                     # recipient -> deque of (segment, offset, size)
+        self.live = {}                                      # segment -> records not delivered yet
+        self.total = {}                                     # segment -> records written
+        self.fds = {}                                       # segment -> open file descriptor
+        os.makedirs(directory, exist_ok=True)
+        self.active = self.load() + 1
+        self.active_size = 0
+        self.open_segment(self.active)
+        self.tomb_fd = os.open(self.path(TOMBSTONES), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def segment_path(self, segment):
+        return self.path(f"segment-{segment:06d}.log")
+
+    def open_segment(self, segment):
+        self.fds[segment] = os.open(self.segment_path(segment), os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self.live.setdefault(segment, 0)
+        self.total.setdefault(segment, 0)
+
+    def load(self):                                         # rebuild the index from the files on disk, returns the last segment id
+        delivered = set()
+        if os.path.exists(self.path(TOMBSTONES)):
+            with open(self.path(TOMBSTONES), "rb") as file:
+                data = file.read()
+            for i in range(0, len(data) - len(data) % TOMBSTONE.size, TOMBSTONE.size):
+                delivered.add(TOMBSTONE.unpack_from(data, i))
+
+        segments = sorted(int(name[8:14]) for name in os.listdir(self.directory) if name.startswith("segment-"))
+        found = {}                                          # recipient -> {seq: (segment, offset, size)}
+        for segment in segments:
+            with open(self.segment_path(segment), "rb") as file:
+                data = file.read()
+            self.open_segment(segment)
+            offset = 0
+            while offset + RECORD.size <= len(data):
+                key_size, size, seq = RECORD.unpack_from(data, offset)
+                end = offset + RECORD.size + key_size + size
+                if end > len(data):                         # torn write at the end of the segment
+                    break
+                self.total[segment] += 1
+                self.seq = max(self.seq, seq)
+                recipient = data[offset + RECORD.size:offset + RECORD.size + key_size].decode()
+                records = found.setdefault(recipient, {})
+                if (segment, offset) not in delivered and seq not in records:   # a second copy is a compact() cut short
+                    records[seq] = (segment, offset, end - offset)
+                    self.live[segment] += 1
+                    self.live_bytes += end - offset
+                offset = end
+        for recipient, records in found.items():
+            if records:
+                self.index[recipient] = deque(records[seq] for seq in sorted(records))
+        for segment in segments:
+            if self.live[segment] == 0:
+                self.drop_segment(segment)
+        # never reuse the id of a deleted segment, old tombstones may still point at it
+        return max(segments + [segment for segment, _ in delivered], default=0)
+
+    def append(self, recipient, payload):                   # False if the recipient or the log is full
+        key = recipient.encode()
+        with self.lock:
+            record = RECORD.pack(len(key), len(payload), self.seq + 1) + key + payload
+            if self.pending(recipient) >= self.max_pending or self.live_bytes + len(record) > self.max_bytes:
+                return False
+            self.seq += 1
+            if self.active_size + len(record) > self.segment_size and self.active_size:
+                self.active += 1                            # seal the current segment
+                self.active_size = 0
+                self.open_segment(self.active)
+            os.write(self.fds[self.active], record)         # one write per message, no user space buffer to flush
+            self.index.setdefault(recipient, deque()).append((self.active, self.active_size, len(record)))
+            self.live[self.active] += 1
+            self.total[self.active] += 1
+            self.active_size += len(record)
+            self.live_bytes += len(record)
+        return True
+
+    def pending(self, recipient):
+        records = self.index.get(recipient)
+        return len(records) if records else 0
+
+    def read(self, recipient, max_batch=256):               # oldest messages for recipient, still in the log
+        with self.lock:
+            records = self.index.get(recipient)
+            if not records:
+                return []
+            payloads = []
+            for segment, offset, size in itertools.islice(records, max_batch):
+                data = os.pread(self.fds[segment], size, offset)
+                key_size, _, _ = RECORD.unpack_from(data)
+                payloads.append(data[RECORD.size + key_size:])
+            return payloads
+
+    def delivered(self, recipient, count):                  # the first count messages of read() were sent, forget them
+        with self.lock:
+            records = self.index.get(recipient)
+            if not records:
+                return
+            batch = [records.popleft() for _ in range(min(count, len(records)))]
+            if not records:
+                del self.index[recipient]
+            os.write(self.tomb_fd, b"".join(TOMBSTONE.pack(segment, offset) for segment, offset, _ in batch))
+
+            for segment, _, size in batch:
+                self.live[segment] -= 1
+                self.live_bytes -= size
+            for segment in {segment for segment, _, _ in batch}:
+                if segment != self.active and self.live[segment] == 0:
+                    self.drop_segment(segment)
+
+    def drop_segment(self, segment):
+        os.close(self.fds.pop(segment))
+        os.remove(self.segment_path(segment))
+        del self.live[segment]
+        del self.total[segment]
+
+    def compact(self):                                      # move the few live records out of sealed segments
+        with self.lock:
+            sparse = [s for s in self.fds if s != self.active and self.live[s] < self.total[s] * COMPACT_RATIO]
+            if not sparse:
+                return
+            for recipient, records in self.index.items():
+                for i, (segment, offset, size) in enumerate(records):
+                    if segment in sparse:
+                        record = os.pread(self.fds[segment], size, offset)     # seq and all, load() sorts it back in place
+                        records[i] = (self.active, self.active_size, size)
+                        os.write(self.fds[self.active], record)
+                        self.live[self.active] += 1
+                        self.total[self.active] += 1
+                        self.active_size += size
+            for segment in sparse:
+                self.drop_segment(segment)
+            self.rewrite_tombstones()
+
+    def rewrite_tombstones(self):                           # forget tombstones of segments that are gone
+        with open(self.path(TOMBSTONES), "rb") as file:
+            data = file.read()
+        keep = b"".join(data[i:i + TOMBSTONE.size] for i in range(0, len(data) - len(data) % TOMBSTONE.size, TOMBSTONE.size)
+                        if TOMBSTONE.unpack_from(data, i)[0] in self.fds)
+        tmp = self.path(TOMBSTONES + ".tmp")
+        with open(tmp, "wb") as file:
+            file.write(keep)
+        os.replace(tmp, self.path(TOMBSTONES))
+        os.close(self.tomb_fd)
+        self.tomb_fd = os.open(self.path(TOMBSTONES), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def close(self):
+        with self.lock:
+            for fd in self.fds.values():
+                os.close(fd)
+            os.close(self.tomb_fd)
+            self.fds.clear()
@@ -1,5 +1,15 @@
 import socket
 import threading
+import sys
+import os
+import time
+import itertools
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.framing import FramedSocket
+from common.registry import ConnectionRegistry
+from common.outbound import OutboundQueue
+from message_log import MessageLog
 
 IP = socket.gethostbyname(socket.gethostname())
 PORT = 8026
@@ -7,63 +17,256 @@ ADDR = (IP, PORT)
 SIZE = 1024
 FORMAT = "UTF-8"
 DISCONNECT_MSG = "disconnect"
-clients = []
+FRAMED = "--framed" in sys.argv     # length-prefixed messages, clients must use --framed too
+SEND_TIMEOUT = 30                   # seconds to wait on a stalled client before dropping the message
+ACK_WINDOW = 5                      # seconds to collect group acks before the summary is sent anyway
+COMPACT_EVERY = 60                  # seconds between compactions of the offline message log
+BROADCAST = "*"                     # target that reaches every connected client
+OFFLINE_DIR = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--offline-dir=")),
+                   os.path.join(os.path.dirname(os.path.abspath(__file__)), "offline"))
+clients = ConnectionRegistry()      # addr -> OutboundQueue of that client
+groups = {}                         # group name -> set of member addrs
+pending_acks = {}                   # delivery id -> [sender addr, group, members reached (None while sending), acks, deadline]
+groups_lock = threading.Lock()
+ack_ids = itertools.count(1)
+message_log = None                  # MessageLog of messages for clients that are not connected
+replaying = {}                      # ip:port -> OutboundQueue of the connection whose stored messages are being replayed
+replay_lock = threading.Lock()      # a message for a client goes live or to the log, never both at once
 
 def find_conn(addr):
-    conn = None
-    for client in clients:
-        if client[1] == addr:
-            conn = client[0]
-    return conn
+    return clients.find(addr)
 
 def remove_conn(addr):
-    for client in clients:
-        if client[1] == addr:
-            clients.remove(client)
-            break
+    clients.remove(addr)
+    with groups_lock:
+        for name in [name for name, members in groups.items() if addr in members]:
+            groups[name].discard(addr)
+            if not groups[name]:
+                del groups[name]
+
+def addr_str(addr):
+    return addr[0] + ':' + str(addr[1])
+
+def send_from_server(addr, msg):    # short notice to one client, shown as coming from "server"
+    conn = find_conn(addr)
+    if conn is not None:
+        try:
+            conn.send(f"server&{msg}&ack".encode(FORMAT), SEND_TIMEOUT)
+        except BrokenPipeError:
+            pass
+
+def join_group(addr, name):
+    with groups_lock:
+        groups.setdefault(name, set()).add(addr)
+        size = len(groups[name])
+    send_from_server(addr, f"Joined {name} ({size} members)")
+
+def leave_group(addr, name):
+    with groups_lock:
+        members = groups.get(name, set())
+        members.discard(addr)
+        if not members:
+            groups.pop(name, None)
+    send_from_server(addr, f"Left {name}")
+
+def fan_out(addr, target, messages):               # encode once, same buffer goes to every member's writer
+    if target == BROADCAST:
+        members = [a for _, a in clients.snapshot() if a != addr]
+    else:
+        with groups_lock:
+            members = [a for a in groups.get(target, ()) if a != addr]
+    if not members:
+        send_from_server(addr, f"No one is in {target}")
+        return
+
+    ack_ids_sent, payloads = [], []
+    for msg, msg_type in messages:
+        ack_id = next(ack_ids) if msg_type == 'msg' else None
+        tagged_type = f"{msg_type}#{ack_id}" if ack_id else msg_type
+        payloads.append(f"{addr_str(addr)}&{msg}&{tagged_type}".encode(FORMAT))
+        if ack_id:
+            ack_ids_sent.append(ack_id)
+    wire = {}                                       # encoded buffers per wire format (raw or framed)
+
+    deadline = time.time() + ACK_WINDOW
+    with groups_lock:                               # before sending, a fast member can ack while the loop still runs
+        for ack_id in ack_ids_sent:
+            pending_acks[ack_id] = [addr, target, None, 0, deadline]
+
+    reached = 0
+    for member in members:
+        conn = find_conn(member)
+        if conn is None:
+            continue
+        if conn.framed not in wire:
+            wire[conn.framed] = [conn.encode(payload) for payload in payloads]
+        try:
+            if conn.send_encoded(wire[conn.framed], 0):    # a backed up member misses it instead of stalling everyone
+                reached += 1
+        except BrokenPipeError:
+            pass
+
+    with groups_lock:
+        for ack_id in ack_ids_sent:
+            if ack_id in pending_acks:
+                pending_acks[ack_id][2] = reached
+    for ack_id in ack_ids_sent:                     # every ack may be in already, or no one was reached
+        collect_ack(ack_id, count=False, force=reached == 0)
+
+def collect_ack(ack_id, count=True, force=False):  # one summary to the sender instead of one ack per member
+    with groups_lock:
+        entry = pending_acks.get(ack_id)
+        if entry is None:
+            return
+        if count:
+            entry[3] += 1
+        if not force and (entry[2] is None or entry[3] < entry[2]):
+            return
+        del pending_acks[ack_id]
+    sender, target, reached, acks, _ = entry
+    reached = acks if reached is None else reached  # expired before the sending was done
+    send_from_server(sender, f"Message received by {acks}/{reached} members of {target}")
+
+def expire_acks():                                  # members that never ack do not hold the summary back forever
+    while True:
+        time.sleep(1)
+        now = time.time()
+        with groups_lock:
+            expired = [ack_id for ack_id, entry in pending_acks.items() if entry[4] <= now]
+        for ack_id in expired:
+            collect_ack(ack_id, count=False, force=True)
+
+def relay(addr, target, msg, msg_type):              # everything except group/broadcast messages
+    if msg_type == 'join':
+        join_group(addr, target)
+        return
+    if msg_type == 'leave':
+        leave_group(addr, target)
+        return
+    if msg_type.startswith('ack#'):                 # ack for a group message, counted not relayed
+        collect_ack(int(msg_type[4:]))
+        return
+
+    neigh_addr = (target.split(":")[0], int(target.split(":")[1]))
+
+    send_msg = addr_str(addr) + '&' + msg + '&' + msg_type
+
+    with replay_lock:               # while a backlog is replayed, new messages queue up behind it in the log
+        neigh_conn = find_conn(neigh_addr)
+        stored = None
+        if neigh_conn is None or addr_str(neigh_addr) in replaying:
+            stored = message_log.append(addr_str(neigh_addr), send_msg.encode(FORMAT))
+    if stored is False:
+        print(f">[Offline] Too many messages stored for {neigh_addr}, message dropped.")
+        send_from_server(addr, f"Too many messages waiting for {target}, message dropped")
+    elif stored:
+        print(f">[Offline] No connection with {neigh_addr}, message stored for delivery.")
+    else:
+        try:
+            if not neigh_conn.send(send_msg.encode(FORMAT), SEND_TIMEOUT):
+                print(f">[Error] {neigh_addr} is not reading, message dropped.")
+        except BrokenPipeError:
+            print(f">[Error] Connection with {neigh_addr} is closed.")
+
+def replay_backlog(addr, outbound):                 # own thread, so other clients' traffic is not held up
+    key = addr_str(addr)
+    while True:
+        with replay_lock:
+            if replaying.get(key) is not outbound:  # the client came back on a new connection, its replay takes over
+                return
+            batch = message_log.read(key)
+            if not batch:                           # caught up, messages to this client go live again
+                del replaying[key]
+                break
+        try:
+            sent = outbound.send_encoded([outbound.encode(msg) for msg in batch], SEND_TIMEOUT) and outbound.flush(SEND_TIMEOUT)
+        except BrokenPipeError:
+            sent = False
+        with replay_lock:
+            if replaying.get(key) is not outbound:
+                return
+            if not sent:                            # client went away again, the messages stay in the log in order
+                del replaying[key]
+                return
+            message_log.delivered(key, len(batch))  # only now, once they were written to the client
+    print(f"> [Offline] Delivered stored messages to {key}.")
+
+def compact_log():                                  # on a timer, not on every delivery
+    while True:
+        time.sleep(COMPACT_EVERY)
+        message_log.compact()
 
-def handle_client(conn, addr):
+def handle_client(conn, addr, outbound):
     print(f"> New connection with {addr[0]}:{addr[1]} is connected.")
 
     connected = True
     while connected:
-        recv_msg = conn.recv(SIZE).decode(FORMAT)
-        if recv_msg != DISCONNECT_MSG:
-            neigh_addr = recv_msg.split("&")[0]
-            neigh_addr = (neigh_addr.split(":")[0], int(neigh_addr.split(":")[1]))
-
-            send_msg = addr[0] + ':' + str(addr[1]) + '&' + recv_msg.split("&")[1] + '&' + recv_msg.split("&")[2]
-
-            neigh_conn = find_conn(neigh_addr)
-            if(neigh_conn == None):
-                print(f">[Error] No connection with {neigh_addr} exists.")
-            else:
-                neigh_conn.send(send_msg.encode(FORMAT))
-        else:
-            remove_conn(addr)
-            connected = False
+        received = conn.recv_many() if FRAMED else [conn.recv(SIZE)]
+        run_target, run = None, []                  # consecutive messages to one group are fanned out together
+        for recv_msg in received or [b""]:
+            recv_msg = recv_msg.decode(FORMAT)
+            if not recv_msg or recv_msg == DISCONNECT_MSG:
+                connected = False
+                break
+            target, msg, msg_type = recv_msg.split("&")[:3]
+
+            if (target == BROADCAST or target.startswith('#')) and msg_type not in ('join', 'leave'):
+                if target != run_target and run:
+                    fan_out(addr, run_target, run)
+                    run = []
+                run_target = target
+                run.append((msg, msg_type))
+                continue
+            if run:
+                fan_out(addr, run_target, run)
+                run_target, run = None, []
+            relay(addr, target, msg, msg_type)
+        if run:
+            fan_out(addr, run_target, run)
+    remove_conn(addr)
     print(f">\n[Disconnect] Connection with {addr[0]}:{addr[1]} is closed.\n")
+    outbound.close()
+    outbound.writer.join(1)                     # give the writer a moment to flush what is queued
     conn.close()
 
 def main():
+    global message_log
     print("> Server is starting...")
+    message_log = MessageLog(OFFLINE_DIR)
 
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server.bind(ADDR)
 
     server.listen()
     print(f"Server is listening on {IP}:{PORT}")
 
-    print(f"> Current Active Connections : {threading.active_count() - 1}\n")
+    print(f"> Current Active Connections : {len(clients)}\n")
+
+    ack_thread = threading.Thread(target=expire_acks, daemon=True)
+    ack_thread.start()
+    compact_thread = threading.Thread(target=compact_log, daemon=True)
+    compact_thread.start()
 
     while True:
         conn, addr = server.accept()
-        clients.append((conn, addr))
+        if FRAMED:
+            conn = FramedSocket(conn)
+        outbound = OutboundQueue(conn)
+        with replay_lock:
+            clients.add(outbound, addr)
+            backlog = message_log.pending(addr_str(addr)) or addr_str(addr) in replaying
+            if backlog:                     # a replay still running for an old connection stops at its next batch
+                replaying[addr_str(addr)] = outbound
 
-        thread = threading.Thread(target=handle_client, args=(conn, addr))
+        thread = threading.Thread(target=handle_client, args=(conn, addr, outbound))
         thread.start()
 
-        print(f"> Current Active Connections : {threading.active_count() - 1}\n")
+        if backlog:
+            replay_thread = threading.Thread(target=replay_backlog, args=(addr, outbound))
+            replay_thread.start()
+
+        print(f"> Current Active Connections : {len(clients)}\n")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
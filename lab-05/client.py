@@ -1,12 +1,30 @@
 import socket                                               # importing libraries
 import threading
+import queue
+import sys
+import os
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.framing import FramedSocket
+from common import compress, dedup, filestream, resume
 
 IP = socket.gethostbyname(socket.gethostname())             # getting ip address
 PORT = 8305
 ADDR = (IP, PORT)                                           # address
 SIZE, FORMAT = 1024, "UTF-8"
 DISCONNECT_MSG = "disconnect"
+RESUME = "--resume" in sys.argv                             # interrupted transfers continue from a checkpoint
+DEDUP = "--dedup" in sys.argv                               # send only the chunks the other side does not have yet
+COMPRESS = "--compress" in sys.argv                         # compress files with a codec both sides support
+CODECS = next((arg.split('=', 1)[1].split(',') for arg in sys.argv if arg.startswith('--codecs=')), compress.PREFERENCE)
+STREAM = "--stream" in sys.argv or RESUME or DEDUP or COMPRESS  # stream file data with sendfile, any file type or size
+FRAMED = "--framed" in sys.argv or STREAM                   # length-prefixed messages, server must use the same flags
 file_status = 0
+resume_offsets = queue.Queue()                              # offsets the server asked us to resume from
+wanted_chunks = queue.Queue()                               # chunk lists the server asked for
+chunk_store = None                                          # chunks of files received with --dedup
+agreed_codecs = []                                          # codecs the server agreed to, empty until it answers
 
 current_input = ""
 def print_msg(msg):                                         # to print exact statement in same line in terminal
@@ -25,7 +43,7 @@ def handle_server(client):                                  # handle server to s
 
     while True:
         recv_msg = client.recv(SIZE).decode(FORMAT)         # receive message from server
-        msg_type, msg = recv_msg.split(';')
+        msg_type, msg = recv_msg.split(';', 1)
 
         if msg == DISCONNECT_MSG:                           # disconnect client if client send disconnect message
             break
@@ -38,16 +56,72 @@ def handle_server(client):                                  # handle server to s
             send_msg = 'w;' + send_ms + "file name."
             client.send(send_msg.encode(FORMAT))            # send message to client that file name is received
 
-            file_data = client.recv(SIZE).decode(FORMAT)    # receive file data from client
-            print_msg("> Received file data from server.")
-            file_data = file_data.split(';')[1]
-            with open(f'client/{file_path}', 'w') as file:  # write file data to file
-                file.write(file_data)
+            if STREAM:                                      # size header then raw bytes, written as they arrive
+                filestream.recv_file(client, f'client/{file_path}')
+                print_msg("> Received file data from server.")
+            else:
+                file_data = client.recv(SIZE).decode(FORMAT)    # receive file data from client
+                print_msg("> Received file data from server.")
+                file_data = file_data.split(';')[1]
+                with open(f'client/{file_path}', 'w') as file:  # write file data to file
+                    file.write(file_data)
             print_msg("> File is saved in client successfully.")
             
             send_msg = 'w;' + send_ms + "file data."
             client.send(send_msg.encode(FORMAT))            # send message to client that file data is received
 
+        elif msg_type == 'r':                               # resumable file offer: r;name;transfer id;size
+            _, file_path, transfer_id, size = recv_msg.split(';')
+            checkpoint = resume.Checkpoint(f'client/{file_path}', transfer_id, int(size))
+            offset = checkpoint.resume_offset()
+            client.send(f'o;{offset}'.encode(FORMAT))       # tell the server how much we already have
+            if offset:
+                print_msg(f"> Resuming '{file_path}' at {offset} of {size} bytes.")
+            try:
+                filestream.recv_file(client, f'client/{file_path}', checkpoint=checkpoint)
+            except ConnectionError:
+                print_msg(f"> Transfer of '{file_path}' interrupted, it will resume next time.")
+                break
+            print_msg("> File is saved in client successfully.")
+            send_msg = 'w;' + send_ms + "file data."
+            client.send(send_msg.encode(FORMAT))
+
+        elif msg_type == 'x':                               # compressed file: x;name;codec
+            _, file_path, codec = recv_msg.split(';')
+            try:
+                size, wire = compress.recv_stream(client, f'client/{file_path}', codec)
+            except ConnectionError:
+                print_msg(f"> Transfer of '{file_path}' interrupted.")
+                break
+            print_msg(f"> File is saved in client successfully ({size} bytes, {wire} on the wire with {codec}).")
+            send_msg = 'w;' + send_ms + "file data."
+            client.send(send_msg.encode(FORMAT))
+
+        elif msg_type == 'z':                               # codecs the server agreed to
+            agreed_codecs[:] = [name for name in msg.split(',') if name]
+
+        elif msg_type == 'm':                               # deduplicated file offer: m;name;size;manifest
+            _, file_path, size, manifest = recv_msg.split(';', 3)
+            digests = dedup.decode_manifest(manifest)
+            wanted = chunk_store.missing(digests)
+            client.send(f'n;{",".join(map(str, wanted))}'.encode(FORMAT))   # only the chunks we do not have
+            try:
+                dedup.recv_chunks(client, chunk_store, [digests[i] for i in wanted])
+            except (ConnectionError, ValueError) as e:
+                print_msg(f"> [Error] Transfer of '{file_path}' failed: {e}")
+                break
+            if chunk_store.assemble(digests, f'client/{file_path}') != int(size):
+                print_msg(f"> [Error] '{file_path}' does not have the offered size.")
+            print_msg(f"> File is saved in client successfully ({len(wanted)} of {len(digests)} chunks were new).")
+            send_msg = 'w;' + send_ms + "file data."
+            client.send(send_msg.encode(FORMAT))
+
+        elif msg_type == 'n':                               # chunks the server needs for the file we are sending
+            wanted_chunks.put([int(i) for i in msg.split(',') if i])
+
+        elif msg_type == 'o':                               # resume offset for the file we are sending
+            resume_offsets.put(int(msg))
+
         elif msg_type == 'w':                               # print message received from client if msg is acknoledgement
             msg = recv_msg.split(';')[1]
             print_msg(msg)
@@ -55,11 +129,51 @@ def handle_server(client):                                  # handle server to s
     client.close()
 
 
+def send_resumable(client, file_path):                      # offer the file, then send only what the server is missing
+    path = f"client/{file_path}"
+    size = os.path.getsize(path)
+    client.send(f'r;{file_path};{resume.transfer_id(path)};{size}'.encode(FORMAT))
+    try:
+        offset = resume_offsets.get(timeout=30)             # answered through handle_server
+    except queue.Empty:
+        print_msg("> [Error] Server did not answer the resume request.")
+        return
+    if offset:
+        print_msg(f"> Resuming '{file_path}' at {offset} of {size} bytes.")
+    filestream.send_file(client, path, offset)
+
+def send_compressed(client, file_path, codec):              # one frame per compressed chunk, memory stays flat
+    client.send(f'x;{file_path};{codec}'.encode(FORMAT))
+    start = time.time()
+    wire = compress.send_stream(client, f"client/{file_path}", codec)
+    size = os.path.getsize(f"client/{file_path}")
+    print_msg(f"> Sent '{file_path}' with {codec}: {wire} of {size} bytes in {time.time() - start:.2f}s.")
+
+def send_deduplicated(client, file_path):                   # offer the chunk list, then send only the missing chunks
+    path = f"client/{file_path}"
+    chunks = dedup.chunk_file(path)
+    size = os.path.getsize(path)
+    client.send(f'm;{file_path};{size};{dedup.encode_manifest(chunks)}'.encode(FORMAT))
+    try:
+        wanted = wanted_chunks.get(timeout=30)              # answered through handle_server
+    except queue.Empty:
+        print_msg("> [Error] Server did not answer the chunk list.")
+        return
+    sent = dedup.send_chunks(client, path, [chunks[i] for i in wanted])
+    print_msg(f"> Sent {len(wanted)} of {len(chunks)} chunks ({sent} of {size} bytes).")
+
 def main():
+    global chunk_store
+    if DEDUP:
+        chunk_store = dedup.ChunkStore('client/.chunks')
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # create socket
 
     client.connect(ADDR)                                        # connect to server
+    if FRAMED:
+        client = FramedSocket(client)
     print_msg(f"> Client connected to {IP}:{PORT}")             
+    if COMPRESS:
+        client.send(f"z;{','.join(CODECS)}".encode(FORMAT))  # offer our codecs, the answer comes to handle_server
 
     server_thread = threading.Thread(target=handle_server, args=(client,))
     server_thread.start()                                       # start thread to handle server
@@ -68,10 +182,25 @@ def main():
     while connected:
         file_path = input_msg("Enter the file name : ")       # take file name from user
 
+        codec = compress.choose(f"client/{file_path}", agreed_codecs) if COMPRESS and file_path != DISCONNECT_MSG else None
+        if codec:                                               # nothing agreed or not worth it: sent as it is below
+            send_compressed(client, file_path, codec)
+            continue
+        if DEDUP and file_path != DISCONNECT_MSG:
+            send_deduplicated(client, file_path)
+            continue
+        if RESUME and file_path != DISCONNECT_MSG:
+            send_resumable(client, file_path)
+            continue
+
         client.send(f'f;{file_path}'.encode(FORMAT))            # send file name to server
         if file_path == DISCONNECT_MSG:
             break
 
+        if STREAM:
+            filestream.send_file(client, f"client/{file_path}")     # zero-copy, never loads the whole file
+            continue
+
         with open(f"client/{file_path}", 'r') as file:          # read file data from file
             file_data = file.read()
 
@@ -1,12 +1,31 @@
 import socket                                               # importing libraries
 import threading
+import queue
+import sys
+import os
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.framing import FramedSocket
+from common.registry import ConnectionRegistry
+from common import compress, dedup, filestream, resume
 
 IP = socket.gethostbyname(socket.gethostname())             # getting ip address
 PORT = 8305                                                 # port number
 ADDR = (IP, PORT)
 SIZE, FORMAT = 1024, "UTF-8"
 DISCONNECT_MSG = "disconnect"
-clients = []
+RESUME = "--resume" in sys.argv                             # interrupted transfers continue from a checkpoint
+DEDUP = "--dedup" in sys.argv                               # send only the chunks the other side does not have yet
+COMPRESS = "--compress" in sys.argv                         # compress files with a codec both sides support
+CODECS = next((arg.split('=', 1)[1].split(',') for arg in sys.argv if arg.startswith('--codecs=')), compress.PREFERENCE)
+STREAM = "--stream" in sys.argv or RESUME or DEDUP or COMPRESS  # stream file data with sendfile, any file type or size
+FRAMED = "--framed" in sys.argv or STREAM                   # length-prefixed messages, clients must use the same flags
+clients = ConnectionRegistry()
+resume_offsets = {}                                         # addr -> queue of offsets that client asked us to resume from
+wanted_chunks = {}                                          # addr -> queue of chunk lists that client asked for
+chunk_store = None                                          # chunks of files received with --dedup
+agreed_codecs = {}                                          # addr -> codecs that client and this server both support
 
 current_input = ""
 def print_msg(msg):                                         # to print exact statement in same line in terminal
@@ -20,23 +39,27 @@ def input_msg(input_str):                                   # to take input from
     return output
 
 def find_conn(addr):                                        # find connection from clients using ip address
-    for conn, client_addr in clients:
-        if client_addr == addr:
-            return conn
-    return None
+    return clients.find(addr)
 
 def handle_client(conn, addr):                              # handle client to eceive file
     print_msg(f"> [New Connection] {addr[0]}:{addr[1]} is connected.")
     send_ms = "\r[Server] Successfully received "
 
     file_path = ''
+    resume_offsets[addr] = queue.Queue()
+    wanted_chunks[addr] = queue.Queue()
     while True:
-        recv_msg = conn.recv(SIZE).decode(FORMAT)
-        msg_type, msg = recv_msg.split(';')
+        try:
+            recv_msg = conn.recv(SIZE).decode(FORMAT)
+        except OSError:
+            recv_msg = ''
+        if not recv_msg:                                    # connection dropped without a disconnect message
+            recv_msg = 'f;' + DISCONNECT_MSG
+        msg_type, msg = recv_msg.split(';', 1)
 
         if msg == DISCONNECT_MSG:                           # disconnect client if client send disconnect message
             print_msg(f"> [Disconnected] {addr[0]}:{addr[1]} has disconnected.")
-            clients.remove((conn, addr))
+            clients.remove(addr)
             break
         
         if msg_type == 'f':                                 # to receive file from client
@@ -47,21 +70,117 @@ def handle_client(conn, addr):                              # handle client to e
             send_msg = 'w;' + send_ms + "file name."
             conn.send(send_msg.encode(FORMAT))              # send message to client that file name is received
 
-            file_data = conn.recv(SIZE).decode(FORMAT)      # receive file data from client
-            print_msg("> Received file data from client.")
-            with open(f'server/{file_path}', 'w') as file:
-                file.write(file_data)                       # write file data to file
+            if STREAM:                                      # size header then raw bytes, written as they arrive
+                filestream.recv_file(conn, f'server/{file_path}')
+                print_msg("> Received file data from client.")
+            else:
+                file_data = conn.recv(SIZE).decode(FORMAT)  # receive file data from client
+                print_msg("> Received file data from client.")
+                with open(f'server/{file_path}', 'w') as file:
+                    file.write(file_data)                   # write file data to file
             print_msg("> File is saved in server successfully.")
             
             send_msg = 'w;' + send_ms + "file data."
             conn.send(send_msg.encode(FORMAT))              # send message to client that file data is received
         
+        elif msg_type == 'r':                               # resumable file offer: r;name;transfer id;size
+            _, file_path, transfer_id, size = recv_msg.split(';')
+            checkpoint = resume.Checkpoint(f'server/{file_path}', transfer_id, int(size))
+            offset = checkpoint.resume_offset()
+            conn.send(f'o;{offset}'.encode(FORMAT))         # tell the client how much we already have
+            if offset:
+                print_msg(f"> Resuming '{file_path}' at {offset} of {size} bytes.")
+            try:
+                filestream.recv_file(conn, f'server/{file_path}', checkpoint=checkpoint)
+            except ConnectionError:
+                print_msg(f"> Transfer of '{file_path}' interrupted, it will resume next time.")
+                clients.remove(addr)
+                break
+            print_msg("> File is saved in server successfully.")
+            send_msg = 'w;' + send_ms + "file data."
+            conn.send(send_msg.encode(FORMAT))
+
+        elif msg_type == 'x':                               # compressed file: x;name;codec
+            _, file_path, codec = recv_msg.split(';')
+            try:
+                size, wire = compress.recv_stream(conn, f'server/{file_path}', codec)
+            except ConnectionError:
+                print_msg(f"> Transfer of '{file_path}' interrupted.")
+                clients.remove(addr)
+                break
+            print_msg(f"> File is saved in server successfully ({size} bytes, {wire} on the wire with {codec}).")
+            send_msg = 'w;' + send_ms + "file data."
+            conn.send(send_msg.encode(FORMAT))
+
+        elif msg_type == 'z' and COMPRESS:                  # codecs the client supports, answer with the ones we share
+            agreed_codecs[addr] = compress.agree(msg.split(','), CODECS)
+            conn.send(f"z;{','.join(agreed_codecs[addr])}".encode(FORMAT))
+
+        elif msg_type == 'm':                               # deduplicated file offer: m;name;size;manifest
+            _, file_path, size, manifest = recv_msg.split(';', 3)
+            digests = dedup.decode_manifest(manifest)
+            wanted = chunk_store.missing(digests)
+            conn.send(f'n;{",".join(map(str, wanted))}'.encode(FORMAT))   # only the chunks we do not have
+            try:
+                dedup.recv_chunks(conn, chunk_store, [digests[i] for i in wanted])
+            except (ConnectionError, ValueError) as e:
+                print_msg(f"> [Error] Transfer of '{file_path}' failed: {e}")
+                clients.remove(addr)
+                break
+            if chunk_store.assemble(digests, f'server/{file_path}') != int(size):
+                print_msg(f"> [Error] '{file_path}' does not have the offered size.")
+            print_msg(f"> File is saved in server successfully ({len(wanted)} of {len(digests)} chunks were new).")
+            send_msg = 'w;' + send_ms + "file data."
+            conn.send(send_msg.encode(FORMAT))
+
+        elif msg_type == 'n':                               # chunks the client needs for the file we are sending
+            wanted_chunks[addr].put([int(i) for i in msg.split(',') if i])
+
+        elif msg_type == 'o':                               # resume offset for a file we are sending
+            resume_offsets[addr].put(int(msg))
+
         elif msg_type == 'w':                               # print message received from client if msg is acknoledgement
             msg = recv_msg.split(';')[1]
             print_msg(msg)
     
+    resume_offsets.pop(addr, None)
+    wanted_chunks.pop(addr, None)
+    agreed_codecs.pop(addr, None)
     conn.close()
 
+def send_resumable(conn, addr, file_path):                  # offer the file, then send only what the client is missing
+    path = f"server/{file_path}"
+    size = os.path.getsize(path)
+    conn.send(f'r;{file_path};{resume.transfer_id(path)};{size}'.encode(FORMAT))
+    try:
+        offset = resume_offsets[addr].get(timeout=30)       # answered through handle_client
+    except (queue.Empty, KeyError):
+        print_msg("> [Error] Client did not answer the resume request.")
+        return
+    if offset:
+        print_msg(f"> Resuming '{file_path}' at {offset} of {size} bytes.")
+    filestream.send_file(conn, path, offset)
+
+def send_compressed(conn, file_path, codec):                # one frame per compressed chunk, memory stays flat
+    conn.send(f'x;{file_path};{codec}'.encode(FORMAT))
+    start = time.time()
+    wire = compress.send_stream(conn, f"server/{file_path}", codec)
+    size = os.path.getsize(f"server/{file_path}")
+    print_msg(f"> Sent '{file_path}' with {codec}: {wire} of {size} bytes in {time.time() - start:.2f}s.")
+
+def send_deduplicated(conn, addr, file_path):               # offer the chunk list, then send only the missing chunks
+    path = f"server/{file_path}"
+    chunks = dedup.chunk_file(path)
+    size = os.path.getsize(path)
+    conn.send(f'm;{file_path};{size};{dedup.encode_manifest(chunks)}'.encode(FORMAT))
+    try:
+        wanted = wanted_chunks[addr].get(timeout=30)        # answered through handle_client
+    except (queue.Empty, KeyError):
+        print_msg("> [Error] Client did not answer the chunk list.")
+        return
+    sent = dedup.send_chunks(conn, path, [chunks[i] for i in wanted])
+    print_msg(f"> Sent {len(wanted)} of {len(chunks)} chunks ({sent} of {size} bytes).")
+
 def send_file():                                            # to send file to client
     while True:
         if len(clients) == 0:
@@ -75,16 +194,36 @@ def send_file():                                            # to send file to cl
             continue
         file_path = input_msg("Enter the file name : ")     # get file name from user
 
+        codec = None
+        if COMPRESS and file_path.split('/')[0] != DISCONNECT_MSG:
+            codec = compress.choose(f"server/{file_path}", agreed_codecs.get((ip, int(port)), []))
+        if codec:
+            send_compressed(conn, file_path, codec)
+            continue
+        if DEDUP and file_path.split('/')[0] != DISCONNECT_MSG:
+            send_deduplicated(conn, (ip, int(port)), file_path)
+            continue
+        if RESUME and file_path.split('/')[0] != DISCONNECT_MSG:
+            send_resumable(conn, (ip, int(port)), file_path)
+            continue
+
         conn.send(f"f;{file_path}".encode(FORMAT))          # send file name to client
         if file_path.split('/')[0] == DISCONNECT_MSG:
             break
 
+        if STREAM:
+            filestream.send_file(conn, f"server/{file_path}")   # zero-copy, never loads the whole file
+            continue
+
         with open( f"server/{file_path}", 'r') as file:     # read file data from file
             file_data = file.read()
         conn.send(f"f;{file_data}".encode(FORMAT))          # send file data to client
 
 def main():
+    global chunk_store
     print_msg("> Server is starting...")
+    if DEDUP:
+        chunk_store = dedup.ChunkStore('server/.chunks')
 
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # create socket
     server.bind(ADDR)                                           # bind socket to address = (ip, port)
@@ -98,7 +237,9 @@ def main():
 
     while True:
         conn, addr = server.accept()                            # accept connection from client
-        clients.append((conn, addr))                            # add client to clients list
+        if FRAMED:
+            conn = FramedSocket(conn)
+        clients.add(conn, addr)                                 # add client to clients list
 
         client_thread = threading.Thread(target = handle_client, args=(conn, addr))
         client_thread.start()                                   # create thread to handle client
@@ -2,7 +2,17 @@
 # CS21B2019 DEVARAKONDA SLR SIDDESH
 import socket                                               # importing libraries
 import threading
+import queue
+import sys
+import os
 from time import sleep
+from contextlib import closing
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.framing import FramedSocket, encode_frame
+from common import dedup, integrity, mux, resume, striped
+from common.filestream import CHUNK_SIZE
+from common.filewriter import FileWriter
 
 # IP = socket.gethostbyname(socket.gethostname())             # getting ip address
 IP = ''
@@ -10,7 +20,19 @@ PORT = 8011
 ADDR = (IP, PORT)                                           # address
 SIZE, FORMAT = 1024, "UTF-8"
 DISCONNECT_MSG = "disconnect"
+RESUME = "--resume" in sys.argv                             # interrupted transfers continue from a checkpoint
+STRIPES = int(next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--stripes=')), 0))  # send files over N connections
+DEDUP = "--dedup" in sys.argv                               # send only the chunks the receiver does not have yet
+VERIFY = "--verify" in sys.argv                             # check every chunk and the whole file, ask again for bad chunks
+MUX = "--mux" in sys.argv                                   # files and messages share the connection as channels, server must use --mux too
+FRAMED = "--framed" in sys.argv or RESUME or DEDUP or VERIFY or MUX or STRIPES > 0   # length-prefixed messages, server must use --framed too
+MAX_REPAIRS = 3                                             # rounds of asking for bad chunks before giving up
+FILE_CHUNK = CHUNK_SIZE if FRAMED else SIZE                 # frames keep file data apart from messages, so send big pieces
 file_status = 0
+resume_offsets = queue.Queue()                              # offsets the receiving client asked us to resume from
+wanted_chunks = queue.Queue()                               # chunk lists the receiving client asked for
+chunk_store = None                                          # chunks of files received with --dedup
+sent_files = {}                                             # (receiver, name) -> path, to answer chunk requests
 
 current_input = ""
 def print_msg(msg):                                         # to print exact statement in same line in terminal
@@ -22,8 +44,55 @@ def input_msg(input_str):                                   # to take input from
     output = input(f"\r{input_str}")
     return output
 
+def receive_resumable(client, neigh_client, file_name, checkpoint):    # file data into the .part file, checkpointed
+    with checkpoint.open() as file:
+        file_data = client.recv(SIZE)
+        while file_data not in (b'EOF', b'ABORT', b''):
+            file.write(file_data)
+            checkpoint.update(file, file.tell())
+            file_data = client.recv(SIZE)
+        if file_data != b'EOF':                             # sender went away, keep what we have for the next attempt
+            checkpoint.save(file, file.tell())
+            print_msg(f"> Transfer of '{file_name}' from {neigh_client} interrupted at {file.tell()} bytes.")
+            return False
+    checkpoint.finish()
+    return True
+
+def open_stripe(kind, transfer_id, index):                  # extra connection to the server for one stripe
+    stripe = FramedSocket(socket.create_connection(ADDR))
+    stripe.send(f'{kind};{transfer_id};{index}'.encode(FORMAT))
+    return stripe
+
+def receive_striped(client, neigh_client, file_name, transfer_id, size, count):
+    fd = striped.open_target(f'files/{file_name}', size)
+    errors = []
+
+    def receive(index):
+        try:
+            with closing(open_stripe('j', transfer_id, index)) as stripe:
+                striped.recv_range(stripe, fd)
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=receive, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    os.close(fd)
+    if errors:
+        print_msg(f"> Striped transfer of '{file_name}' from {neigh_client} failed: {errors[0]}")
+        client.send(f'w;{neigh_client};[Client] Striped transfer of {file_name} failed.'.encode(FORMAT))
+        return
+    print_msg(f"> Created file '{file_name}' successfully ({count} stripes).")
+    client.send(f'w;{neigh_client};[Client] Received the file data successfully.'.encode(FORMAT))
+
 def handle_server(client):                                  # handle server receive file and acknowledgement
     file_name = ''
+    incoming = {}                                           # transfer id -> Checkpoint of offered files
+    manifests = {}                                          # (sender, name) -> (digests, wanted, size) of chunked offers
+    received = {}                                           # (sender, name) -> (ChunkHasher, size) until the trailer arrives
+    repairs = {}                                            # (sender, name) -> [whole digest, chunk digests, size, rounds]
 
     while True:
         recv_msg = client.recv(SIZE).decode(FORMAT)         # receive message from server
@@ -31,57 +100,314 @@ def handle_server(client):                                  # handle server rece
         msg_type = recv_msg.split(';')[0]
         neigh_client = recv_msg.split(';')[1]
         
-        if msg_type == 'f':                                 # if msg type is file
+        if msg_type == 'f' and len(recv_msg.split(';')) == 5:  # resumable file: f;sender;name;transfer id;offset
+            _, _, file_name, transfer_id, offset = recv_msg.split(';')
+            checkpoint = incoming.pop(transfer_id, None) or resume.Checkpoint(f'files/{file_name}', transfer_id, 0)
+            if checkpoint.saved != int(offset):             # sender starts somewhere else, follow it
+                checkpoint.resume_offset()
+                checkpoint.saved = min(checkpoint.saved, int(offset))
+            if receive_resumable(client, neigh_client, file_name, checkpoint):
+                print_msg(f"> Created file '{file_name}' successfully.")
+                send_msg = f'w;{neigh_client};[Client] Received the file data successfully.'
+                client.send(send_msg.encode(FORMAT))
+
+        elif msg_type == 'r':                               # resumable offer: r;sender;name;transfer id;size
+            _, _, file_name, transfer_id, size = recv_msg.split(';')
+            checkpoint = resume.Checkpoint(f'files/{file_name}', transfer_id, int(size))
+            offset = checkpoint.resume_offset()
+            incoming[transfer_id] = checkpoint
+            if offset:
+                print_msg(f"> Resuming '{file_name}' from {neigh_client} at {offset} of {size} bytes.")
+            client.send(f'o;{neigh_client};{transfer_id};{offset}'.encode(FORMAT))
+
+        elif msg_type == 's':                               # striped file: s;sender;name;transfer id;size;stripes
+            _, _, file_name, transfer_id, size, count = recv_msg.split(';')
+            threading.Thread(target=receive_striped,
+                             args=(client, neigh_client, file_name, transfer_id, int(size), int(count))).start()
+
+        elif msg_type == 'm':                               # deduplicated file offer: m;sender;name;size;manifest
+            _, _, file_name, size, manifest = recv_msg.split(';', 4)
+            digests = dedup.decode_manifest(manifest)
+            wanted = chunk_store.missing(digests)
+            manifests[(neigh_client, file_name)] = (digests, wanted, int(size))
+            client.send(f'n;{neigh_client};{file_name};{",".join(map(str, wanted))}'.encode(FORMAT))
+
+        elif msg_type == 'c':                               # the missing chunks, one frame each, then EOF
             file_name = recv_msg.split(';')[2]
+            digests, wanted, size = manifests.pop((neigh_client, file_name))
+            try:
+                dedup.recv_chunks(client, chunk_store, [digests[i] for i in wanted])
+                if client.recv(SIZE) != b'EOF':
+                    raise ConnectionError("sender stopped before the end of the chunks")
+            except (ConnectionError, ValueError) as e:
+                print_msg(f"> [Error] Transfer of '{file_name}' from {neigh_client} failed: {e}")
+                continue
+            chunk_store.assemble(digests, f'files/{file_name}')
+            print_msg(f"> Created file '{file_name}' successfully ({len(wanted)} of {len(digests)} chunks were new).")
+            client.send(f'w;{neigh_client};[Client] Received the file data successfully.'.encode(FORMAT))
+
+        elif msg_type == 'n':                               # chunks the receiver needs: n;receiver;name;indices
+            wanted_chunks.put([int(i) for i in recv_msg.split(';')[3].split(',') if i])
+
+        elif msg_type == 'o':                               # resume offset for the file we are sending
+            resume_offsets.put(int(recv_msg.split(';')[3]))
+
+        elif msg_type == 'f':                               # if msg type is file: f;sender;name[;size]
+            file_info = recv_msg.split(';')
+            file_name = file_info[2]
+            size = int(file_info[3]) if len(file_info) > 3 else None
 
             print_msg(f"> Received file name from {neigh_client} successfully.")
-            with open(f'files/{file_name}', 'wb') as file: # create file with file name sent by another client
-                pass
+            hasher = integrity.ChunkHasher() if VERIFY else None
+            writer = FileWriter(f'files/{file_name}', size, hasher=hasher)  # opened once, written (and hashed) on a background thread
 
             send_msg = f"w;{neigh_client};[Client] Received file name successfully."
             client.send(send_msg.encode(FORMAT))            # send message that file name is received
 
             file_data = client.recv(SIZE)
-            while file_data != b'EOF':                      # to receive and write file data as packets (1024 bytes at a time)
-                with open(f'files/{file_name}', 'ab') as file: # open file in append mode (appending binary data)
-                    file.write(file_data)                   # write file data to file
+            while file_data not in (b'EOF', b'ABORT', b''): # to receive and write file data as packets
+                writer.write(file_data)                     # queued, the disk never holds up the socket
                 file_data = client.recv(SIZE)
+            writer.close()
+            if file_data != b'EOF':                         # ABORT or closed: the sender went away, drop the partial file
+                os.remove(f'files/{file_name}')
+                print_msg(f"> Transfer of '{file_name}' from {neigh_client} was interrupted, partial file removed.")
+                continue
+            if hasher:                                      # checked once the trailer arrives
+                received[(neigh_client, file_name)] = (hasher, size)
             print_msg(f"> Received file data from {neigh_client} successfully.")
             print_msg(f"> Created file '{file_name}' successfully.")
 
             send_msg = f'w;{neigh_client};[Client] Received the file data successfully.'
             client.send(send_msg.encode(FORMAT))            # send message to server that file is received
 
+        elif msg_type == 'v':                               # digests of the file we just received: v;sender;name;whole;chunks
+            _, _, file_name, trailer = recv_msg.split(';', 3)
+            whole, expected = integrity.decode_trailer(trailer)
+            hasher, size = received.pop((neigh_client, file_name))
+            got_whole, got = hasher.finish()
+            if got_whole == whole and got == expected:
+                print_msg(f"> Verified '{file_name}' ({len(got)} chunks).")
+                client.send(f'w;{neigh_client};[Client] {file_name} verified.'.encode(FORMAT))
+            else:
+                repairs[(neigh_client, file_name)] = [whole, expected, size, 0]
+                request_chunks(client, neigh_client, file_name, integrity.bad_chunks(expected, got), repairs)
+
+        elif msg_type == 'k':                               # chunks we asked for again: k;sender;name;indices, frames, EOF
+            _, _, file_name, indices = recv_msg.split(';', 3)
+            whole, expected, size, _ = repairs[(neigh_client, file_name)]
+            path = f'files/{file_name}'
+            bad = []
+            for index in map(int, indices.split(',')):
+                data = client.recv(SIZE)
+                if integrity.chunk_digest(data) == expected[index]:
+                    integrity.write_chunk(path, index, data)
+                else:
+                    bad.append(index)
+            if client.recv(SIZE) != b'EOF':
+                print_msg(f"> [Error] Repair of '{file_name}' from {neigh_client} was cut short.")
+                continue
+            if bad:
+                request_chunks(client, neigh_client, file_name, bad, repairs)
+                continue
+            if size is not None:
+                os.truncate(path, size)                     # a repaired last chunk may have been short before
+            del repairs[(neigh_client, file_name)]
+            ok = integrity.file_digest(path) == whole
+            print_msg(f"> {'Verified' if ok else '[Error] Could not verify'} '{file_name}' after repairing chunks.")
+            client.send(f'w;{neigh_client};[Client] {file_name} {"verified" if ok else "is corrupt"}.'.encode(FORMAT))
+
+        elif msg_type == 'q':                               # receiver asks for chunks again: q;receiver;name;indices
+            _, _, file_name, indices = recv_msg.split(';', 3)
+            send_chunks_again(client, neigh_client, file_name, [int(i) for i in indices.split(',')])
+
         elif msg_type == 'w':                               # print message received from client if msg is acknoledgement
             msg = recv_msg.split(';')[2]
             print_msg(msg)
 
     client.close()
 
+def handle_mux_server(client, channels):                   # frames of many channels: acks on the control channel, one file per other channel
+    incoming = {}                                           # channel -> (sender, name, FileWriter)
+
+    while True:
+        frame = client.recv(SIZE)
+        if not frame:
+            break
+        channel, payload = mux.split(frame)
+
+        if channel in incoming:                             # file data, or the end of the file
+            neigh_client, file_name, writer = incoming[channel]
+            if payload not in mux.STOP_FRAMES:
+                writer.write(payload)
+                continue
+            del incoming[channel]
+            writer.close()
+            if payload == b'ABORT':
+                print_msg(f"> [Error] Transfer of '{file_name}' from {neigh_client} was aborted.")
+                continue
+            print_msg(f"> Created file '{file_name}' successfully.")
+            channels.send(f'w;{neigh_client};[Client] Received {file_name} successfully.'.encode(FORMAT))
+            continue
+
+        recv_msg = payload.decode(FORMAT)
+        msg_type, neigh_client, msg = recv_msg.split(';', 2)
+        if channel == mux.CONTROL:
+            if msg_type == 'w':
+                print_msg(msg)
+            continue
+
+        file_info = msg.split(';')                          # a new channel starts with f;sender;name;size
+        file_name = file_info[0]
+        size = int(file_info[1]) if len(file_info) > 1 else None
+        incoming[channel] = (neigh_client, file_name, FileWriter(f'files/{file_name}', size))
+        print_msg(f"> Receiving '{file_name}' from {neigh_client}.")
+
+    for _, _, writer in incoming.values():
+        writer.close()
+    client.close()
+
+def request_chunks(client, neigh_client, file_name, bad, repairs):   # ask the sender for bad chunks, a few rounds at most
+    state = repairs[(neigh_client, file_name)]
+    state[3] += 1
+    if state[3] > MAX_REPAIRS:
+        del repairs[(neigh_client, file_name)]
+        print_msg(f"> [Error] '{file_name}' from {neigh_client} is corrupt, {len(bad)} chunks could not be repaired.")
+        client.send(f'w;{neigh_client};[Client] {file_name} is corrupt.'.encode(FORMAT))
+        return
+    print_msg(f"> {len(bad)} chunks of '{file_name}' failed verification, asking for them again.")
+    client.send(f'q;{neigh_client};{file_name};{",".join(map(str, bad))}'.encode(FORMAT))
+
+def send_verified(client, neigh_client, file_name):        # file frames, then the digest of every chunk and of the whole file
+    hasher = integrity.ChunkHasher()
+    sent_files[(neigh_client, file_name)] = file_name
+    client.send(f'f;{neigh_client};{file_name};{os.path.getsize(file_name)}'.encode(FORMAT))
+    with client.send_lock, open(file_name, 'rb') as file:   # nothing else may land between the frames of the file
+        for file_data in iter(lambda: file.read(FILE_CHUNK), b''):
+            hasher.update(file_data)                        # hashed while it is read, no second pass
+            client.sock.sendall(encode_frame(file_data))
+        client.sock.sendall(encode_frame(b'EOF'))
+    whole, chunks = hasher.finish()
+    client.send(f'v;{neigh_client};{file_name};{integrity.encode_trailer(whole, chunks)}'.encode(FORMAT))
+
+def send_chunks_again(client, neigh_client, file_name, indices):
+    path = sent_files.get((neigh_client, file_name))
+    if path is None:
+        return
+    frames = [f'k;{neigh_client};{file_name};{",".join(map(str, indices))}'.encode(FORMAT)]
+    frames += [integrity.read_chunk(path, index) for index in indices] + [b'EOF']
+    with client.send_lock:
+        client.sock.sendall(b''.join(encode_frame(frame) for frame in frames))
+
+def send_resumable(client, neigh_client, file_name):       # offer the file, then send only what the receiver is missing
+    transfer_id = resume.transfer_id(file_name)
+    size = os.path.getsize(file_name)
+    client.send(f'r;{neigh_client};{file_name};{transfer_id};{size}'.encode(FORMAT))
+    try:
+        offset = resume_offsets.get(timeout=30)             # answered through handle_server
+    except queue.Empty:
+        print_msg(f"> [Error] {neigh_client} did not answer the resume request.")
+        return
+    if offset:
+        print_msg(f"> Resuming '{file_name}' at {offset} of {size} bytes.")
+
+    client.send(f'f;{neigh_client};{file_name};{transfer_id};{offset}'.encode(FORMAT))
+    with open(file_name, 'rb') as file:
+        file.seek(offset)
+        while True:
+            file_data = file.read(FILE_CHUNK)
+            if not file_data:
+                client.send(b"EOF")
+                break
+            client.send(file_data)
+
+def send_deduplicated(client, neigh_client, file_name):    # offer the chunk list, then send only the missing chunks
+    chunks = dedup.chunk_file(file_name)
+    size = os.path.getsize(file_name)
+    client.send(f'm;{neigh_client};{file_name};{size};{dedup.encode_manifest(chunks)}'.encode(FORMAT))
+    try:
+        wanted = wanted_chunks.get(timeout=30)              # answered through handle_server
+    except queue.Empty:
+        print_msg(f"> [Error] {neigh_client} did not answer the chunk list.")
+        return
+    client.send(f'c;{neigh_client};{file_name}'.encode(FORMAT))
+    sent = dedup.send_chunks(client, file_name, [chunks[i] for i in wanted])
+    client.send(b"EOF")
+    print_msg(f"> Sent {len(wanted)} of {len(chunks)} chunks ({sent} of {size} bytes).")
+
+def send_striped(client, neigh_client, file_name, count):  # each range of the file over its own connection
+    transfer_id = resume.transfer_id(file_name)
+    size = os.path.getsize(file_name)
+    client.send(f's;{neigh_client};{file_name};{transfer_id};{size};{count}'.encode(FORMAT))
+
+    def send(index, offset, length):
+        try:
+            with closing(open_stripe('d', transfer_id, index)) as stripe:
+                striped.send_range(stripe, file_name, offset, length)
+        except OSError as e:
+            print_msg(f"> [Error] stripe {index} of '{file_name}' failed: {e}")
+
+    threads = [threading.Thread(target=send, args=(i, offset, length))
+               for i, (offset, length) in enumerate(striped.split_ranges(size, count))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
 def main():
+    global chunk_store
+    if DEDUP:
+        chunk_store = dedup.ChunkStore('files/.chunks')
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # create socket
 
     client.connect(ADDR)                                        # connect to server
+    if FRAMED:
+        client = FramedSocket(client)
     print_msg(f"> Client connected to {IP}:{PORT}")
 
-    server_thread = threading.Thread(target=handle_server, args=(client,))
+    channels = mux.Mux(client) if MUX else None                 # sends the files of every channel in turns
+    if MUX:
+        server_thread = threading.Thread(target=handle_mux_server, args=(client, channels))
+    else:
+        server_thread = threading.Thread(target=handle_server, args=(client,))
     server_thread.start()                                       # start thread to handle server
 
     connected = True
     while connected:
         neigh_client = input_msg("Enter ip:port of the client to send : ")  # take ip address from user
         if neigh_client.lower() == DISCONNECT_MSG:
+            if MUX:
+                channels.close()                                # files still being sent go out first
+                client.send(mux.pack(mux.CONTROL, DISCONNECT_MSG.encode(FORMAT)))
+                break
             client.send(DISCONNECT_MSG.encode(FORMAT))          # send disconnect message to server
             break
 
         file_name = input_msg("Enter the file name : ")         # take file name from user
 
-        file = 'f;' + neigh_client + ';' + file_name            # create file path to send to server
+        if MUX:                                                 # returns at once, the file is sent alongside the others
+            header = f'f;{neigh_client};{file_name};{os.path.getsize(file_name)}'
+            channels.open(mux.file_frames(file_name, header.encode(FORMAT)))
+            continue
+        if DEDUP:
+            send_deduplicated(client, neigh_client, file_name)
+            continue
+        if VERIFY:
+            send_verified(client, neigh_client, file_name)
+            continue
+        if STRIPES:
+            send_striped(client, neigh_client, file_name, STRIPES)
+            continue
+        if RESUME:
+            send_resumable(client, neigh_client, file_name)
+            continue
+
+        file = f'f;{neigh_client};{file_name};{os.path.getsize(file_name)}'  # size lets the receiver preallocate
         client.send(file.encode(FORMAT))                        # send file name to server
 
         with open(file_name, 'rb') as file:                     # open file in read binary mode
             while True:                                 # to read and send file data as packets (1024 bytes at a time)
-                file_data = file.read(SIZE)
+                file_data = file.read(FILE_CHUNK)
                 if not file_data:
                     sleep(0.1)
                     client.send(b"EOF")
@@ -3,6 +3,15 @@
 # DEVARAKONDA SLR SIDDESH
 import socket                                               # importing libraries
 import threading
+import sys
+import os
+import itertools
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.framing import FramedSocket
+from common.registry import ConnectionRegistry
+from common.filestream import split_socket
+from common import mux, relay
 
 # IP = socket.gethostbyname(socket.gethostname())             # getting ip address
 IP =''
@@ -10,7 +19,13 @@ PORT = 8011                                                 # port number
 ADDR = (IP, PORT)
 SIZE, FORMAT = 1024, "UTF-8"
 DISCONNECT_MSG = "disconnect"
-clients = []
+MUX = "--mux" in sys.argv                                   # every frame carries a channel id, clients must use --mux too
+FRAMED = "--framed" in sys.argv or "--resume" in sys.argv or MUX   # length-prefixed messages, clients must use --framed (or --resume) too
+clients = ConnectionRegistry()
+stripes = {}                                                # (transfer id, stripe) -> (connection waiting for its other end, its timer)
+stripes_lock = threading.Lock()
+STRIPE_TIMEOUT = 30                                         # seconds a stripe waits for its other end
+channel_ids = itertools.count(1)                            # channels the server opens towards receiving clients
 
 current_input = ""
 def print_msg(msg):                                         # to print exact statement in same line in terminal
@@ -24,60 +39,192 @@ def input_msg(input_str):                                   # to take input from
     return output
 
 def find_conn(addr):                                        # find connection from clients using ip address
-    for conn, client_addr in clients:
-        if client_addr == addr:
-            return conn
-    return None
+    return clients.find(addr)
+
+def recv_data(conn):                                        # next chunk of file data, b'' once the sender is gone
+    try:
+        return conn.recv(SIZE)
+    except OSError:
+        return b''
+
+def relay_raw(conn, neigh_conn):                            # unframed file data up to b'EOF', returns (b'EOF' or b'', delivered)
+    file_data = recv_data(conn)                             # receive file data from client
+    while file_data:                                        # to receive and send file data as packets (1024 bytes at a time until EOF)
+        if neigh_conn is not None:
+            try:
+                neigh_conn.send(file_data)                  # send file data to intended client
+            except OSError:                                 # receiver is gone, drain the rest
+                neigh_conn = None
+        if file_data == b'EOF':
+            break
+        file_data = recv_data(conn)
+    return file_data, neigh_conn is not None
+
+def pump_stripe(src, dst):                                  # copy one stripe from the sender to the receiver
+    raw, pending = split_socket(src)
+    out = dst.sock if isinstance(dst, FramedSocket) else dst
+    try:
+        out.sendall(pending)
+        relay.forward(raw, out)                             # spliced in the kernel until the sender closes
+    except OSError:
+        pass
+    finally:
+        src.close()
+        dst.close()
+
+def handle_stripe(conn, addr, recv_msg):                   # d;transfer id;stripe from the sender, j;... from the receiver
+    clients.remove(addr)                                    # extra data connection, not a client
+    msg_type, transfer_id, index = recv_msg.split(';')
+    key = (transfer_id, int(index))
+    timer = threading.Timer(STRIPE_TIMEOUT, expire_stripe, args=(key, conn))
+    timer.daemon = True                                     # never holds up shutdown
+    with stripes_lock:
+        other, other_timer = stripes.pop(key, (None, None))
+        if other is None:
+            stripes[key] = (conn, timer)
+    if other is None:                                       # the thread of the other end does the copying
+        timer.start()
+        return
+    other_timer.cancel()                                    # both ends are here, nothing left to expire
+    src, dst = (conn, other) if msg_type == 'd' else (other, conn)
+    pump_stripe(src, dst)
+
+def expire_stripe(key, conn):
+    with stripes_lock:
+        if stripes.get(key, (None,))[0] is not conn:
+            return
+        del stripes[key]
+    conn.close()
 
 def handle_client(conn, addr):                              # handle client to receive and send file
     print_msg(f"> [New Connection] {addr[0]}:{addr[1]} is connected.")
     send_ms = "\r[Server] Successfully received "
 
     while True:
-        recv_msg = conn.recv(SIZE).decode(FORMAT)           # receive message from a client
+        try:
+            recv_msg = conn.recv(SIZE).decode(FORMAT)       # receive message from a client
+        except OSError:
+            recv_msg = ''
 
-        if recv_msg == DISCONNECT_MSG:                      # disconnect client if client send disconnect message
+        if not recv_msg or recv_msg == DISCONNECT_MSG:                      # disconnect client if client send disconnect message
             print_msg(f"> [Disconnected] {addr[0]}:{addr[1]} has disconnected.")
-            clients.remove((conn, addr))
+            clients.remove(addr)
             break
             
         msg_type = recv_msg.split(';')[0]                   # msg type (file or acknowledgement)
+        if msg_type in ('d', 'j'):                          # data connection of a striped transfer
+            handle_stripe(conn, addr, recv_msg)
+            return
         neigh_client = recv_msg.split(';')[1]               # the client we intend to send msg to (ip:port)
 
         neigh_ip = neigh_client.split(':')[0]
         neigh_port = int(neigh_client.split(':')[1])
 
         neigh_conn = find_conn((neigh_ip, neigh_port))
+        if neigh_conn is None:
+            print_msg(f"> [Error] No connection with {neigh_client} exists.")
+            if msg_type in ('f', 'c', 'k') and FRAMED:      # throw the file data away
+                relay.relay_frames(conn, None)
+            elif msg_type == 'f':
+                relay_raw(conn, None)
+            continue
 
         curr_ip = addr[0]
         curr_port = str(addr[1])
         
-        if msg_type == 'f':                                 # if msg type is file
-            file_name = recv_msg.split(';')[2]              # file name
+        if msg_type in ('f', 'c', 'k'):                     # if msg type is file (or chunks of a deduplicated or repaired file)
+            file_info = recv_msg.split(';', 2)[2]           # file name (and transfer id;offset when resuming)
 
-            send_msg = f"f;{curr_ip}:{curr_port};{file_name}"
+            send_msg = f"{msg_type};{curr_ip}:{curr_port};{file_info}"
 
             neigh_conn.send(send_msg.encode(FORMAT))        # send file name to intended client
 
-            file_data = conn.recv(SIZE)                     # receive file data from client
-            while file_data:                                # to receive and send file data as packets (1024 bytes at a time until EOF)
-                neigh_conn.send(file_data)                  # send file data to intended client
-                if file_data == b'EOF':
-                    break
-                file_data = conn.recv(SIZE)
+            if FRAMED:                                      # frames pass through unchanged up to EOF/ABORT
+                file_data, delivered = relay.relay_frames(conn, neigh_conn)
+            else:
+                file_data, delivered = relay_raw(conn, neigh_conn)
+            if file_data and not delivered:                 # receiver is gone, tell the sender
+                conn.send(f"w;{neigh_client};[Server] {neigh_client} disconnected, file transfer interrupted.".encode(FORMAT))
+            if not file_data:                               # sender dropped in the middle of the file
+                try:
+                    neigh_conn.send(b'ABORT')
+                except OSError:
+                    pass
+                print_msg(f"> [Disconnected] {addr[0]}:{addr[1]} has disconnected.")
+                clients.remove(addr)
+                break
         
-        elif msg_type == 'w':                               # if msg type is acknowledgement
-            msg = recv_msg.split(';')[2]
+        elif msg_type in ('w', 'r', 'o', 's', 'm', 'n', 'v', 'q'):  # acknowledgements, offers, digests and chunk requests, relayed as is
+            msg = recv_msg.split(';', 2)[2]
 
-            send_msg = f"w;{curr_ip}:{curr_port};{msg}"
+            send_msg = f"{msg_type};{curr_ip}:{curr_port};{msg}"
             neigh_conn.send(send_msg.encode(FORMAT))        # send acknowledgement to client
     
     conn.close()
 
+def send_mux(conn, channel, payload):                      # False if the client is gone
+    try:
+        conn.send(mux.pack(channel, payload))
+        return True
+    except OSError:
+        return False
+
+def handle_mux_client(conn, addr):                          # frames of many channels, each routed on its own
+    print_msg(f"> [New Connection] {addr[0]}:{addr[1]} is connected.")
+    curr_client = f"{addr[0]}:{addr[1]}"
+    routes = {}                                             # channel of this client -> (receiver conn or None, channel there)
+
+    while True:
+        try:
+            frame = conn.recv(SIZE)
+        except OSError:
+            frame = b''
+        if not frame:
+            break
+        channel, payload = mux.split(frame)
+
+        if channel in routes:                               # file data, passed on in the order it came
+            neigh_conn, neigh_channel = routes[channel]
+            if neigh_conn is not None and not send_mux(neigh_conn, neigh_channel, payload):
+                routes[channel] = (None, 0)                 # receiver is gone, drop the rest of this channel
+                send_mux(conn, mux.CONTROL, f"w;{curr_client};[Server] Receiver disconnected, file transfer interrupted.".encode(FORMAT))
+            if payload in mux.STOP_FRAMES:
+                del routes[channel]
+            continue
+
+        recv_msg = payload.decode(FORMAT)
+        if channel == mux.CONTROL and recv_msg == DISCONNECT_MSG:
+            break
+        msg_type, neigh_client, msg = recv_msg.split(';', 2)
+        neigh_ip, neigh_port = neigh_client.split(':')
+        neigh_conn = find_conn((neigh_ip, int(neigh_port)))
+        if neigh_conn is None:
+            print_msg(f"> [Error] No connection with {neigh_client} exists.")
+            send_mux(conn, mux.CONTROL, f"w;{neigh_client};[Server] No connection with {neigh_client} exists.".encode(FORMAT))
+        send_msg = f"{msg_type};{curr_client};{msg}".encode(FORMAT)
+
+        if channel == mux.CONTROL:                          # acknowledgements and other messages, relayed as is
+            if neigh_conn is not None:
+                send_mux(neigh_conn, mux.CONTROL, send_msg)
+            continue
+
+        neigh_channel = next(channel_ids)                   # first frame of a new channel: f;receiver;name;size
+        routes[channel] = (neigh_conn, neigh_channel)
+        if neigh_conn is not None and not send_mux(neigh_conn, neigh_channel, send_msg):
+            routes[channel] = (None, 0)
+
+    for neigh_conn, neigh_channel in routes.values():       # sender dropped in the middle of these files
+        if neigh_conn is not None:
+            send_mux(neigh_conn, neigh_channel, b'ABORT')
+    print_msg(f"> [Disconnected] {addr[0]}:{addr[1]} has disconnected.")
+    clients.remove(addr)
+    conn.close()
+
 def main():
     print_msg("> Server is starting...")
 
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # create socket
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # restart without waiting for TIME_WAIT
     server.bind(ADDR)                                           # bind socket to address = (ip, port)
 
     server.listen()                                             # listen to socket
@@ -86,9 +233,11 @@ def main():
 
     while True:
         conn, addr = server.accept()                            # accept connection from client
-        clients.append((conn, addr))                            # add client to clients list
+        if FRAMED:
+            conn = FramedSocket(conn)
+        clients.add(conn, addr)                                 # add client to clients list
 
-        client_thread = threading.Thread(target = handle_client, args=(conn, addr))
+        client_thread = threading.Thread(target = handle_mux_client if MUX else handle_client, args=(conn, addr))
         client_thread.start()                                   # create thread to handle clients
 
         print_msg(f"> [Active Connections] {threading.active_count() - 1}")
@@ -3,9 +3,19 @@
 # client.py
 import pygame
 import socket
-import pickle
 import random
+import threading
 import time
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import gamewire
+from common.datagram import DatagramClient, shim_options
+from common.framing import FramedSocket
+from common.interest import camera, parse_view
+from common.prediction import Interpolator, Predictor
+from common.snapshot import SnapshotBuffer
 
 # Initialize Pygame
 pygame.init()
@@ -16,20 +26,34 @@ IP = ''
 PORT = 8018
 ADDR = (IP, PORT)                                           # address
 SIZE = 4096
+UDP = "--udp" in sys.argv           # inputs and states as datagrams, server must use --udp too (--loss/--latency/--jitter to test)
+snapshots = SnapshotBuffer()        # recent snapshots, the deltas from the server are applied to them
 
 # Constants
-WIDTH, HEIGHT = 600, 400
+MAP = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--map=')), '600x400')   # WIDTHxHEIGHT, the same as the server
+WIDTH, HEIGHT = (int(n) for n in MAP.split('x'))
+VIEW = parse_view(next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--view=')), None), WIDTH, HEIGHT)  # window size, the same as the server
+PLAYER_SPEED = 90                   # pixels per second, as on the server
 PLAYER_SIZE = 30
 COIN_SIZE = 15
 BACKGROUND = (0, 0, 0)
 COIN_COLOR = (137, 207, 240)
+FPS = 60                            # frames drawn (and inputs sent) per second, whatever the network does
+
+# What the receiving thread hands to the game loop
+view_lock = threading.Lock()
+game_state = None                   # latest state from the server (scores, coins, colors)
+winner = None
+me = None                           # player id the server gave this client
+predictor = Predictor(WIDTH, HEIGHT, PLAYER_SIZE)   # own square, moved before the server answers
+others = Interpolator()             # other players, drawn a little in the past between two snapshots
 
 # Create the game window
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
+screen = pygame.display.set_mode(VIEW)     # follows the own player when the map is bigger
 pygame.display.set_caption("Coin Collector Game")
 
-# Function to send player input to the server
-def send_player_input(client):
+# Function to send player input to the server, the own square moves at once
+def send_player_input(client, seconds):
     keys = pygame.key.get_pressed()
     input_data = ({
         'left': keys[pygame.K_LEFT],
@@ -37,17 +61,43 @@ def send_player_input(client):
         'up': keys[pygame.K_UP],
         'down': keys[pygame.K_DOWN],
     })
-    client.send(pickle.dumps(input_data))
+    with view_lock:
+        seq = predictor.input(input_data, PLAYER_SPEED * seconds)
+    client.send(gamewire.encode_input(input_data, snapshots.latest, seq))  # the server sends only what changed since this snapshot
 
-# Function to receive game state from the server
+# Function to receive one message from the server, False once the connection is gone
 def receive_game_state(client):
+    global game_state, winner, me
     try:
         data = client.recv(SIZE)
-        game_state = pickle.loads(data)
-        return game_state
+        if not data:
+            return False
+        kind, message = gamewire.decode(data)
+    except socket.timeout:          # UDP: no state this time
+        return True
     except Exception as e:
         print(f"Error receiving game state: {e}")
-        return None
+        return not isinstance(e, OSError)
+    if kind == gamewire.WINNER:
+        winner = message
+    elif kind == gamewire.SNAPSHOT:
+        state = snapshots.apply(message)
+        if state is None:           # delta against a snapshot already forgotten, the next one will do
+            return True
+        player_id, applied = message[3:]
+        with view_lock:
+            game_state = state
+            if player_id in state['players']:
+                me = player_id
+                predictor.reconcile(state['players'][player_id], applied)
+            others.add({other: position for other, position in state['players'].items() if other != player_id})
+    return True
+
+# Function to receive game states on their own thread, the game loop never waits for the network
+def receive_game_states(client):
+    while receive_game_state(client):
+        pass
+    print("> Disconnected from the server")
 
 # Function to render player scores
 def render_players_scores(game_state):
@@ -62,10 +112,17 @@ def render_players_scores(game_state):
 
 def main():
     # Connect to the server
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-    client.connect(ADDR)
+    if UDP:
+        client = DatagramClient((IP or '127.0.0.1', PORT), **shim_options(sys.argv))
+        client.connect()
+    else:
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client.connect(ADDR)
+        client = FramedSocket(client)   # a recv never gets two states at once, or half of one
     print(f"> Client connected to server at {IP}:{PORT}")
+    receiver = threading.Thread(target=receive_game_states, args=(client,), daemon=True)
+    receiver.start()
+    clock = pygame.time.Clock()
 
 # Game loop
     connected = True
@@ -73,39 +130,48 @@ def main():
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 connected = False
+        seconds = clock.tick(FPS) / 1000
 
-        send_player_input(client)  # Send player input to the server
-        game_state = receive_game_state(client)  # Receive game state from the server
-        player_id = 0
-        # Check if the game_state type is str
-        if type(game_state) == int:
+        send_player_input(client, seconds)  # Send player input to the server
+        # Check if a player has won
+        if winner is not None:
             font = pygame.font.Font('freesansbold.ttf', 32)
-            text = font.render(f'Player-{game_state + 1} Won!', True, (255, 255, 255))
+            text = font.render(f'Player-{winner + 1} Won!', True, (255, 255, 255))
             textRect = text.get_rect()
-            textRect.center = (WIDTH // 2, HEIGHT // 2)
+            textRect.center = (VIEW[0] // 2, VIEW[1] // 2)
             screen.blit(text, textRect)
             pygame.display.flip()
             pygame.time.delay(50000)
             # connected = False
         else:
-            if game_state != None:
-                coins = game_state['coins']
+            with view_lock:
+                state = game_state
+                players = others.positions()
+                own = predictor.draw()
+                if me is not None and own is not None:
+                    players[me] = own
+            if state != None:
+                coins = state['coins']
+                left, top = camera(*own, PLAYER_SIZE, VIEW, WIDTH, HEIGHT) if own else (0, 0)
                 
                 screen.fill(BACKGROUND) # Clear the screen
 
-                for player_id, (player_x, player_y) in game_state['players'].items():     # Draw players
-                    player_color = game_state['color'][player_id]
-                    pygame.draw.rect(screen, player_color, (player_x, player_y, PLAYER_SIZE, PLAYER_SIZE))
+                for player_id, (player_x, player_y) in players.items():     # Draw players
+                    player_color = state['color'].get(player_id, (255, 255, 255))
+                    pygame.draw.rect(screen, player_color, (player_x - left, player_y - top, PLAYER_SIZE, PLAYER_SIZE))
                 for coin_x, coin_y in coins:                                # Draw coins
-                    pygame.draw.ellipse(screen, COIN_COLOR, (coin_x, coin_y, COIN_SIZE, COIN_SIZE))
+                    pygame.draw.ellipse(screen, COIN_COLOR, (coin_x - left, coin_y - top, COIN_SIZE, COIN_SIZE))
 
                 # Display player scores
-                render_players_scores(game_state)
+                render_players_scores(state)
 
                 # Update the display
                 pygame.display.flip()
+        if not receiver.is_alive():
+            connected = False
 
     # Quit Pygame
+    client.close()
     pygame.quit()
 
 if __name__ == "__main__":
@@ -3,102 +3,244 @@
 # server.py
 import socket
 import threading
+import itertools
+import heapq
 import random
-import pickle
 import queue
 import time
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import datagram, gamewire
+from common.entities import entity_store
+from common.framing import FramedSocket
+from common.interest import PointGrid, area_of_interest, parse_view, view_box
+from common.outbound import OutboundQueue
+from common.snapshot import SnapshotHistory
+from common.tick import TickLoop
 
 # Server configuration
 IP = ''
 PORT = 8018
 ADDR = (IP, PORT)
 SIZE = 4096
-clients = {}
+UDP = "--udp" in sys.argv           # also take players over UDP on the same port, clients pick with --udp
+TICK_RATE = int(next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--tick-rate=')), 30))  # simulation steps per second
+STATS_EVERY = 5                     # seconds between tick timing reports
+clients = {}                        # player_id -> OutboundQueue, a slow client never holds up the tick
+inputs = queue.Queue()              # (player_id, input) from every client, drained once per tick
+game_lock = threading.Lock()        # the world is changed by the tick, new connections and disconnects
+history = SnapshotHistory(gamewire.encode_snapshot)  # numbered snapshots, each client gets a delta against the one it acked
+acks = {}                           # player_id -> last snapshot acked, 0 until the first one arrives (full snapshot)
+applied = {}                        # player_id -> last input the world has, the client replays the later ones
+views = {}                          # player_id -> SnapshotHistory of what that client was sent, with --view
+player_ids = itertools.count()      # TCP and UDP players share the ids
+free_ids = []                       # heap of the ids of players that left, handed out again first
 
 # Constants
-WIDTH, HEIGHT = 600, 400
-PLAYER_SPEED = 1.5
+MAP = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--map=')), '600x400')   # WIDTHxHEIGHT, clients must use the same --map
+WIDTH, HEIGHT = (int(n) for n in MAP.split('x'))
+PLAYER_SPEED = 90                   # pixels per second, the same at any tick rate
 PLAYER_SIZE = 30
 COIN_SIZE = 15
-COIN_COUNT = 10
-MAX_PLAYERS = 4
+COIN_COUNT = int(next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--coins=')), 10))
+VIEW = parse_view(next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--view=')), None), WIDTH, HEIGHT)  # window of the clients, give them the same --view
+AREA_OF_INTEREST = VIEW != (WIDTH, HEIGHT)  # each client only gets what is around its player
+MAX_PLAYERS = int(next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--max-players=')), 1024))   # TCP and UDP players together
 WINNING_SCORE = 10
 
-# Create the game state
-game_state = {
-    'players': {},          # Store player positions as {player_id: (x, y)}
-    'player_scores': {},    # Store player scores as {player_id: score}
-    'coins': [(random.randint(0, WIDTH - COIN_SIZE), random.randint(0, HEIGHT - COIN_SIZE)) for _ in range(COIN_COUNT)],
-    'color': {}             # Store player color as {'player_id': (R, G, B)}
-}
-
-# Function to update player position based on input
-def update_player_position(player_id, input_data):
-    player_x, player_y = game_state['players'][player_id]
-    if input_data['left']:
-        player_x -= PLAYER_SPEED
-    if input_data['right']:
-        player_x += PLAYER_SPEED
-    if input_data['up']:
-        player_y -= PLAYER_SPEED
-    if input_data['down']:
-        player_y += PLAYER_SPEED
-
-    # Ensure the player stays within the game bounds
-    player_x = max(0, min(player_x, WIDTH - PLAYER_SIZE))
-    player_y = max(0, min(player_y, HEIGHT - PLAYER_SIZE))
-
-    game_state['players'][player_id] = (player_x, player_y)
+# Create the game world, every player and coin is a slot in the columns of the entity store
+world = entity_store(WIDTH, HEIGHT, PLAYER_SIZE, COIN_SIZE, COIN_COUNT)
+
+# Function to queue a message to one client, returns the bytes queued
+def send_to(outbound, data):
+    try:
+        return outbound.send_encoded(data, timeout=0)   # dropped for a backed up client, the next state replaces it
+    except BrokenPipeError:
+        return 0
+
+# Function to send the same message to every client, returns the bytes queued
+def broadcast(data):
+    frames = {}                     # encoded once per transport
+    sent = 0
+    for outbound in list(clients.values()):
+        if outbound.framed not in frames:
+            frames[outbound.framed] = outbound.encode(data)
+        sent += send_to(outbound, frames[outbound.framed])
+    return sent
+
+# Function to send every client the new state, as a delta against the snapshot it acked
+def send_state(targets):
+    sent = 0
+    for outbound, snapshots, acked, player_id, last_input in targets:
+        data = snapshots.message(acked)     # encoded once per base, only the owner differs
+        sent += send_to(outbound, outbound.encode(gamewire.address(data, player_id, last_input)))
+    return sent
+
+# Function to record what every client can see, returns player_id -> its SnapshotHistory
+def record_views(game_state):
+    if not AREA_OF_INTEREST:
+        history.record(game_state)
+        return dict.fromkeys(clients, history)
+    players = PointGrid(game_state['players'])  # once per tick, the coins are indexed by the world
+    for player_id, snapshots in views.items():
+        box = view_box(*game_state['players'][player_id], PLAYER_SIZE, VIEW)
+        snapshots.record(area_of_interest(game_state, players.inside(*box), world.coins_inside(*box)))
+    return views
+
+# Function to advance the game by one tick, called TICK_RATE times per second
+def simulate(tick):
+    with game_lock:
+        while True:                 # latest input of every player wins
+            try:
+                player_id, input_data = inputs.get_nowait()
+            except queue.Empty:
+                break
+            if player_id in world:
+                world.set_keys(player_id, input_data)   # keys stay pressed until the next input
+                applied[player_id] = input_data['seq']
+        world.step(PLAYER_SPEED / TICK_RATE)    # every player moved and clamped at once
+        world.collect()             # coins touched are scored and respawn in the same slot
+        game_state = world.game_state()
+        recorded = record_views(game_state)
+        targets = [(outbound, recorded[player_id], acks.get(player_id, 0), player_id, applied.get(player_id, 0))
+                   for player_id, outbound in clients.items()]
+        winner = None
+        if len(game_state['players']) > 1 and max(game_state['player_scores'].values()) >= WINNING_SCORE:
+            winner = next(player_id for player_id, score in game_state['player_scores'].items() if score >= WINNING_SCORE)
+
+    # Send the updated game state to all players, once per tick
+    sent = send_state(targets)
+    if winner is not None:          # Check if any player has won
+        sent += broadcast(gamewire.encode_winner(winner))
+    return sent
+
+def report_ticks(stats):
+    print(f"> [Tick] {stats['rate']} Hz, {len(clients)} players: {stats['ticks']} ticks, avg {stats['avg_ms']:.2f} ms, "
+          f"p99 {stats['p99_ms']:.2f} ms, max {stats['max_ms']:.2f} ms, {stats['late']} late, {stats['sent_per_sec'] / 1024:.1f} KB/s sent"
+          + (f", {stats['failed']} failed" if stats['failed'] else ""))
+
+# Function to shut the server down once the tick loop has given up, players would never get a state again
+def stop_server():
+    print("> Server stopped, the game cannot advance")
+    sys.stdout.flush()
+    os._exit(1)
+
+# Function to pick an id for a new player, None once every id the messages can carry is taken
+def new_player_id():
+    if free_ids:
+        return heapq.heappop(free_ids)
+    player_id = next(player_ids)
+    return player_id if player_id <= gamewire.MAX_PLAYER_ID else None
+
+# Function to add a player at a random position, sending to it through outbound, returns None if the game is full
+def add_player(outbound):
+    player_x = random.randint(0, WIDTH - PLAYER_SIZE)
+    player_y = random.randint(0, HEIGHT - PLAYER_SIZE)
+    display_color = (random.randint(10, 255) for _ in range(3))
+    with game_lock:
+        if len(clients) >= MAX_PLAYERS:
+            return None
+        player_id = new_player_id()
+        if player_id is None:
+            return None
+        clients[player_id] = outbound
+        world.add_player(player_id, player_x, player_y, tuple(display_color))
+        if AREA_OF_INTEREST:
+            views[player_id] = SnapshotHistory(gamewire.encode_snapshot)
+    print(f"> [Active Connections] {len(clients)}")
+    return player_id
+
+# Function to remove a player from the game state and close its outbound queue or session
+def remove_player(player_id):
+    with game_lock:
+        world.remove_player(player_id)
+        acks.pop(player_id, None)
+        applied.pop(player_id, None)
+        views.pop(player_id, None)
+        clients.pop(player_id).close()
+        heapq.heappush(free_ids, player_id)
+
+# Function to queue one message from a player for the next tick, False if it is not of this protocol version
+def take_input(player_id, data):
+    try:
+        kind, input_data = gamewire.decode(data)
+    except ValueError as e:
+        print(f"> [Player-{player_id + 1}] {e}, disconnecting")
+        return False
+    if kind == gamewire.INPUT:
+        acks[player_id] = input_data['ack']     # last snapshot this client has, the next one is a delta against it
+        inputs.put((player_id, input_data))             # applied by the next tick
+    return True
 
 # Function to handle a client
 def handle_client(conn, player_id):
     while True:
-        data = conn.recv(SIZE)
-        if not data:
+        try:
+            data = conn.recv(SIZE)
+        except OSError:
+            break
+        if not data or not take_input(player_id, data):
             break
-        # Update the game state for the player based on input
-        input_data = pickle.loads(data)
-        update_player_position(player_id, input_data)
-
-        # Check for collisions with coins
-        coins_to_remove = []
-        for i, (coin_x, coin_y) in enumerate(game_state['coins']):
-            player_x, player_y = game_state['players'][player_id]
-            if player_x < coin_x + COIN_SIZE and player_x + PLAYER_SIZE > coin_x and player_y < coin_y + COIN_SIZE and player_y + PLAYER_SIZE > coin_y:
-                coins_to_remove.append(i)
-                game_state['player_scores'][player_id] = game_state['player_scores'].get(player_id, 0) + 1
-
-        # Remove the coins that were collected and add new one
-        for i in coins_to_remove:
-            game_state['coins'].pop(i)
-            new_coin_x = random.randint(0, WIDTH - COIN_SIZE)
-            new_coin_y = random.randint(0, HEIGHT - COIN_SIZE)
-            game_state['coins'].append((new_coin_x, new_coin_y))
-
-        # Send the updated game state to all players
-        game_update = pickle.dumps(game_state)
-        for connection in clients.values():
-            connection.send(game_update)
-        
-        # Check if any player has won
-        if len(game_state['players']) > 1:
-            if max(game_state['player_scores'].values()) >= WINNING_SCORE:
-                for player_id, score in game_state['player_scores'].items():
-                    if score >= WINNING_SCORE:
-                        break
-                for connection in clients.values():
-                    connection.send(pickle.dumps(player_id))
-
-    # Remove the player from the game state and close the socket
-    del game_state['players'][player_id]
-    clients.pop(player_id)
+
+    remove_player(player_id)
     conn.close()
 
+# Function to handle every UDP player: handshakes, inputs, goodbyes and silent sessions
+def handle_datagrams(sock):
+    endpoint = datagram.Shim(sock, **datagram.shim_options(sys.argv))   # --loss/--latency/--jitter on what the server sends
+    sessions = {}                   # addr -> (player_id, Peer)
+    session_ids = itertools.count(1)
+    swept = time.monotonic()
+    sock.settimeout(1)
+    while True:
+        try:
+            data, addr = sock.recvfrom(datagram.MAX_DATAGRAM)
+            kind, session, seq, payload = datagram.unpack(data)
+        except socket.timeout:
+            kind = None
+        except (OSError, ValueError):
+            continue
+
+        if kind == datagram.HELLO:
+            if addr not in sessions:
+                peer = datagram.Peer(endpoint, addr, next(session_ids) & 0xFFFF or 1)
+                player_id = add_player(peer)
+                if player_id is not None:   # game full, the client times out waiting for WELCOME
+                    sessions[addr] = (player_id, peer)
+                    print(f"> [UDP] {addr[0]}:{addr[1]} joined, session {peer.session}")
+            if addr in sessions:
+                sessions[addr][1].welcome()     # again for a repeated HELLO, the last WELCOME was lost
+        elif kind is not None and addr in sessions and sessions[addr][1].session == session:
+            player_id, peer = sessions[addr]
+            if kind == datagram.INPUTS:
+                joined = all(take_input(player_id, input_data) for input_data in peer.take_inputs(payload))
+            else:
+                joined = kind != datagram.BYE
+            if not joined:
+                print(f"> [UDP] {addr[0]}:{addr[1]} left")
+                del sessions[addr]
+                remove_player(player_id)
+
+        now = time.monotonic()
+        if now - swept >= 1:        # drop the sessions that went quiet
+            swept = now
+            for addr, (player_id, peer) in list(sessions.items()):
+                if peer.expired(now):
+                    print(f"> [UDP] {addr[0]}:{addr[1]} timed out")
+                    del sessions[addr]
+                    remove_player(player_id)
+
 def initialize_player_scores():
-        for player_id in game_state['players']:
-            game_state['player_scores'][player_id] = 0
+        for slot in world.slots.values():
+            world.score[slot] = 0
 
 def main():
+    try:
+        gamewire.check_world(WIDTH, HEIGHT, COIN_COUNT)
+    except ValueError as e:
+        sys.exit(f"> {e}")
     print("> Server is starting...")
     
     # Create the server socket
@@ -107,33 +249,37 @@ def main():
 
     server.listen()
     print(f"> Server is listening on {IP}:{PORT}")
-    print(f"> [Active Connections] {threading.active_count() - 1}")
+    print(f"> [Active Connections] {len(clients)}")
+
+    ticks = TickLoop(TICK_RATE, simulate, report_ticks, STATS_EVERY, stop_server)
+    ticks.start()
+    print(f"> Simulating at {TICK_RATE} ticks per second")
+    if AREA_OF_INTEREST:
+        print(f"> Sending each client its {VIEW[0]}x{VIEW[1]} view of the {WIDTH}x{HEIGHT} map")
+
+    if UDP:
+        udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp.bind(ADDR)
+        threading.Thread(target=handle_datagrams, args=(udp,), daemon=True).start()
+        print(f"> Taking UDP players on {IP}:{PORT}")
 
     # Accept and handle client connections
-    player_id_counter = 0
     # initialize_player_scores()  # Initialize player scores
 
     while True:
         conn, addr = server.accept()
+        conn = FramedSocket(conn)   # always framed, the outbound queue writes many states at once
 
-        player_id = player_id_counter
-        clients[player_id] = conn
-        player_id_counter += 1
-
-        # Initialize player's position
-        player_x = random.randint(0, WIDTH - PLAYER_SIZE)
-        player_y = random.randint(0, HEIGHT - PLAYER_SIZE)
-        game_state['players'][player_id] = (player_x, player_y)
-
-        
-        display_color = (random.randint(10, 255) for _ in range(3))
-        game_state['color'][player_id] = tuple(display_color)
-        game_state['player_scores'][player_id] = game_state['player_scores'].get(player_id, 0)
+        outbound = OutboundQueue(conn)
+        player_id = add_player(outbound)
+        if player_id is None:
+            print(f"> [Refused] {addr[0]}:{addr[1]}, the game is full")
+            outbound.close()        # ends its writer thread
+            conn.close()
+            continue
 
         client_thread = threading.Thread(target=handle_client, args=(conn, player_id))
         client_thread.start()
 
-        print(f"> [Active Connections] {threading.active_count() - 1}")
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,33 +2,59 @@
 # client.py
 import socket
 import pygame
-import pickle
 import os
 import time
 import re
+import queue
+import sys
+import threading
 
 import tkinter as tk
 from tkinter import messagebox
 from getmac import get_mac_address
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import gamewire
+from common.datagram import DatagramClient, shim_options
+from common.framing import FramedSocket
+from common.interest import camera, parse_view
+from common.prediction import Interpolator, Predictor
+from common.snapshot import SnapshotBuffer
+
 IP = socket.gethostbyname(socket.gethostname())
 # IP = '192.168.12.237'
 PORT = 3535
 ADDR = (IP, PORT)                                           
 SIZE = 4096
+UDP = "--udp" in sys.argv           # inputs and states as datagrams once logged in, server must use --udp too (--loss/--latency/--jitter to test)
+snapshots = SnapshotBuffer()        # recent snapshots, the deltas from the server are applied to them
 DISCONNECT_MESSAGE = "DISCONNECT"
 CONNECTED = False
 IN_QUEUE = True
+logged_in_mac = None
+channel = None                      # DatagramClient in UDP mode, REGISTER/PAY/LOGIN/QUEUE and the text replies stay on TCP
 
 client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-WIDTH, HEIGHT = 600, 400
+MAP = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--map=')), '600x400')   # WIDTHxHEIGHT, the same as the server
+WIDTH, HEIGHT = (int(n) for n in MAP.split('x'))
+VIEW = parse_view(next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--view=')), None), WIDTH, HEIGHT)  # window size, the same as the server
 PLAYER_SIZE = 30
 COIN_SIZE = 15
 BACKGROUND = (0, 0, 0)
 COIN_COLOR = (137, 207, 240)
+PLAYER_SPEED = 3                    # pixels per input, as on the server
+FPS = 60                            # frames drawn (and inputs sent) per second, whatever the network does
+QUEUE_EVERY = 0.5                   # seconds between QUEUE requests while waiting for a place
 countdown = 10  # Initial countdown value
 
+view_lock = threading.Lock()        # what the receiving threads hand to the game loop
+game_state = None                   # latest state from the server (scores, coins, colors)
+me = None                           # player id the server gave this client
+predictor = Predictor(WIDTH, HEIGHT, PLAYER_SIZE)   # own square, moved before the server answers
+others = Interpolator()             # other players, drawn a little in the past between two snapshots
+replies = queue.Queue()             # text messages from the server (QUEUE, TIMEOUT) for the game loop
+
 def game_entry():
     def register():
         mac_address_pattern = r'^([0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}$'
@@ -37,7 +63,7 @@ def game_entry():
             messagebox.showerror("Invalid MAC Address", "Invalid MAC Address")
         else:
             mac = mac_entry.get()
-            client.send(pickle.dumps(f"REGISTER/{mac}"))
+            client.send(gamewire.encode_text(f"REGISTER/{mac}"))
             msg = recv_msg(client)
             if msg == "OK":
                 print(f"Registered MAC Address: {mac}")
@@ -47,10 +73,12 @@ def game_entry():
                 messagebox.showerror("Registration Failed", f"Registration Failed: {msg}")
     
     def login():
+        global logged_in_mac
         mac = mac_entry.get()
-        client.send(pickle.dumps(f"LOGIN/{mac}"))
+        client.send(gamewire.encode_text(f"LOGIN/{mac}"))
         msg = recv_msg(client)
         if msg == "OK":
+            logged_in_mac = mac
             print(f"Logged in with MAC Address: {mac}")
             start_tk.destroy()
         else:
@@ -67,7 +95,7 @@ def game_entry():
                 float(amount_entry.get())
                 mac = mac_entry.get()
                 amount = amount_entry.get()
-                client.send(pickle.dumps(f"PAY/{mac}/{amount}"))
+                client.send(gamewire.encode_text(f"PAY/{mac}/{amount}"))
                 msg = recv_msg(client)
         except:
             t = 1
@@ -121,15 +149,39 @@ def send_player_input(client):
         'up': keys[pygame.K_UP],
         'down': keys[pygame.K_DOWN],
     })
-    client.send(pickle.dumps(input_data))
-
-def receive_game_state(client):
-    try:
-        data = recv_msg(client)
-        return data
-    except Exception as e:
-        print(f"Error receiving game state: {e}")
+    with view_lock:
+        seq = predictor.input(input_data, PLAYER_SPEED)
+    client.send(gamewire.encode_input(input_data, snapshots.latest, seq))  # the server sends only what changed since this snapshot
+
+def receive_game_state(client):     # on its own thread, one per socket (TCP, and UDP with --udp)
+    while connected:
+        try:
+            msg = recv_msg(client)
+        except socket.timeout:      # UDP: no state this time
+            continue
+        except Exception as e:
+            print(f"Error receiving game state: {e}")
+            if isinstance(e, OSError):
+                break
+            continue
+        if type(msg) == str:
+            if not msg:             # connection closed, or the server ended the UDP session
+                break
+            replies.put(msg)
+
+def apply_snapshot(message):        # the state to draw, the own square is reconciled with it
+    global game_state, me
+    state = snapshots.apply(message)
+    if state is None:               # delta against a snapshot already forgotten, the next one will do
         return None
+    player_id, applied = message[3:]
+    with view_lock:
+        game_state = state
+        if player_id in state['players']:
+            me = player_id
+            predictor.reconcile(state['players'][player_id], applied)
+        others.add({other: position for other, position in state['players'].items() if other != player_id})
+    return state
 
 def render_players_scores(game_state):
     font = pygame.font.Font('freesansbold.ttf', 24)
@@ -143,7 +195,7 @@ def render_players_scores(game_state):
 def disconnect_server(client: socket.socket, recv_from: str):
     global connected
     connected = False
-    client.send(pickle.dumps(DISCONNECT_MESSAGE))
+    client.send(gamewire.encode_text(DISCONNECT_MESSAGE))
     if recv_from == "client":
         print(f"[DISCONNECTED] Client disconnected from {IP}:{PORT}")
     elif recv_from == "server":
@@ -154,7 +206,9 @@ def recv_msg(client: socket.socket, disconnect_info: str = ""):
     msg = client.recv(SIZE)
     if not msg:
         return ''
-    msg = pickle.loads(msg)
+    kind, msg = gamewire.decode(msg)
+    if kind == gamewire.SNAPSHOT:
+        return apply_snapshot(msg)
     if msg == DISCONNECT_MESSAGE:
         print(disconnect_info)
         disconnect_server(client, "server")
@@ -163,85 +217,104 @@ def recv_msg(client: socket.socket, disconnect_info: str = ""):
 try:
     if __name__ == "__main__":
         client.connect(ADDR)
+        client = FramedSocket(client)   # a recv never gets two states at once, or half of one
         print(f"> [CONNECTED] Client connected to server at {IP}:{PORT}")
 
         game_entry()
+        if UDP and logged_in_mac is not None:
+            channel = DatagramClient(ADDR, token=logged_in_mac.encode(), **shim_options(sys.argv))
+            channel.connect()
+            print(f"> [UDP] session {channel.session} with {IP}:{PORT}")
 
         pygame.init()
-        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        screen = pygame.display.set_mode(VIEW)     # follows the own player when the map is bigger
         pygame.display.set_caption("Coin Collector Game")
 
-        connected, iteration = True, 0
+        connected = True
+        threading.Thread(target=receive_game_state, args=(client,), daemon=True).start()
+        if channel is not None:
+            threading.Thread(target=receive_game_state, args=(channel,), daemon=True).start()
+        clock, next_queue = pygame.time.Clock(), 0
         while connected:    
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    client.send(pickle.dumps("QUIT"))
+                    client.send(gamewire.encode_text("QUIT"))
                     connected = False
+            clock.tick(FPS)
 
-            if iteration == 0:
-                client.send(pickle.dumps("QUEUE"))
+            if IN_QUEUE and time.monotonic() >= next_queue:    # until a state shows we are in, a lost one is asked for again
+                client.send(gamewire.encode_text("QUEUE"))
+                next_queue = time.monotonic() + QUEUE_EVERY
             if not IN_QUEUE:
-                send_player_input(client)
-            game_state = receive_game_state(client)
+                send_player_input(channel or client)
+            try:
+                reply = replies.get_nowait()
+            except queue.Empty:
+                reply = None
             
-            if type(game_state) in (int, str):
-                iteration = 1
-                if game_state == "TIMEOUT":
+            if reply == "TIMEOUT":
+                font = pygame.font.Font('freesansbold.ttf', 32)
+                countdown_text = f"Disconnecting from server in {countdown} sec"
+                countdown_start_time = pygame.time.get_ticks()
+                clock = pygame.time.Clock()
+                while countdown > 0:
+                    for event in pygame.event.get():
+                        if event.type == pygame.QUIT:
+                            pygame.quit()
+                    current_time = pygame.time.get_ticks()
+                    elapsed_time = current_time - countdown_start_time
+                    # Update countdown text every second
+                    if elapsed_time >= 1000:
+                        countdown -= 1
+                        countdown_text = f"Disconnecting from server in {countdown} sec"
+                        countdown_start_time = current_time
+                    screen.fill((0, 0, 0))  # Clear the screen
+                    text_surface = font.render(countdown_text, True, (255, 255, 255))
+                    screen.blit(text_surface, (VIEW[0] // 2 - text_surface.get_width() // 2, VIEW[1] // 2 - text_surface.get_height() // 2))
                     font = pygame.font.Font('freesansbold.ttf', 32)
-                    countdown_text = f"Disconnecting from server in {countdown} sec"
-                    countdown_start_time = pygame.time.get_ticks()
-                    clock = pygame.time.Clock()
-                    while countdown > 0:
-                        for event in pygame.event.get():
-                            if event.type == pygame.QUIT:
-                                pygame.quit()
-                        current_time = pygame.time.get_ticks()
-                        elapsed_time = current_time - countdown_start_time
-                        # Update countdown text every second
-                        if elapsed_time >= 1000:
-                            countdown -= 1
-                            countdown_text = f"Disconnecting from server in {countdown} sec"
-                            countdown_start_time = current_time
-                        screen.fill((0, 0, 0))  # Clear the screen
-                        text_surface = font.render(countdown_text, True, (255, 255, 255))
-                        screen.blit(text_surface, (WIDTH // 2 - text_surface.get_width() // 2, HEIGHT // 2 - text_surface.get_height() // 2))
-                        font = pygame.font.Font('freesansbold.ttf', 32)
-                        text = font.render(f'Your Time is Out!', True, (255, 255, 255))
-                        textRect = text.get_rect()
-                        textRect.center = (WIDTH // 2, HEIGHT // 2 - 50)
-                        screen.blit(text, textRect)
-                        pygame.display.flip()
-                        clock.tick(60)
-                if game_state == "QUEUE":
-                    font = pygame.font.Font('freesansbold.ttf', 32)
-                    text = font.render(f'Players are full!', True, (255, 255, 255))
+                    text = font.render(f'Your Time is Out!', True, (255, 255, 255))
                     textRect = text.get_rect()
-                    textRect.center = (WIDTH // 2, HEIGHT // 2)
+                    textRect.center = (VIEW[0] // 2, VIEW[1] // 2 - 50)
                     screen.blit(text, textRect)
-                    text1 = font.render(f'Wait till your chance comes', True, (255, 255, 255))
-                    textRect = text1.get_rect()
-                    textRect.center = (WIDTH // 2, HEIGHT // 2 + 50)
-                    screen.blit(text1, textRect)
-                    pygame.display.flip()
-                    client.send(pickle.dumps("QUEUE"))
-            else:
-                if game_state != None:
-                    IN_QUEUE = False
-                    iteration = 1
-                    coins = game_state['coins']
-                    
-                    screen.fill(BACKGROUND) 
-
-                    for player_id, (player_x, player_y) in game_state['players'].items():
-                        player_color = game_state['color'][player_id]
-                        pygame.draw.rect(screen, player_color, (player_x, player_y, PLAYER_SIZE, PLAYER_SIZE))
-                    for coin_x, coin_y in coins:                                
-                        pygame.draw.ellipse(screen, COIN_COLOR, (coin_x, coin_y, COIN_SIZE, COIN_SIZE))
-
-                    render_players_scores(game_state)
                     pygame.display.flip()
+                    clock.tick(60)
+            if reply == "QUEUE":
+                font = pygame.font.Font('freesansbold.ttf', 32)
+                text = font.render(f'Players are full!', True, (255, 255, 255))
+                textRect = text.get_rect()
+                textRect.center = (VIEW[0] // 2, VIEW[1] // 2)
+                screen.blit(text, textRect)
+                text1 = font.render(f'Wait till your chance comes', True, (255, 255, 255))
+                textRect = text1.get_rect()
+                textRect.center = (VIEW[0] // 2, VIEW[1] // 2 + 50)
+                screen.blit(text1, textRect)
+                pygame.display.flip()
+
+            with view_lock:
+                state = game_state
+                players = others.positions()
+                own = predictor.draw()
+                if me is not None and own is not None:
+                    players[me] = own
+            if state != None:
+                IN_QUEUE = False
+                coins = state['coins']
+                left, top = camera(*own, PLAYER_SIZE, VIEW, WIDTH, HEIGHT) if own else (0, 0)
+                
+                screen.fill(BACKGROUND) 
+
+                for player_id, (player_x, player_y) in players.items():
+                    player_color = state['color'].get(player_id, (255, 255, 255))
+                    pygame.draw.rect(screen, player_color, (player_x - left, player_y - top, PLAYER_SIZE, PLAYER_SIZE))
+                for coin_x, coin_y in coins:                                
+                    pygame.draw.ellipse(screen, COIN_COLOR, (coin_x - left, coin_y - top, COIN_SIZE, COIN_SIZE))
+
+                render_players_scores(state)
+                pygame.display.flip()
 
+        if channel is not None:
+            channel.close()
         pygame.quit()
 except KeyboardInterrupt:
-    client.send(pickle.dumps(DISCONNECT_MESSAGE))
+    client.send(gamewire.encode_text(DISCONNECT_MESSAGE))
     os._exit(1)
\ No newline at end of file
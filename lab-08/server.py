@@ -2,17 +2,27 @@
 # server.py
 import socket
 import threading
+import itertools
 import random
-import pickle
 import time
 import os
+import sys
 from dataclasses import dataclass
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import datagram, gamewire
+from common.coingrid import CoinGrid
+from common.entities import keys_of, move
+from common.framing import FramedSocket
+from common.interest import PointGrid, area_of_interest, parse_view, view_box
+from common.snapshot import SnapshotHistory
+
 IP = socket.gethostbyname(socket.gethostname())
 # IP = '192.168.12.237'
 PORT = 3535
 ADDR = (IP, PORT)
 SIZE = 4096
+UDP = "--udp" in sys.argv           # inputs and states also over UDP after login, clients pick with --udp
 
 clients = {}
 players = []
@@ -20,14 +30,19 @@ queue = []
 do_not_send = []
 
 logged_in_macs = []
+history = SnapshotHistory(gamewire.encode_snapshot)    # numbered snapshots, clients get deltas against the one they acked
+state_lock = threading.Lock()               # game_state is changed, recorded and sent by one thread at a time
 active_clients = 0
 game_price = 60/100
 
-WIDTH, HEIGHT = 600, 400
+MAP = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--map=')), '600x400')   # WIDTHxHEIGHT, clients must use the same --map
+WIDTH, HEIGHT = (int(n) for n in MAP.split('x'))
 PLAYER_SPEED = 3
 PLAYER_SIZE = 30
 COIN_SIZE = 15
-COIN_COUNT = 10
+COIN_COUNT = int(next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--coins=')), 10))
+VIEW = parse_view(next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--view=')), None), WIDTH, HEIGHT)  # window of the clients, give them the same --view
+AREA_OF_INTEREST = VIEW != (WIDTH, HEIGHT)  # each client only gets what is around its player
 MAX_PLAYERS = 2
 WINNING_SCORE = 10
 
@@ -37,6 +52,7 @@ game_state = {
     'coins': [(random.randint(0, WIDTH - COIN_SIZE), random.randint(0, HEIGHT - COIN_SIZE)) for _ in range(COIN_COUNT)],
     'color': {}
 }
+coin_grid = CoinGrid(game_state['coins'], COIN_SIZE)   # coins by grid cell, a step only tests the ones near the player
 
 @dataclass
 class Client:
@@ -48,6 +64,10 @@ class Client:
     time: float = 0.0
     score = 0
     connected: bool = True
+    ack: int = 0                    # last snapshot the client has, 0 gets the full state
+    peer: datagram.Peer = None      # UDP session once the client said HELLO, states go there instead of the TCP socket
+    applied: int = 0                # last input moved, the client replays the later ones on top of the state
+    view: SnapshotHistory = None    # what this client was sent, with --view
 
 def get_next_player():
     all_players = sorted([c.player for c in players])
@@ -67,13 +87,16 @@ def disconnect_client(client: Client):
     print(f"[ACTIVE CLIENTS] {active_clients}")
 
     if client in players:
-        players.remove(client)
-        game_state['players'].pop(client.player)
-        game_state['player_scores'].pop(client.player)
-        game_state['color'].pop(client.player)
+        with state_lock:        # not while another client thread captures a snapshot
+            players.remove(client)
+            game_state['players'].pop(client.player)
+            game_state['player_scores'].pop(client.player)
+            game_state['color'].pop(client.player)
     else:
         queue.remove(client)
     client.connected = False
+    if client.peer is not None:
+        client.peer.close()
     try:
         do_not_send.remove(client)
         logged_in_macs.remove(client.mac)
@@ -86,7 +109,7 @@ def player_timer(client: Client):
         client.time -= 1
         if client.time <= 0:
             do_not_send.append(client)
-            client.conn.send(pickle.dumps("TIMEOUT"))
+            client.conn.send(gamewire.encode_text("TIMEOUT"))
             time.sleep(1)
             disconnect_client(client)
             break
@@ -98,18 +121,17 @@ def add_player(client: Client):
     if len(players) >= MAX_PLAYERS:  # If players are full
         client.player = -1
         queue.append(client)
-        client.conn.send(pickle.dumps("QUEUE"))
+        client.conn.send(gamewire.encode_text("QUEUE"))
     else:
-        client.player = get_next_player()
-        players.append(client)
         player_x = random.randint(0, WIDTH - PLAYER_SIZE)
         player_y = random.randint(0, HEIGHT - PLAYER_SIZE)
-        game_state['players'][client.player] = (player_x, player_y)
-
-        
         display_color = (random.randint(10, 255) for _ in range(3))
-        game_state['color'][client.player] = tuple(display_color)
-        game_state['player_scores'][client.player] = game_state['player_scores'].get(client.player, 0)
+        with state_lock:        # the player is in the list and the state together, or in neither
+            client.player = get_next_player()
+            players.append(client)
+            game_state['players'][client.player] = (player_x, player_y)
+            game_state['color'][client.player] = tuple(display_color)
+            game_state['player_scores'][client.player] = game_state['player_scores'].get(client.player, 0)
         timer_thread = threading.Thread(target=player_timer, args=(client,))
         timer_thread.start()
     
@@ -119,18 +141,49 @@ def add_player(client: Client):
 def update_player_position(player_id, input_data):
     global game_state
     player_x, player_y = game_state['players'][player_id]
-    if input_data['left']:
-        player_x -= PLAYER_SPEED
-    if input_data['right']:
-        player_x += PLAYER_SPEED
-    if input_data['up']:
-        player_y -= PLAYER_SPEED
-    if input_data['down']:
-        player_y += PLAYER_SPEED
-    player_x = max(0, min(player_x, WIDTH - PLAYER_SIZE))
-    player_y = max(0, min(player_y, HEIGHT - PLAYER_SIZE))
-
-    game_state['players'][player_id] = (player_x, player_y)
+    # the clients predict their own square with the same move()
+    game_state['players'][player_id] = move(player_x, player_y, keys_of(input_data), PLAYER_SPEED, WIDTH - PLAYER_SIZE, HEIGHT - PLAYER_SIZE)
+
+def send_game_state():
+    with state_lock:
+        if AREA_OF_INTEREST:
+            nearby = PointGrid(game_state['players'])
+        else:
+            history.record(game_state)
+        for connection in list(players):
+            if connection not in do_not_send:
+                snapshots = history
+                if AREA_OF_INTEREST:    # only the players and coins around this client's player
+                    if connection.view is None:
+                        connection.view = SnapshotHistory(gamewire.encode_snapshot)
+                    box = view_box(*game_state['players'][connection.player], PLAYER_SIZE, VIEW)
+                    connection.view.record(area_of_interest(game_state, nearby.inside(*box), coin_grid.inside(*box)))
+                    snapshots = connection.view
+                data = gamewire.address(snapshots.message(connection.ack), connection.player, connection.applied)
+                peer = connection.peer      # TCP until the UDP session has sent its first INPUTS
+                try:
+                    (peer if peer is not None and peer.confirmed else connection.conn).send(data)
+                except OSError:     # gone, its own thread disconnects it, this one carries on
+                    pass
+
+def handle_input(client: Client, input_data):
+    client.ack = input_data['ack']
+    
+    with state_lock:            # game_state and the grid are shared by every client thread
+        if client not in players:   # timed out or disconnected meanwhile
+            return
+        update_player_position(client.player, input_data)
+        client.applied = input_data['seq']
+        player_x, player_y = game_state['players'][client.player]
+        coins_to_remove = coin_grid.touching(player_x, player_y, PLAYER_SIZE)
+        game_state['player_scores'][client.player] = game_state['player_scores'].get(client.player, 0) + len(coins_to_remove)
+    
+        for i in coins_to_remove:     # replaced in the same slot, the snapshot deltas stay small
+            new_coin_x = random.randint(0, WIDTH - COIN_SIZE)
+            new_coin_y = random.randint(0, HEIGHT - COIN_SIZE)
+            coin_grid.move(i, new_coin_x, new_coin_y)
+    
+    send_game_state()
 
 def handle_client(client: Client):
     addr = client.addr
@@ -146,74 +199,107 @@ def handle_client(client: Client):
             break
         if not data:
             break
-        input_data = pickle.loads(data)
+        try:
+            kind, input_data = gamewire.decode(data)
+        except ValueError as e:     # not a client of this protocol version
+            print(f"> [{addr}] {e}, disconnecting")
+            break
         msg = input_data
-        if type(msg) == str:
+        if kind == gamewire.TEXT:
             if "REGISTER" in msg:
                 _, mac = msg.split("/")
                 if mac in clients:
-                    conn.send(pickle.dumps("MAC already registered"))
+                    conn.send(gamewire.encode_text("MAC already registered"))
                 else:
                     clients[mac] = client
                     client.mac = mac
-                    conn.send(pickle.dumps("OK"))
+                    conn.send(gamewire.encode_text("OK"))
             elif "PAY" in msg:
                 _, mac, amount = msg.split("/")
                 if mac in clients:
                     clients[mac].time += int(amount) * game_price
-                    conn.send(pickle.dumps("OK"))
+                    conn.send(gamewire.encode_text("OK"))
                 else:
-                    conn.send(pickle.dumps("MAC not registered"))
+                    conn.send(gamewire.encode_text("MAC not registered"))
             elif "LOGIN" in msg:
                 _, mac = msg.split("/")
                 if client.time <= 0:
-                    conn.send(pickle.dumps("No Amount Paid!"))
+                    conn.send(gamewire.encode_text("No Amount Paid!"))
                 if mac in logged_in_macs:
-                    conn.send(pickle.dumps("MAC already logged in"))
+                    conn.send(gamewire.encode_text("MAC already logged in"))
                 elif mac in clients:
                     client.mac = mac
                     client.time = clients[mac].time
                     clients[mac] = client
-                    conn.send(pickle.dumps("OK"))
+                    conn.send(gamewire.encode_text("OK"))
                     time.sleep(0.1)
                     add_player(client)
                 else:
-                    conn.send(pickle.dumps("MAC not registered"))
+                    conn.send(gamewire.encode_text("MAC not registered"))
             elif "QUEUE" in msg:
                 if client in queue:
-                    client.conn.send(pickle.dumps("QUEUE"))
+                    client.conn.send(gamewire.encode_text("QUEUE"))
                 if client in players:
-                    game_update = pickle.dumps(game_state)
-                    for connection in players:
-                        connection.conn.send(game_update)
+                    send_game_state()
             elif "QUIT" in msg:
                 disconnect_client(client)
-        else:
-            update_player_position(client.player, input_data)
-            
-            coins_to_remove = []
-            for i, (coin_x, coin_y) in enumerate(game_state['coins']):
-                player_x, player_y = game_state['players'][client.player]
-                if player_x < coin_x + COIN_SIZE and player_x + PLAYER_SIZE > coin_x and player_y < coin_y + COIN_SIZE and player_y + PLAYER_SIZE > coin_y:
-                    coins_to_remove.append(i)
-                    game_state['player_scores'][client.player] = game_state['player_scores'].get(client.player, 0) + 1
-            
-            for i in coins_to_remove:
-                game_state['coins'].pop(i)
-                new_coin_x = random.randint(0, WIDTH - COIN_SIZE)
-                new_coin_y = random.randint(0, HEIGHT - COIN_SIZE)
-                game_state['coins'].append((new_coin_x, new_coin_y))
-            
-            game_update = pickle.dumps(game_state)
-            for connection in players:
-                if connection not in do_not_send:
-                    connection.conn.send(game_update)
+        elif kind == gamewire.INPUT and client in players:
+            handle_input(client, input_data)
     try:
         if not disconnected:
             disconnect_client(client)
     except Exception as e:
         pass
 
+def datagram_loop():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(ADDR)
+    sock.settimeout(1)
+    endpoint = datagram.Shim(sock, **datagram.shim_options(sys.argv))   # --loss/--latency/--jitter on what the server sends
+    sessions = {}                   # addr -> Client, a HELLO carries the MAC logged in over TCP
+    session_ids = itertools.count(1)
+    swept = time.monotonic()
+    print(f"> Taking UDP inputs on {IP}:{PORT}")
+
+    while True:
+        try:
+            data, addr = sock.recvfrom(datagram.MAX_DATAGRAM)
+            kind, session, seq, payload = datagram.unpack(data)
+        except socket.timeout:
+            kind = None
+        except (OSError, ValueError):
+            continue
+
+        if kind == datagram.HELLO:
+            client = clients.get(payload.decode(errors='replace'))
+            if client is not None and client.connected and client.mac in logged_in_macs:
+                if sessions.get(addr) is not client:
+                    client.peer = datagram.Peer(endpoint, addr, next(session_ids) & 0xFFFF or 1)
+                    sessions[addr] = client
+                client.peer.welcome()       # again for a repeated HELLO, the last WELCOME was lost
+        elif kind is not None and addr in sessions and sessions[addr].peer.session == session:
+            client = sessions[addr]
+            if kind == datagram.BYE:
+                client.peer = None      # states go back to TCP
+                del sessions[addr]
+            elif kind == datagram.INPUTS:
+                for message in client.peer.take_inputs(payload):
+                    try:
+                        kind, input_data = gamewire.decode(message)
+                    except ValueError:
+                        continue
+                    if kind == gamewire.INPUT and client in players:
+                        handle_input(client, input_data)
+
+        now = time.monotonic()
+        if now - swept >= 1:        # forget the sessions of clients that left or went quiet
+            swept = now
+            for addr, client in list(sessions.items()):
+                if not client.connected or client.peer is None or client.peer.expired(now):
+                    del sessions[addr]
+                    if client.peer is not None and client.peer.addr == addr:
+                        client.peer = None      # states go back to TCP
+
 def server_loop():
     global active_clients
     print("> Server is starting...")
@@ -227,6 +313,7 @@ def server_loop():
 
     while True:
         conn, addr = server.accept()
+        conn = FramedSocket(conn)   # always framed, two states sent back to back never arrive as one
         addr = f"{addr[0]}:{addr[1]}"
 
         current_client = Client(conn, addr, 0)
@@ -243,10 +330,18 @@ def handle_players():
             add_player(queue.pop(0))
 
 def main():
-    
+    try:
+        gamewire.check_world(WIDTH, HEIGHT, COIN_COUNT)
+    except ValueError as e:
+        sys.exit(f"> {e}")
+
     server_thread = threading.Thread(target=server_loop)
     server_thread.start()
 
+    if UDP:
+        datagram_thread = threading.Thread(target=datagram_loop, daemon=True)
+        datagram_thread.start()
+
     players_thread = threading.Thread(target=handle_players)
     players_thread.start()
 